@@ -19,7 +19,19 @@ class SashimiEvents(AutoName):
 
 
 class LoggedEvent:
-    def __init__(self, logger, name: SashimiEvents, event: Optional[Event] = None):
+    """Event that logs its changes. The processes which have to react to the
+    changes of the event can add their doorbell, which rings when the event is
+    set or cleared. The doorbells are shared by all the references to the event,
+    and have to be added before the processes are started.
+    """
+
+    def __init__(
+        self,
+        logger,
+        name: SashimiEvents,
+        event: Optional[Event] = None,
+        doorbells: Optional[list] = None,
+    ):
         super().__init__()
         if event is None:
             self.event = Event()
@@ -28,18 +40,31 @@ class LoggedEvent:
         self.logger = logger
         self.name = name
         self.was_set = False
+        self.doorbells = [] if doorbells is None else doorbells
+
+    def new_reference(self, logger, doorbell=None):
+        reference = LoggedEvent(logger, self.name, self.event, self.doorbells)
+        if doorbell is not None:
+            reference.add_doorbell(doorbell)
+        return reference
+
+    def add_doorbell(self, doorbell):
+        self.doorbells.append(doorbell)
 
-    def new_reference(self, logger):
-        return LoggedEvent(logger, self.name, self.event)
+    def ring_doorbells(self):
+        for doorbell in self.doorbells:
+            doorbell.ring()
 
     def set(self):
         self.event.set()
+        self.ring_doorbells()
         if not self.was_set:
             self.logger.log_event(self.name, True, True)
         self.was_set = True
 
     def clear(self):
         self.event.clear()
+        self.ring_doorbells()
         if self.was_set:
             self.logger.log_event(self.name, True, False)
         self.was_set = False
@@ -4,10 +4,39 @@ from PyQt5.QtWidgets import (
     QPushButton,
     QFileDialog,
     QCheckBox,
+    QLabel,
+    QProgressBar,
 )
+from PyQt5.QtCore import QThread, pyqtSignal
 from lightparam.gui import ParameterGui
 from sashimi.state import State
-from pathlib import Path
+from sashimi.storage import backend_class_dict
+
+
+class CompressionTuningThread(QThread):
+    """Benchmarks the compression settings outside of the GUI thread, as every
+    setting is tested by writing sample volumes to the disk. The sample volumes
+    are taken from the preview in the GUI thread beforehand, as the viewer
+    reads them.
+    """
+
+    progress = pyqtSignal(int, int)
+    tuned = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, state: State):
+        super().__init__()
+        self.state = state
+        self.volumes = None
+
+    def run(self):
+        try:
+            results = self.state.benchmark_compression(
+                self.volumes, progress_callback=self.progress.emit
+            )
+            self.tuned.emit(results)
+        except Exception as e:
+            self.failed.emit(str(e))
 
 
 class SaveWidget(QWidget):
@@ -19,6 +48,12 @@ class SaveWidget(QWidget):
 
         self.wid_save_options = ParameterGui(state.save_settings)
         self.save_location_button = QPushButton()
+        self.tune_compression_button = QPushButton("Tune compression")
+        self.lbl_compression = QLabel()
+        self.compression_progress = QProgressBar()
+        self.compression_progress.setFormat("Testing setting %v of %m")
+        self.compression_progress.hide()
+        self.tuning_thread = CompressionTuningThread(self.state)
 
         self.manual_duration_chk = QCheckBox("Triggered experiment")
 
@@ -26,12 +61,19 @@ class SaveWidget(QWidget):
 
         self.layout().addWidget(self.wid_save_options)
         self.layout().addWidget(self.save_location_button)
+        self.layout().addWidget(self.tune_compression_button)
+        self.layout().addWidget(self.compression_progress)
+        self.layout().addWidget(self.lbl_compression)
         self.layout().addWidget(self.wid_manual_duration)
         self.layout().addWidget(self.manual_duration_chk)
 
         self.set_locationbutton()
 
         self.save_location_button.clicked.connect(self.set_save_location)
+        self.tune_compression_button.clicked.connect(self.tune_compression)
+        self.tuning_thread.progress.connect(self.update_tuning_progress)
+        self.tuning_thread.tuned.connect(self.set_tuned_compression)
+        self.tuning_thread.failed.connect(self.tuning_failed)
         self.manual_duration_chk.stateChanged.connect(self.update_triggered_option)
         self.state.trigger_settings.sig_param_changed.connect(
             self.state.send_manual_duration
@@ -47,7 +89,12 @@ class SaveWidget(QWidget):
     def set_locationbutton(self):
         pathtext = self.state.save_settings.save_dir
         # check if there is a stack in this location
-        if (Path(pathtext) / "original" / "stack_metadata.json").is_file():
+        backend = backend_class_dict[self.state.save_settings.file_format](pathtext)
+        if self.state.save_settings.resume and backend.journal.is_valid():
+            self.save_location_button.setText("Resume in " + pathtext)
+            self.save_location_button.setStyleSheet("")
+            self.state.save_settings.overwrite_save_folder = 0
+        elif backend.has_dataset():
             self.save_location_button.setText("Overwrite " + pathtext)
             self.save_location_button.setStyleSheet(
                 "background-color:#b5880d; border-color:#fcc203"
@@ -58,6 +105,39 @@ class SaveWidget(QWidget):
             self.save_location_button.setStyleSheet("")
             self.state.save_settings.overwrite_save_folder = 0
 
+    def tune_compression(self):
+        if self.tuning_thread.isRunning():
+            return
+        self.tune_compression_button.setEnabled(False)
+        self.compression_progress.setValue(0)
+        self.compression_progress.show()
+        self.tuning_thread.volumes = self.state.get_sample_volumes()
+        self.tuning_thread.start()
+
+    def update_tuning_progress(self, n_done, n_total):
+        self.compression_progress.setMaximum(n_total)
+        self.compression_progress.setValue(n_done)
+        self.lbl_compression.setText("")
+
+    def tuning_finished(self):
+        self.tune_compression_button.setEnabled(True)
+        self.compression_progress.hide()
+
+    def tuning_failed(self, message):
+        self.tuning_finished()
+        self.lbl_compression.setText(f"Compression could not be tuned: {message}")
+
+    def set_tuned_compression(self, results):
+        self.tuning_finished()
+        best = results[0]
+        self.state.set_compression(best)
+        self.wid_save_options.refresh_widgets()
+        self.lbl_compression.setText(
+            f"{best.codec} level {best.clevel}, {best.shuffle} shuffle, "
+            f"{best.compression_threads} threads: "
+            f"{best.volumes_per_second:.1f} volumes/s, ratio {best.ratio:.2f}"
+        )
+
     def update_triggered_option(self, is_checked):
         if is_checked:
             self.wid_manual_duration.setEnabled(False)
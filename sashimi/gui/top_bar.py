@@ -1,3 +1,4 @@
+from PyQt5.QtCore import QThread, pyqtSignal
 from PyQt5.QtWidgets import (
     QToolBar,
     QHBoxLayout,
@@ -10,6 +11,27 @@ from sashimi.gui.buttons import ToggleIconButton
 from sashimi.state import State, GlobalState
 
 
+class ThroughputCheckThread(QThread):
+    """Measures the saving throughput outside of the GUI thread, as it writes
+    test chunks to the disk. The sample volumes are taken from the preview in
+    the GUI thread beforehand, as the viewer reads them.
+    """
+
+    checked = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, st: State):
+        super().__init__()
+        self.state = st
+        self.volumes = None
+
+    def run(self):
+        try:
+            self.checked.emit(self.state.check_saving_throughput(self.volumes))
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
 class TopWidget(QToolBar):
     def __init__(self, st: State, timer):
         super().__init__()
@@ -28,6 +50,7 @@ class TopWidget(QToolBar):
         self.experiment_progress = QProgressBar()
         self.experiment_progress.setFormat("Volume %v of %m")
         self.lbl_experiment_progress = QLabel()
+        self.lbl_queue_projection = QLabel()
 
         self.overwrite_dialog = QMessageBox()
         self.btn_overwrite_ok = self.overwrite_dialog.addButton(
@@ -36,14 +59,29 @@ class TopWidget(QToolBar):
         self.btn_overwrite_abort = self.overwrite_dialog.addButton(
             self.overwrite_dialog.Abort
         )
+
+        self.throughput_dialog = QMessageBox()
+        self.btn_throughput_ok = self.throughput_dialog.addButton(
+            self.throughput_dialog.Ok
+        )
+        self.btn_throughput_abort = self.throughput_dialog.addButton(
+            self.throughput_dialog.Abort
+        )
+        self.throughput_thread = ThroughputCheckThread(self.state)
+        self.throughput_thread.checked.connect(self.start_after_throughput_check)
+        self.throughput_thread.failed.connect(self.throughput_check_failed)
+
         self.addWidget(self.experiment_toggle_btn)
         self.addWidget(self.experiment_progress)
         self.addWidget(self.lbl_experiment_progress)
+        self.addWidget(self.lbl_queue_projection)
 
         self.timer.timeout.connect(self.refresh_progress_bar)
         self.timer.timeout.connect(self.show_hide_toggle_btn)
-        self.btn_overwrite_ok.clicked.connect(self.state.start_experiment)
+        self.btn_overwrite_ok.clicked.connect(self.check_throughput_and_start)
         self.btn_overwrite_abort.clicked.connect(self.experiment_toggle_btn.flip_icon)
+        self.btn_throughput_ok.clicked.connect(self.state.start_experiment)
+        self.btn_throughput_abort.clicked.connect(self.experiment_toggle_btn.flip_icon)
 
     def refresh_progress_bar(self):
         sstatus = self.state.get_save_status()
@@ -52,7 +90,20 @@ class TopWidget(QToolBar):
             # self.lbl_experiment_progress.show()
             self.experiment_progress.setMaximum(sstatus.n_volumes)
             self.experiment_progress.setValue(sstatus.i_volume)
-            self.lbl_experiment_progress.setText(f"Saved files: {sstatus.i_chunk}")
+            if sstatus.n_writers > 0:
+                self.lbl_experiment_progress.setText(
+                    f"Saved files: {sstatus.i_chunk - sstatus.n_chunks_in_flight} "
+                    f"({sstatus.n_chunks_in_flight} being written, "
+                    f"{sstatus.chunk_write_time:.1f} s per file)"
+                )
+            else:
+                self.lbl_experiment_progress.setText(f"Saved files: {sstatus.i_chunk}")
+            if sstatus.n_chunks_to_transcode > 0:
+                self.lbl_experiment_progress.setText(
+                    self.lbl_experiment_progress.text()
+                    + f" | Compressing files: {sstatus.n_chunks_transcoded}"
+                    f" of {sstatus.n_chunks_to_transcode}"
+                )
 
     # TODO: Rethink logic here to ensure button and state are coordinated
     def change_experiment_state(self):
@@ -60,10 +111,51 @@ class TopWidget(QToolBar):
             # Here what happens if experiment is aborted
             self.state.end_experiment()
         else:
-            if self.state.save_settings.overwrite_save_folder == 1:
+            # checked again now, as the folder or resuming could have changed:
+            if self.state.overwrites_dataset():
                 self.overwrite_alert_popup()
             else:
-                self.state.start_experiment()
+                self.check_throughput_and_start()
+
+    def check_throughput_and_start(self):
+        if not self.state.save_settings.check_throughput:
+            self.state.start_experiment()
+            return
+        if self.throughput_thread.isRunning():
+            return
+        self.lbl_queue_projection.setText("Measuring saving rate...")
+        self.throughput_thread.volumes = self.state.get_sample_volumes()
+        self.throughput_thread.start()
+
+    def start_after_throughput_check(self, check):
+        self.lbl_queue_projection.setText(
+            f"Projected queue peak: {check.peak_queue_MB:.0f} MB "
+            f"({100 * check.peak_queue_occupancy:.0f}%)"
+        )
+        if check.overflows:
+            self.throughput_alert_popup(check)
+        else:
+            self.state.start_experiment()
+
+    def throughput_check_failed(self, message):
+        self.lbl_queue_projection.setText("")
+        self.experiment_toggle_btn.flip_icon(False)
+        QMessageBox.warning(
+            self, "Saving test failed", f"Sample volumes could not be saved: {message}"
+        )
+
+    def throughput_alert_popup(self, check):
+        self.throughput_dialog.setIcon(QMessageBox.Warning)
+        self.throughput_dialog.setWindowTitle("Saving too slow!")
+        self.throughput_dialog.setText(
+            f"Volumes can be saved at {check.saving_rate:.1f} per second, "
+            f"but are acquired at {check.volume_rate:.1f} per second. \n"
+            f"The saving queue will be full after {check.seconds_to_overflow:.0f} s, "
+            f"and the following volumes will be lost. \n\n"
+            "Press ok to start the experiment anyway or abort to change the saving "
+            "settings (e.g. faster compression, more writers, or spilling)."
+        )
+        self.throughput_dialog.show()
 
     def overwrite_alert_popup(self):
         self.overwrite_dialog.setIcon(QMessageBox.Warning)
@@ -1,6 +1,5 @@
 import pyqtgraph as pg
 from PyQt5.QtWidgets import QWidget, QVBoxLayout
-import numpy as np
 
 color_plane = (166, 196, 240, 100)
 color_current_plane = (100, 100, 240, 100)
@@ -67,12 +66,10 @@ class WaveformWidget(QWidget):
 
     def update(self):
         """Update the data of the piezo line and the position of the current plane displayed in the viewer."""
+        # times and values of the decimated waveform:
         current_waveform = self.state.get_waveform()
         if current_waveform is not None:
-            self.plot_curve.setData(
-                np.arange(len(current_waveform)) / self.sample_rate,
-                current_waveform,
-            )
+            self.plot_curve.setData(current_waveform[0], current_waveform[1])
 
         if len(self.pulse_times) > 0:
             current_pulse = self.pulse_times[self.state.current_plane]
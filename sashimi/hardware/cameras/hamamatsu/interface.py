@@ -8,6 +8,7 @@ from sashimi.hardware.cameras.interface import (
     TriggerMode,
     CameraException,
     CameraWarning,
+    SdkCallCounter,
 )
 from sashimi.hardware.cameras.hamamatsu.sdk import (
     DCAMAPI_INIT,
@@ -46,7 +47,7 @@ class HamamatsuCamera(AbstractCamera):
         super().__init__(camera_id, max_sensor_resolution)
 
         # This need to be specified at the beginning, not to change with the ROI that we set.
-        self.dcam = ctypes.windll.dcamapi
+        self.dcam = SdkCallCounter(ctypes.windll.dcamapi)
         paraminit = DCAMAPI_INIT(0, 0, 0, 0, None, None)
         paraminit.size = ctypes.sizeof(paraminit)
         self.error_code = self.dcam.dcamapi_init(ctypes.byref(paraminit))
@@ -68,6 +69,8 @@ class HamamatsuCamera(AbstractCamera):
         self.wait_handle = ctypes.c_void_p(paramwait.hwait)
 
         self.properties = self.get_camera_properties()
+        # the type of a property does not change, unlike its range:
+        self.property_types = dict()
         self.exposure_time = conf["camera"]["default_exposure"]
 
         self._roi = (0, 0) + self.max_sensor_resolution
@@ -86,10 +89,11 @@ class HamamatsuCamera(AbstractCamera):
 
     @property
     def binning(self):
-        return self.get_property_value("binning")
+        return self.cached("binning", lambda: self.get_property_value("binning"))
 
     @binning.setter
     def binning(self, n_bin):
+        self.invalidate_cache()
         self.set_property_value("binning", f"{n_bin}x{n_bin}")
 
     @property
@@ -98,6 +102,7 @@ class HamamatsuCamera(AbstractCamera):
 
     @exposure_time.setter
     def exposure_time(self, exp_val):
+        self.invalidate_cache()
         self.set_property_value("exposure_time", 0.001 * exp_val)
 
     @property
@@ -113,6 +118,7 @@ class HamamatsuCamera(AbstractCamera):
         """The ROI is set in "maximum resolution of the sensor units". Therefore, it should not change
         with the binning.
         """
+        self.invalidate_cache()
         self._roi = [(i * self.binning // 4) * 4 for i in exp_val]
         self.set_property_value("subarray_vpos", self._roi[0])
         self.set_property_value("subarray_hpos", self._roi[1])
@@ -134,11 +140,16 @@ class HamamatsuCamera(AbstractCamera):
 
     @property
     def frame_shape(self):
-        # TODO these get_property value can get cleaned up in another property
-        return tuple(
-            self.get_property_value(v) for v in ["image_height", "image_width"]
+        return self.cached(
+            "frame_shape",
+            lambda: tuple(
+                self.get_property_value(v) for v in ["image_height", "image_width"]
+            ),
         )
 
+    def sdk_call_rates(self):
+        return self.dcam.rates()
+
     def get_frames(self):
         frames = []
 
@@ -185,6 +196,17 @@ class HamamatsuCamera(AbstractCamera):
                 "Camera buffer overrun detected. Some frames might have been lost",
                 CameraWarning,
             )
+        elif (
+            self.frame_ring is not None
+            and backlog + self.frame_ring.in_place_in_flight()
+            > self.number_image_buffers
+        ):
+            warn(
+                "Camera buffer overrun detected. Some frames might be overwritten before being read",
+                CameraWarning,
+            )
+        if self.frame_ring is not None:
+            self.frame_ring.written(cur_frame_number)
         if backlog > self.max_backlog:
             self.max_backlog = backlog
         self.last_frame_number = cur_frame_number
@@ -201,9 +223,17 @@ class HamamatsuCamera(AbstractCamera):
                 new_frames.append(i + 1)
         self.buffer_index = cur_buffer_index
 
+        # the hardware timestamps would need an SDK call for every frame:
+        self.frame_stamps = [
+            (cur_frame_number - len(new_frames) + i, -1) for i in range(len(new_frames))
+        ]
+        frame_shape = self.frame_shape
         for i_frame in new_frames:
-            frame_data = self.hcam_data[i_frame].get_data()
-            frames.append(np.reshape(frame_data, self.frame_shape).copy())
+            frame_data = np.reshape(self.hcam_data[i_frame].get_data(), frame_shape)
+            # buffers in the frame ring are read in place by the dispatcher:
+            if self.frame_ring is None:
+                frame_data = frame_data.copy()
+            frames.append(frame_data)
 
         return frames
 
@@ -224,10 +254,14 @@ class HamamatsuCamera(AbstractCamera):
             "dcamprop_getvalue",
         )
 
-        prop_attr = self.get_property_attribute(property_name)
+        if property_name not in self.property_types:
+            prop_attr = self.get_property_attribute(property_name)
+            self.property_types[property_name] = (
+                prop_attr.attribute & DCAMPROP_TYPE_MASK
+            )
 
         # Convert type based on attribute type.
-        temp = prop_attr.attribute & DCAMPROP_TYPE_MASK
+        temp = self.property_types[property_name]
         if temp == DCAMPROP_TYPE_MODE:
             prop_value = int(c_value.value)
         elif temp == DCAMPROP_TYPE_LONG:
@@ -304,22 +338,33 @@ class HamamatsuCamera(AbstractCamera):
         else:
             self.set_property_value("subarray_mode", "ON")
 
-        # Get size of frame
+        # Get size of frame, and fill the cache of the properties read while acquiring
         self._frame_bytes = self.get_property_value("image_framebytes")
-
-        if self.old_frame_bytes != self._frame_bytes:
+        self.invalidate_cache()
+        self.binning
+        self.frame_shape
+
+        if self.frame_ring is not None:
+            # The buffers are laid out again in the ring at every acquisition, as the
+            # frame count restarts, and the frames of the previous one are dropped
+            self.attach_buffers(
+                [
+                    SpeedyArrayBuffer(self._frame_bytes, array=array)
+                    for array in self.frame_ring.allocate(self._frame_bytes)
+                ]
+            )
+        elif self.old_frame_bytes != self._frame_bytes:
             # The larger of either 2000 frames or some weird calculation for number of buffers for 2 seconds of data
-            self.number_image_buffers = min(
+            number_image_buffers = min(
                 int((2.0 * 1024 * 1024 * 1024) / self._frame_bytes), 2000
             )
             # Allocate new image buffers.
-            ptr_array = ctypes.c_void_p * self.number_image_buffers
-            self.hcam_ptr = ptr_array()
-            self.hcam_data = []
-            for i in range(self.number_image_buffers):
-                hc_data = SpeedyArrayBuffer(self._frame_bytes)
-                self.hcam_ptr[i] = hc_data.get_data_pr()
-                self.hcam_data.append(hc_data)
+            self.attach_buffers(
+                [
+                    SpeedyArrayBuffer(self._frame_bytes)
+                    for i in range(number_image_buffers)
+                ]
+            )
 
             self.old_frame_bytes = self._frame_bytes
 
@@ -344,6 +389,17 @@ class HamamatsuCamera(AbstractCamera):
             "dcamcap_start",
         )
 
+    def attach_buffers(self, buffers):
+        """Set the buffers the frames are acquired in, attached to the camera
+        at the start of the acquisition.
+        """
+        self.number_image_buffers = len(buffers)
+        ptr_array = ctypes.c_void_p * self.number_image_buffers
+        self.hcam_ptr = ptr_array()
+        self.hcam_data = buffers
+        for i, hc_data in enumerate(buffers):
+            self.hcam_ptr[i] = hc_data.get_data_pr()
+
     def stop_acquisition(self):
         self.check_status(self.dcam.dcamcap_stop(self.camera_handle), "dcamcap_stop")
 
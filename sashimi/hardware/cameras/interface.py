@@ -1,5 +1,7 @@
 from enum import Enum
 from abc import ABC, abstractmethod
+from collections import Counter
+import time
 
 
 class CameraException(Exception):
@@ -15,16 +17,85 @@ class TriggerMode(Enum):
     EXTERNAL_TRIGGER = 2
 
 
+class SdkCallCounter:
+    """Wraps the library of a camera SDK, counting the calls to each of its
+    functions, to check how many of them are made while acquiring.
+    """
+
+    def __init__(self, library):
+        self.library = library
+        self.counts = Counter()
+        self.last_counts = Counter()
+        self.last_time = time.perf_counter()
+
+    def __getattr__(self, name):
+        function = getattr(self.library, name)
+        counts = self.counts
+
+        def counted(*args):
+            counts[name] += 1
+            return function(*args)
+
+        # the wrapper is created once, later calls do not go through __getattr__:
+        setattr(self, name, counted)
+        return counted
+
+    def rates(self):
+        """Returns the calls per second to each function since the previous
+        call to rates.
+        """
+        current_time = time.perf_counter()
+        elapsed = max(current_time - self.last_time, 1e-9)
+        rates = {
+            name: (count - self.last_counts[name]) / elapsed
+            for name, count in self.counts.items()
+            if count > self.last_counts[name]
+        }
+        self.last_counts = Counter(self.counts)
+        self.last_time = current_time
+        return rates
+
+
 class AbstractCamera(ABC):
     def __init__(self, camera_id, max_sensor_resolution=None):
         self.camera_id = camera_id
         self.max_sensor_resolution = max_sensor_resolution
+        # values read from the camera which do not change while acquiring,
+        # filled at start_acquisition and emptied when the settings change:
+        self.property_cache = dict()
+        # shared ring the frames are handed to the other processes through,
+        # cameras which can acquire in it give frames which are views of it:
+        self.frame_ring = None
+        # (frame number, hardware timestamp in ns or -1 if the camera has none)
+        # of each of the frames returned by the last call to get_frames:
+        self.frame_stamps = []
+
+    def cached(self, name, read):
+        """Returns the cached value of a property, calling read to get it
+        from the camera if it is not in the cache.
+        """
+        try:
+            return self.property_cache[name]
+        except KeyError:
+            value = read()
+            self.property_cache[name] = value
+            return value
+
+    def invalidate_cache(self):
+        self.property_cache.clear()
+
+    def sdk_call_rates(self):
+        """Calls per second to the functions of the camera SDK since the
+        previous call, for the cameras which count them.
+        """
+        return dict()
 
     @abstractmethod
     def get_frames(self):
         """
         Returns a list of arrays, each of which corresponds to an available frame. If no frames where found returns an
-        empty list.
+        empty list. Frames acquired in the buffers of the frame ring are not copied, and are valid until the camera
+        writes over them.
         """
         pass
 
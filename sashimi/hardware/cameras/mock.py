@@ -21,6 +21,7 @@ class MockCamera(AbstractCamera):
         self.previous_frame_time = None
         self.current_time = time.time_ns()
         self.elapsed = 0
+        self.frame_number = 0
 
     @property
     def exposure_time(self):
@@ -74,12 +75,15 @@ class MockCamera(AbstractCamera):
         super().get_frames()
         self.current_time = time.time_ns()
         frames = []
+        self.frame_stamps = []
         if self.previous_frame_time is not None:
             time.sleep(0.0001)
             self.elapsed = (self.current_time - self.previous_frame_time) * 1e-9
             if self.elapsed >= self._exposure_time * 1e-3:
                 multiplier = np.random.randint(1, 5, 1)
                 frames.append(np.uint16(self.current_mock_image * multiplier))
+                self.frame_stamps.append((self.frame_number, self.current_time))
+                self.frame_number += 1
                 self.previous_frame_time = self.current_time
         else:
             self.previous_frame_time = self.current_time
@@ -89,7 +93,7 @@ class MockCamera(AbstractCamera):
         """
         Allocate as many frames as will fit in 2GB of memory and start data acquisition.
         """
-        pass
+        self.frame_number = 0
 
     def stop_acquisition(self):
         """
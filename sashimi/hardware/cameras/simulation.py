@@ -0,0 +1,271 @@
+from multiprocessing import Array, Value
+from warnings import warn
+import time
+
+import numpy as np
+from scipy.ndimage.filters import gaussian_filter
+from skimage.measure import block_reduce
+
+from sashimi.hardware.cameras.interface import (
+    AbstractCamera,
+    CameraWarning,
+    TriggerMode,
+)
+
+
+class TriggerLine:
+    """Camera trigger pulses of the mock scanning board, in shared memory, for
+    the simulated camera to follow. As a real board, the mock board writes its
+    waveforms ahead of time: it adds the times at which the pulses of every
+    buffer it writes will be played, and the camera takes the ones which are
+    due. Pulses not taken before the line wraps around are lost, as frames
+    missed by a camera which does not keep up.
+
+    Parameters
+    ----------
+    capacity : int
+        Number of pulses kept in the line.
+
+    """
+
+    def __init__(self, capacity=65536):
+        self.times = Array("d", capacity, lock=False)
+        self.n_pulses = Value("Q", 0, lock=False)
+        # pulses taken by the camera, in its own process:
+        self.n_read = 0
+
+    @property
+    def capacity(self):
+        return len(self.times)
+
+    def add(self, times):
+        """Add the times (in s, from time.time) of new pulses, in order."""
+        n_pulses = self.n_pulses.value
+        line = np.frombuffer(self.times)
+        for i, pulse_time in enumerate(times):
+            line[(n_pulses + i) % self.capacity] = pulse_time
+        # the count is updated last, once the times can be read:
+        self.n_pulses.value = n_pulses + len(times)
+
+    def skip(self):
+        """Ignore all the pulses added so far."""
+        self.n_read = self.n_pulses.value
+
+    def pending(self):
+        """Returns the times of the pulses not taken yet, and the number of
+        pulses lost since the last call.
+        """
+        n_pulses = self.n_pulses.value
+        n_lost = max(n_pulses - self.capacity - self.n_read, 0)
+        self.n_read += n_lost
+        times = np.frombuffer(self.times)[
+            np.arange(self.n_read, n_pulses) % self.capacity
+        ]
+        return times, n_lost
+
+    def take(self, until):
+        """Returns the times of the pulses played until the given time, and
+        the number of pulses lost since the last call.
+        """
+        times, n_lost = self.pending()
+        n_due = np.searchsorted(times, until, side="right")
+        self.n_read += n_due
+        return times[:n_due], n_lost
+
+    def next_pulse(self):
+        """Time of the next pulse not taken yet, or None if there is none."""
+        times, _ = self.pending()
+        return times[0] if len(times) > 0 else None
+
+
+class SimulatedCamera(AbstractCamera):
+    """Camera producing frames at the rate and resolution of a real one, to test
+    the whole acquisition pipeline without hardware. In free running mode the
+    frames come at the rate given by the exposure time, and with an external
+    trigger at the pulses of the mock scanning board, read from a TriggerLine.
+
+    The frames are taken in turn from a pool computed when the acquisition
+    starts, and as the Hamamatsu camera they are acquired in the buffers of
+    the frame ring if there is one, so that getting frames allocates no memory.
+    Frames not taken before the buffers wrap around are lost.
+
+    Parameters
+    ----------
+    camera_id
+    max_sensor_resolution : tuple
+        Resolution of the simulated sensor.
+    trigger_line : TriggerLine, optional
+        Pulses followed with an external trigger.
+    n_pool_frames : int
+        Number of different frames in the pool.
+    n_buffers : int
+        Number of frames the camera can hold, if there is no frame ring.
+
+    """
+
+    def __init__(
+        self,
+        camera_id=None,
+        max_sensor_resolution=(2048, 2048),
+        trigger_line=None,
+        n_pool_frames=8,
+        n_buffers=2000,
+    ):
+        super().__init__(camera_id, tuple(max_sensor_resolution))
+        self.trigger_line = trigger_line
+        self.n_pool_frames = n_pool_frames
+        self.n_buffers = n_buffers
+        self._exposure_time = 60
+        self._binning = 1
+        self._roi = (0, 0, *self.max_sensor_resolution)
+        self._trigger_mode = TriggerMode.FREE
+        self.full_image = gaussian_filter(
+            np.random.randint(0, 30000, size=self.max_sensor_resolution).astype(
+                np.float32
+            ),
+            5,
+        )
+        self.pool = None
+        self.buffers = None
+        self.frame_number = 0
+        self.next_frame_time = None
+
+    @property
+    def exposure_time(self):
+        return self._exposure_time
+
+    @exposure_time.setter
+    def exposure_time(self, exp_val):
+        self._exposure_time = exp_val
+
+    @property
+    def frame_rate(self):
+        return 1 / (self._exposure_time * 1e-3)
+
+    @property
+    def binning(self):
+        return self._binning
+
+    @binning.setter
+    def binning(self, exp_val):
+        self._binning = exp_val
+
+    @property
+    def roi(self):
+        """roi attributes as a tuple: (x_min, y_min, x_size, y_size)"""
+        return self._roi
+
+    @roi.setter
+    def roi(self, exp_val: tuple):
+        self._roi = tuple(int(v) for v in exp_val)
+
+    @property
+    def trigger_mode(self):
+        return self._trigger_mode
+
+    @trigger_mode.setter
+    def trigger_mode(self, exp_val):
+        # the camera process has its own enumeration of the same modes:
+        self._trigger_mode = TriggerMode(exp_val.value)
+
+    def prepare_pool(self):
+        """Compute the frames for the current binning and ROI, each with a
+        different brightness and noise.
+        """
+        image = block_reduce(
+            self.full_image, (self._binning, self._binning), func=np.mean
+        )
+        image = image[
+            self._roi[0] : (self._roi[0] + self._roi[2]),
+            self._roi[1] : (self._roi[1] + self._roi[3]),
+        ]
+        rng = np.random.default_rng()
+        self.pool = np.empty((self.n_pool_frames, *image.shape), np.uint16)
+        for frame in self.pool:
+            frame[:] = np.clip(
+                rng.poisson(image * rng.uniform(0.5, 2)), 0, np.iinfo(np.uint16).max
+            )
+
+    def start_acquisition(self):
+        self.prepare_pool()
+        frame_shape = self.pool.shape[1:]
+        if self.frame_ring is not None:
+            frame_size = int(np.prod(frame_shape))
+            self.buffers = [
+                buffer[:frame_size].reshape(frame_shape)
+                for buffer in self.frame_ring.allocate(2 * frame_size)
+            ]
+        else:
+            self.buffers = None
+        self.frame_number = 0
+        self.next_frame_time = time.time()
+        if self.trigger_line is not None:
+            self.trigger_line.skip()
+
+    def stop_acquisition(self):
+        self.next_frame_time = None
+
+    def due_frame_times(self):
+        """Returns the times of the frames acquired since the last call, and the
+        number of frames the camera missed, waiting for the next frame for at
+        most 100 ms if there are none.
+        """
+        if self.next_frame_time is None:
+            return [], 0
+        if self._trigger_mode == TriggerMode.EXTERNAL_TRIGGER:
+            if self.trigger_line is None:
+                time.sleep(0.1)
+                return [], 0
+            next_pulse = self.trigger_line.next_pulse()
+            wait = 0.1 if next_pulse is None else next_pulse - time.time()
+            if wait > 0:
+                time.sleep(min(wait, 0.1))
+            return self.trigger_line.take(time.time())
+
+        wait = self.next_frame_time - time.time()
+        if wait > 0:
+            time.sleep(min(wait, 0.1))
+        elapsed = time.time() - self.next_frame_time
+        n_due = int(np.floor(elapsed * self.frame_rate)) + 1
+        if n_due <= 0:
+            return [], 0
+        times = self.next_frame_time + np.arange(n_due) / self.frame_rate
+        self.next_frame_time = times[-1] + 1 / self.frame_rate
+        return times, 0
+
+    def get_frames(self):
+        times, n_missed = self.due_frame_times()
+        self.frame_number += n_missed
+        n_buffers = self.n_buffers if self.buffers is None else len(self.buffers)
+        backlog = len(times)
+        if backlog > n_buffers:
+            warn(
+                "Camera buffer overrun detected. Some frames might have been lost",
+                CameraWarning,
+            )
+            # the first frames have been overwritten by the last ones:
+            self.frame_number += backlog - n_buffers
+            times = times[backlog - n_buffers :]
+        elif (
+            self.frame_ring is not None
+            and backlog + self.frame_ring.in_place_in_flight() > n_buffers
+        ):
+            warn(
+                "Camera buffer overrun detected. Some frames might be overwritten before being read",
+                CameraWarning,
+            )
+
+        frames = []
+        self.frame_stamps = []
+        for frame_time in times:
+            frame = self.pool[self.frame_number % self.n_pool_frames]
+            if self.buffers is not None:
+                buffer = self.buffers[self.frame_number % n_buffers]
+                np.copyto(buffer, frame)
+                frame = buffer
+            frames.append(frame)
+            self.frame_stamps.append((self.frame_number, int(frame_time * 1e9)))
+            self.frame_number += 1
+        if self.frame_ring is not None:
+            self.frame_ring.written(self.frame_number)
+        return frames
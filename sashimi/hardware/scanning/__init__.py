@@ -6,6 +6,10 @@ class ScanningError(Exception):
     pass
 
 
+class ScanningWarning(Warning):
+    pass
+
+
 class AbstractScanInterface(ABC):
     def __init__(self, sample_rate, n_samples, conf, *args, **kwargs):
         self.sample_rate = sample_rate
@@ -1,23 +1,56 @@
 from sashimi.hardware.scanning.__init__ import AbstractScanInterface
 from contextlib import contextmanager
 import numpy as np
+import time
 from time import sleep
 
 
 class MockBoard(AbstractScanInterface):
-    def __init__(self, sample_rate, n_samples, conf):
+    """Board which does not output anything. If it is given a TriggerLine,
+    the camera pulses of every written buffer are added to it, at the times
+    they would be played, for the simulated camera to follow.
+    """
+
+    def __init__(self, sample_rate, n_samples, conf, trigger_line=None):
         super().__init__(sample_rate, n_samples, conf)
         self.piezo_array = np.zeros(n_samples)
+        self.trigger_line = trigger_line
+        self.camera_trigger_array = np.zeros(n_samples)
+        # the trigger level at the end of the last buffer, to find the rising
+        # edges at the start of the next one:
+        self.trigger_was_high = False
+        self.playback_time = None
 
     def start(self):
-        pass
+        self.playback_time = time.time()
 
     def read(self):
         sleep(0.05)
 
     def write(self):
+        if self.trigger_line is not None:
+            if self.playback_time is None or self.playback_time < time.time():
+                # the buffer is played as soon as it is written:
+                self.playback_time = time.time()
+            self.add_camera_pulses(self.playback_time)
+            self.playback_time += self.n_samples / self.sample_rate
         sleep(0.05)
 
+    def camera_pulses(self):
+        """Returns the samples of the buffer at which the camera trigger rises."""
+        high = self.camera_trigger_array > 1
+        rising = np.flatnonzero(high[1:] & ~high[:-1]) + 1
+        if high[0] and not self.trigger_was_high:
+            rising = np.concatenate([[0], rising])
+        self.trigger_was_high = bool(high[-1])
+        return rising
+
+    def add_camera_pulses(self, start_time):
+        """Add the rising edges of the camera trigger of the buffer to the
+        trigger line, for the buffer played from start_time on.
+        """
+        self.trigger_line.add(start_time + self.camera_pulses() / self.sample_rate)
+
     @property
     def z_piezo(self):
         len_sampling = len(self.piezo_array)
@@ -45,11 +78,11 @@ class MockBoard(AbstractScanInterface):
 
     @property
     def camera_trigger(self):
-        return None
+        return self.camera_trigger_array
 
     @camera_trigger.setter
     def camera_trigger(self, waveform):
-        pass
+        self.camera_trigger_array[:] = waveform
 
     @property
     def xy_frontal(self):
@@ -69,8 +102,8 @@ class MockBoard(AbstractScanInterface):
 
 
 @contextmanager
-def open_mockboard(sample_rate, n_samples, conf) -> MockBoard:
+def open_mockboard(sample_rate, n_samples, conf, trigger_line=None) -> MockBoard:
     try:
-        yield MockBoard(sample_rate, n_samples, conf)
+        yield MockBoard(sample_rate, n_samples, conf, trigger_line)
     finally:
         pass
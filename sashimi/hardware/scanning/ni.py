@@ -11,7 +11,9 @@ import numpy as np
 
 
 @contextmanager
-def open_niboard(sample_rate, n_samples, conf):
+def open_niboard(sample_rate, n_samples, conf, trigger_line=None):
+    # the camera is triggered by the board itself, the trigger line of the
+    # simulated camera is not used
     with Task() as read_task, Task() as write_task_z, Task() as write_task_xy:
         try:
             yield NIBoards(
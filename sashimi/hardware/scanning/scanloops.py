@@ -1,19 +1,22 @@
 from copy import deepcopy
 from dataclasses import dataclass, asdict
 from enum import Enum
-from multiprocessing.queues import Queue
 from typing import Tuple, Union
+from warnings import warn
+import time
 from arrayqueues.shared_arrays import ArrayQueue
 
 import numpy as np
 
-from scopecuisine.rolling_buffer import FillingRollingBuffer, RollingBuffer
+from sashimi.rolling_buffer import FillingRollingBuffer, RollingBuffer
 
 from sashimi.config import read_config
 from sashimi.processes.logging import ConcurrenceLogger
-from sashimi.utilities import lcm, get_last_parameters
+from sashimi.processes.mailbox import ParameterMailbox
+from sashimi.processes.scan_timing import ScanTiming
+from sashimi.utilities import decimate_envelope, lcm
 from sashimi.waveforms import TriangleWaveform, SawtoothWaveform, set_impulses
-from sashimi.hardware.scanning.__init__ import AbstractScanInterface
+from sashimi.hardware.scanning import AbstractScanInterface, ScanningWarning
 
 conf = read_config()
 
@@ -94,21 +97,32 @@ class ScanLoop:
     The class does not implement a Process by itself; instead, the suitable child of this class (depending on
     the scanning mode) is "mounted" by the ScannerProcess process, and the ScanLoop.loop method is executed.
 
+    The duration of every phase of the loop and the slack before every write are counted in the
+    ScanTiming, and low_slack is called when the slack is below its threshold.
+
     """
 
+    timing_log_interval = 10.0
+    # longer periods, given by frequencies with a large common multiple, are
+    # computed block by block instead of being kept in the waveform table:
+    max_table_samples = 1000000
+
     def __init__(
         self,
         board: AbstractScanInterface,
         stop_event,
         restart_event,
         initial_parameters: ScanParameters,
-        parameter_queue: Queue,
+        parameter_mailbox: ParameterMailbox,
         n_samples,
         sample_rate,
         waveform_queue: ArrayQueue,
         wait_signal,
         logger: ConcurrenceLogger,
         trigger_exp_from_scanner,
+        timing: ScanTiming = None,
+        waveform_points=2000,
+        waveform_rate=25.0,
     ):
         self.sample_rate = sample_rate
         self.n_samples = n_samples
@@ -119,8 +133,13 @@ class ScanLoop:
         self.restart_event = restart_event
         self.logger = logger
 
-        self.parameter_queue = parameter_queue
+        self.parameter_mailbox = parameter_mailbox
+        # the recorded waveform is sent for display at most waveform_rate
+        # times per second, decimated to waveform_points points:
         self.waveform_queue = waveform_queue
+        self.waveform_points = waveform_points
+        self.waveform_interval = 1 / waveform_rate
+        self.last_waveform_sent = 0.0
 
         self.parameters = initial_parameters
         self.old_parameters = initial_parameters
@@ -136,11 +155,24 @@ class ScanLoop:
         self.lateral_waveform = TriangleWaveform(**asdict(self.parameters.xy.lateral))
         self.frontal_waveform = TriangleWaveform(**asdict(self.parameters.xy.lateral))
 
-        self.time = np.arange(self.n_samples) / self.sample_rate
-        self.shifted_time = self.time.copy()
+        # the waveforms of a full period, computed once for every set of
+        # parameters, from which the blocks are copied:
+        self.waveform_table = None
+        self.table_parameters = None
+        self.block_indices = np.arange(self.n_samples)
+        self.table_block = None
 
         self.wait_signal = wait_signal
 
+        self.timing = (
+            ScanTiming(self.n_samples / self.sample_rate) if timing is None else timing
+        )
+        # the board plays the samples written from the start time on:
+        self.start_time = None
+        self.n_samples_written = 0
+        self.slack_was_low = False
+        self.last_timing_log = time.perf_counter()
+
     def initialize(self):
         self.n_acquired = 0
         self.first_update = True
@@ -154,7 +186,7 @@ class ScanLoop:
 
     def update_settings(self):
         """Update parameters and return True only if got new parameters."""
-        new_params = get_last_parameters(self.parameter_queue)
+        new_params = self.parameter_mailbox.get()
         if new_params is None:
             return False
 
@@ -178,15 +210,102 @@ class ScanLoop:
     def check_start(self):
         if not self.started:
             self.board.start()
+            self.start_time = time.perf_counter()
             self.started = True
 
+    def slack(self):
+        """Time until the board has played all the samples written, or None
+        if it has not started.
+        """
+        if self.start_time is None:
+            return None
+        return (
+            self.n_samples_written / self.sample_rate
+            - time.perf_counter()
+            + self.start_time
+        )
+
+    def check_slack(self):
+        slack = self.slack()
+        if slack is None:
+            return
+        if self.timing.add_slack(slack):
+            self.logger.log_message(f"low slack {slack * 1000:.2f} ms")
+            if not self.slack_was_low:
+                self.low_slack(slack)
+            self.slack_was_low = True
+        else:
+            self.slack_was_low = False
+
+    def low_slack(self, slack):
+        """Called when the slack before a write drops below the threshold."""
+        warn(
+            f"Scanning loop slack dropped to {slack * 1000:.2f} ms, "
+            f"the output may underrun",
+            ScanningWarning,
+        )
+
+    def log_timing(self):
+        summary = self.timing.summary()
+        self.logger.log_message(
+            "timing (mean/max ms): "
+            + ", ".join(
+                f"{phase} {summary['mean_durations'][phase] * 1000:.2f}"
+                f"/{summary['max_durations'][phase] * 1000:.2f}"
+                for phase in self.timing.phases
+            )
+            + f", min slack {summary['min_slack'] * 1000:.2f} ms"
+        )
+        self.last_timing_log = time.perf_counter()
+
+    def table_waveforms(self):
+        """Returns the board channels whose waveforms depend only on the
+        parameters, with their waveforms.
+        """
+        return dict(xy_lateral=self.lateral_waveform, xy_frontal=self.frontal_waveform)
+
+    def build_waveform_table(self):
+        """Compute the table of the waveforms over a full period, with a row
+        for every channel, unless the period is longer than max_table_samples.
+        """
+        waveforms = self.table_waveforms()
+        n_samples_period = self.n_samples_period()
+        self.table_block = np.empty((len(waveforms), self.n_samples))
+        self.table_parameters = self.parameters
+        if n_samples_period > self.max_table_samples:
+            self.waveform_table = None
+            self.logger.log_message(
+                f"period of {n_samples_period} samples, "
+                f"waveforms computed for every block"
+            )
+            return
+        time = np.arange(n_samples_period) / self.sample_rate
+        self.waveform_table = np.empty((len(waveforms), len(time)))
+        for row, waveform in zip(self.waveform_table, waveforms.values()):
+            row[:] = waveform.values(time)
+
     def fill_arrays(self):
-        self.shifted_time[:] = self.time + self.i_sample / self.sample_rate
-        self.board.xy_lateral = self.lateral_waveform.values(self.shifted_time)
-        self.board.xy_frontal = self.frontal_waveform.values(self.shifted_time)
+        # the parameters are replaced when new ones are received:
+        if self.table_parameters is not self.parameters:
+            self.build_waveform_table()
+        if self.waveform_table is not None:
+            np.take(
+                self.waveform_table,
+                self.block_indices + self.i_sample,
+                axis=1,
+                out=self.table_block,
+                mode="wrap",
+            )
+        else:
+            time = (self.block_indices + self.i_sample) / self.sample_rate
+            for row, waveform in zip(self.table_block, self.table_waveforms().values()):
+                row[:] = waveform.values(time)
+        for channel, values in zip(self.table_waveforms(), self.table_block):
+            setattr(self.board, channel, values)
 
     def write(self):
         self.board.write()
+        self.n_samples_written += self.board.n_samples
         self.logger.log_message("write")
 
     def read(self):
@@ -200,16 +319,33 @@ class ScanLoop:
         returns to the execution of the run of ScannerProcess.
         """
         while True:
+            start = time.perf_counter()
             self.update_settings()
+            updated = time.perf_counter()
             self.old_parameters = deepcopy(self.parameters)
             if not self.loop_condition():
                 break
             self.fill_arrays()
+            filled = time.perf_counter()
+            self.check_slack()
             self.write()
+            written = time.perf_counter()
             self.check_start()
             self.read()
+            read = time.perf_counter()
             self.i_sample = (self.i_sample + self.n_samples) % self.n_samples_period()
             self.n_acquired += 1
+            self.timing.add_durations(
+                [
+                    updated - start,
+                    filled - updated,
+                    written - filled,
+                    read - written,
+                    read - start,
+                ]
+            )
+            if read - self.last_timing_log > self.timing_log_interval:
+                self.log_timing()
             if first_run:
                 break
 
@@ -218,10 +354,6 @@ class PlanarScanLoop(ScanLoop):
     """Class for controlling the planar scanning mode, where we image only one plane and
     do not control the piezo and vertical galvo."""
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.camera_pulses = RollingBuffer(self.n_samples_period())
-
     def loop_condition(self):
         return (
             super().loop_condition() and self.parameters.state == ScanningState.PLANAR
@@ -264,6 +396,9 @@ class VolumetricScanLoop(ScanLoop):
         buffer_len = int(round(self.sample_rate / self.parameters.z.frequency))
         self.recorded_signal = FillingRollingBuffer(buffer_len)
         self.camera_pulses = RollingBuffer(buffer_len)
+        # the parts of the buffers for every block are read in place:
+        self.wave_part = np.empty(self.n_samples)
+        self.pulse_part = np.empty(self.n_samples)
         self.current_frequency = self.parameters.z.frequency
         self.camera_on = False
         self.trigger_exp_start = False
@@ -337,15 +472,30 @@ class VolumetricScanLoop(ScanLoop):
             ],
             i_insert,
         )
-        self.waveform_queue.put(self.recorded_signal.buffer)
+        if time.perf_counter() - self.last_waveform_sent > self.waveform_interval:
+            self.send_waveform()
+
+    def send_waveform(self):
+        """Send the times and values of the recorded waveform, decimated
+        keeping its peaks.
+        """
+        indices, values = decimate_envelope(
+            self.recorded_signal.buffer, self.waveform_points // 2
+        )
+        self.waveform_queue.put(np.stack([indices / self.sample_rate, values]))
+        self.last_waveform_sent = time.perf_counter()
+
+    def table_waveforms(self):
+        return dict(super().table_waveforms(), z_piezo=self.z_waveform)
 
     def fill_arrays(self):
         super().fill_arrays()
-        self.board.z_piezo = self.z_waveform.values(self.shifted_time)
         i_sample = self.i_sample % len(self.recorded_signal.buffer)
 
         if self.recorded_signal.is_complete():
-            wave_part = self.recorded_signal.read(i_sample, self.n_samples)
+            wave_part = self.recorded_signal.read(
+                i_sample, self.n_samples, out=self.wave_part
+            )
             max_wave, min_wave = (np.max(wave_part), np.min(wave_part))
             if (
                 -2 < calc_sync(min_wave, self.parameters.z.lateral_sync) < 2
@@ -369,20 +519,24 @@ class VolumetricScanLoop(ScanLoop):
                 self.logger.log_message("Camera was off")
                 # calculate how many samples are remaining until we are in a new period
                 if i_sample == 0:
-                    camera_pulses = self.camera_pulses.read(i_sample, self.n_samples)
+                    camera_pulses = self.camera_pulses.read(
+                        i_sample, self.n_samples, out=self.pulse_part
+                    )
                     self.camera_was_off = False
                     self.wait_signal.clear()
                 else:
                     n_to_next_start = self.n_samples_period() - i_sample
                     if n_to_next_start < self.n_samples:
                         camera_pulses = self.camera_pulses.read(
-                            i_sample, self.n_samples
-                        ).copy()
+                            i_sample, self.n_samples, out=self.pulse_part
+                        )
                         camera_pulses[:n_to_next_start] = 0
                         self.camera_was_off = False
                         self.wait_signal.clear()
             else:
-                camera_pulses = self.camera_pulses.read(i_sample, self.n_samples)
+                camera_pulses = self.camera_pulses.read(
+                    i_sample, self.n_samples, out=self.pulse_part
+                )
 
         self.board.camera_trigger = camera_pulses
 
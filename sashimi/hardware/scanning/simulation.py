@@ -0,0 +1,182 @@
+from collections import deque
+from contextlib import contextmanager
+from warnings import warn
+import time
+
+import numpy as np
+from scipy.signal import lfilter
+
+from sashimi.hardware.scanning import ScanningWarning
+from sashimi.hardware.scanning.mock import MockBoard
+
+
+class SimulatedBoard(MockBoard):
+    """Board keeping a virtual sample clock running at the sample rate, to study
+    the timing of the scanning loop without hardware.
+
+    Once started, the clock plays the written samples. As on a real board,
+    writing blocks while the output buffer is full, and reading blocks until
+    the clock has acquired the samples read. If a buffer is written after the
+    clock played all the previous ones, the output underruns: the last values
+    are held until the new buffer, which is played from the moment it is written,
+    and the underrun is recorded and warned about. The time of output left in
+    the buffer at every write is kept in margins.
+
+    The signal read is the position of the piezo, following the written piezo
+    waveform with a delay and a first order low-pass filter.
+
+    Parameters
+    ----------
+    sample_rate
+    n_samples
+    conf
+    trigger_line : TriggerLine, optional
+        Line to which the camera pulses are added, at the times of the clock.
+    buffer_depth : int, optional
+        Number of samples the output buffer holds, two writes by default.
+    piezo_delay : float
+        Delay of the piezo response, in seconds.
+    piezo_time_constant : float
+        Time constant of the piezo response, in seconds.
+
+    """
+
+    def __init__(
+        self,
+        sample_rate,
+        n_samples,
+        conf,
+        trigger_line=None,
+        buffer_depth=None,
+        piezo_delay=0.001,
+        piezo_time_constant=0.002,
+    ):
+        super().__init__(sample_rate, n_samples, conf, trigger_line)
+        self.buffer_depth = 2 * n_samples if buffer_depth is None else buffer_depth
+        self.alpha = 1 - np.exp(-1 / (piezo_time_constant * sample_rate))
+        self.read_array = np.zeros(n_samples)
+
+        self.start_time = None
+        # offset from the clock to time.time, for the camera pulses:
+        self.wall_offset = 0.0
+        self.n_written = 0
+        self.n_read = 0
+        # (first sample, number of samples) of every underrun:
+        self.underruns = []
+        self.margins = deque(maxlen=100000)
+        # camera pulses of the buffers written before the start:
+        self.pending_pulses = []
+
+        # piezo position from the sample response_start on, starting with
+        # the delay of the response:
+        self.response = np.zeros(int(round(piezo_delay * sample_rate)))
+        self.response_start = 0
+        # positions read before their commands were written:
+        self.n_skip_response = 0
+        self.last_command = 0.0
+        self.last_position = 0.0
+
+    def sample_time(self, i_sample):
+        return self.start_time + i_sample / self.sample_rate
+
+    def samples_played(self):
+        if self.start_time is None:
+            return 0
+        return int((time.perf_counter() - self.start_time) * self.sample_rate)
+
+    def wait_for_sample(self, i_sample):
+        wait = self.sample_time(i_sample) - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        self.wall_offset = time.time() - self.start_time
+        if self.trigger_line is not None:
+            for pulses in self.pending_pulses:
+                self.trigger_line.add(self.sample_time(pulses) + self.wall_offset)
+        self.pending_pulses = []
+
+    def write(self):
+        if self.start_time is not None:
+            n_played = self.samples_played()
+            # writing blocks until the buffer has room:
+            n_room = self.n_written + self.n_samples - self.buffer_depth
+            if n_played < n_room:
+                self.wait_for_sample(n_room)
+                n_played = n_room
+            self.margins.append((self.n_written - n_played) / self.sample_rate)
+            if n_played > self.n_written:
+                n_missed = n_played - self.n_written
+                self.underruns.append((self.n_written, n_missed))
+                warn(
+                    f"Output underrun at sample {self.n_written}, "
+                    f"written {n_missed / self.sample_rate * 1000:.1f} ms late",
+                    ScanningWarning,
+                )
+                self.move_piezo(np.full(n_missed, self.last_command))
+                self.trigger_was_high = False
+                self.n_written = n_played
+
+        if self.trigger_line is not None:
+            pulses = self.n_written + self.camera_pulses()
+            if self.start_time is None:
+                self.pending_pulses.append(pulses)
+            else:
+                self.trigger_line.add(self.sample_time(pulses) + self.wall_offset)
+        self.move_piezo(self.piezo_array)
+        self.n_written += self.n_samples
+
+    def move_piezo(self, commands):
+        """Add the response of the piezo to the commands played next."""
+        positions, _ = lfilter(
+            [self.alpha],
+            [1, self.alpha - 1],
+            commands,
+            zi=[(1 - self.alpha) * self.last_position],
+        )
+        self.last_command = commands[-1]
+        self.last_position = positions[-1]
+        n_skip = min(self.n_skip_response, len(positions))
+        self.n_skip_response -= n_skip
+        self.response = np.concatenate([self.response, positions[n_skip:]])
+
+    def read(self):
+        i_end = self.n_read + self.n_samples
+        if self.start_time is not None:
+            self.wait_for_sample(i_end)
+        positions = self.response[
+            self.n_read - self.response_start : i_end - self.response_start
+        ]
+        self.read_array[: len(positions)] = positions
+        # samples not written yet are read at the last position:
+        self.read_array[len(positions) :] = self.last_position
+        self.n_skip_response += self.n_samples - len(positions)
+        self.response = self.response[i_end - self.response_start :]
+        self.response_start = i_end
+        self.n_read = i_end
+
+    @property
+    def z_piezo(self):
+        return self.read_array
+
+    @z_piezo.setter
+    def z_piezo(self, waveform):
+        self.piezo_array[:] = waveform
+
+    @property
+    def min_margin(self):
+        """Smallest time of output left in the buffer when writing, negative
+        if the output underran.
+        """
+        return min(self.margins) if len(self.margins) > 0 else None
+
+
+@contextmanager
+def open_simulated_board(
+    sample_rate, n_samples, conf, trigger_line=None
+) -> SimulatedBoard:
+    try:
+        yield SimulatedBoard(sample_rate, n_samples, conf, trigger_line)
+    finally:
+        pass
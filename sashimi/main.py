@@ -10,7 +10,11 @@ from pathlib import Path
 
 @click.command()
 @click.option("--scopeless", is_flag=True, help="Scopeless mode for simulated hardware")
-@click.option("--scanning", default="mock", help="The scanning interface")
+@click.option(
+    "--scanning",
+    default="mock",
+    help="The scanning interface: ni, mock or simulation",
+)
 def main(scopeless, scanning, **kwargs):
     cli_edit_config("scopeless", scopeless)
     cli_edit_config("scanning", scanning)
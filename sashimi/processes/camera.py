@@ -1,15 +1,17 @@
 from multiprocessing import Queue
+from queue import Full
 from enum import Enum
 from dataclasses import dataclass
-from queue import Empty
 from datetime import datetime
-from arrayqueues.shared_arrays import ArrayQueue
+import time
 
 from sashimi.processes.logging import LoggingProcess
 from sashimi.events import LoggedEvent
 from sashimi.hardware.cameras import camera_class_dict
+from sashimi.hardware.cameras.simulation import SimulatedCamera
 from sashimi.config import read_config
-from sashimi.utilities import get_last_parameters
+from sashimi.processes.mailbox import ParameterMailbox
+from sashimi.processes.frame_ring import FrameRing
 
 conf = read_config()
 
@@ -93,7 +95,12 @@ class CameraProcess(LoggingProcess):
     exp_trigger_event
     camera_id
     max_queue_size
+        Size in MB of the ring of frames shared with the dispatcher, in which
+        the camera acquires if it can.
     n_fps_frames
+    trigger_line
+        Pulses of the mock scanning board, which the simulated camera follows
+        when it is externally triggered.
     """
 
     def __init__(
@@ -102,23 +109,26 @@ class CameraProcess(LoggingProcess):
         wait_event: LoggedEvent,
         exp_trigger_event: LoggedEvent,
         camera_id=0,
-        max_queue_size=1200,
+        max_queue_size=2000,
         n_fps_frames=20,
+        trigger_line=None,
     ):
         super().__init__(name="camera")
         # Queue to communicate
         self.triggered_frame_rate_queue = Queue()
-        self.parameter_queue = Queue()
+        self.parameter_mailbox = ParameterMailbox(doorbell=self.doorbell)
 
-        self.stop_event = stop_event.new_reference(self.logger)
+        self.stop_event = stop_event.new_reference(self.logger, self.doorbell)
         self.wait_event = wait_event.new_reference(self.logger)
         self.experiment_trigger_event = exp_trigger_event.new_reference(self.logger)
-        self.image_queue = ArrayQueue(max_mbytes=max_queue_size)
+        self.frame_ring = FrameRing(max_mbytes=max_queue_size)
         self.camera_id = camera_id
+        self.trigger_line = trigger_line
         self.camera = None
         self.parameters = CamParameters()
         self.framerate_rec = FramerateRecorder(n_fps_frames=n_fps_frames)
         self.was_waiting = False
+        self.last_sdk_log = 0.0
 
     def initialize_camera(self):
         if conf["scopeless"]:
@@ -128,6 +138,9 @@ class CameraProcess(LoggingProcess):
                 camera_id=conf["camera"]["id"],
                 max_sensor_resolution=tuple(conf["camera"]["max_sensor_resolution"]),
             )
+        self.camera.frame_ring = self.frame_ring
+        if isinstance(self.camera, SimulatedCamera):
+            self.camera.trigger_line = self.trigger_line
 
     def run(self):
         self.logger.log_message("started")
@@ -155,14 +168,12 @@ class CameraProcess(LoggingProcess):
             not self.stop_event.is_set()
             and self.parameters.camera_mode == CameraMode.PAUSED
         ):
-            try:
-                new_parameters = self.parameter_queue.get(timeout=0.001)
-                if new_parameters != self.parameters:
-                    self.update_parameters(new_parameters, stop_start=False)
-                    if self.parameters.camera_mode != CameraMode.PAUSED:
-                        break
-            except Empty:
-                pass
+            self.wait_for_work(timeout=0.5)
+            new_parameters = self.parameter_mailbox.get()
+            if new_parameters is not None and new_parameters != self.parameters:
+                self.update_parameters(new_parameters, stop_start=False)
+                if self.parameters.camera_mode != CameraMode.PAUSED:
+                    break
 
     def camera_loop(self):
         """Camera running loop, grab frames and set new parameters if available."""
@@ -178,22 +189,38 @@ class CameraProcess(LoggingProcess):
             # if no frames are received (either this loop is in between frames
             # or we are in the waining period)
             if frames:
-                for frame in frames:
-                    self.logger.log_message(
-                        "received frame of shape " + str(frame.shape)
+                receive_time = time.time_ns()
+                self.logger.log_message(
+                    f"received {len(frames)} frames of shape {frames[0].shape}"
+                )
+                # this means this is the first frame received since
+                # the waiting period is over, the signal has to be sent that
+                # saving can start
+                if self.was_waiting and not is_waiting:
+                    self.experiment_trigger_event.set()
+                stamps = self.camera.frame_stamps
+                if len(stamps) != len(frames):
+                    stamps = [(-1, -1)] * len(frames)
+                # all the frames are sent to the dispatcher at once:
+                try:
+                    self.frame_ring.put_batch(
+                        frames,
+                        [
+                            (frame_number, receive_time, hardware_time)
+                            for frame_number, hardware_time in stamps
+                        ],
                     )
-                    # this means this is the first frame received since
-                    # the waiting period is over, the signal has to be sent that
-                    # saving can start
-                    if self.was_waiting and not is_waiting:
-                        self.experiment_trigger_event.set()
-                        # TODO do not crash here if queue is full
-                    self.image_queue.put(frame)
-                    self.was_waiting = is_waiting
+                except Full as e:
+                    self.logger.log_message(f"frame ring full: {e}")
+                self.was_waiting = is_waiting
+                for _ in frames:
                     self.update_framerate()
 
-            # Empty parameters queue and set new parameters with the most recent value
-            new_parameters = get_last_parameters(self.parameter_queue, timeout=0.001)
+            if time.perf_counter() - self.last_sdk_log > self.load_log_interval:
+                self.log_sdk_calls()
+
+            # Set new parameters if they changed since the last iteration
+            new_parameters = self.parameter_mailbox.get()
 
             if new_parameters is not None:
                 if new_parameters.camera_mode == CameraMode.ABORT or (
@@ -218,6 +245,18 @@ class CameraProcess(LoggingProcess):
         self.framerate_rec.restart()
         self.logger.log_message("Updated parameters " + str(self.parameters))
 
+    def log_sdk_calls(self):
+        """Log the calls per second to the camera SDK since the last log, none of
+        them should read properties while acquiring.
+        """
+        rates = self.camera.sdk_call_rates()
+        if rates:
+            self.logger.log_message(
+                "SDK calls per second: "
+                + ", ".join(f"{name} {rate:.1f}" for name, rate in rates.items())
+            )
+        self.last_sdk_log = time.perf_counter()
+
     def update_framerate(self):
         self.framerate_rec.update_framerate()
         if self.framerate_rec.i_fps == 0:
@@ -1,9 +1,12 @@
 from multiprocessing import Queue, Event
 from queue import Empty
 from arrayqueues.shared_arrays import ArrayQueue
-from sashimi.utilities import neg_dif
+from sashimi.utilities import correct_frame
 from sashimi.processes.logging import LoggingProcess
 from sashimi.events import LoggedEvent
+from sashimi.processes.volume_ring import VolumeRing
+from sashimi.processes.frame_ring import FrameRing, frame_metadata_dtype
+from sashimi.processes.mailbox import ParameterMailbox
 import numpy as np
 
 from sashimi.utilities import get_last_parameters
@@ -20,9 +23,15 @@ class VolumeDispatcher(LoggingProcess):
     saving_signal
     wait_signal
     noise_subtraction_on
-    camera_queue
-    saver_queue
-    max_queue_size
+    frame_ring
+        Ring through which the camera hands the frames over, they are read
+        in place and released once they are in the volume.
+    volume_ring
+        Ring in which the volumes are assembled and published to the viewer
+        and the saver.
+    parallel_correction : bool
+        If True, the noise subtraction and flat-field correction of every
+        frame is split across rows in numba threads.
 
     """
 
@@ -32,82 +41,208 @@ class VolumeDispatcher(LoggingProcess):
         saving_signal: LoggedEvent,
         wait_signal: LoggedEvent,
         noise_subtraction_on: Event,
-        camera_queue: ArrayQueue,
-        saver_queue: ArrayQueue,
-        max_queue_size=1200,
+        frame_ring: FrameRing,
+        volume_ring: VolumeRing,
+        parallel_correction=False,
     ):
         super().__init__(name="dispatcher")
-        self.stop_event = stop_event
+        self.stop_event = stop_event.new_reference(self.logger, self.doorbell)
         self.saving_signal = saving_signal.new_reference(self.logger)
-        self.wait_signal = wait_signal.new_reference(self.logger)
+        self.wait_signal = wait_signal.new_reference(self.logger, self.doorbell)
         self.noise_subtraction_active = noise_subtraction_on.new_reference(self.logger)
 
-        self.camera_queue = camera_queue
-        self.saver_queue = saver_queue
-        self.n_planes_queue = Queue()
-        self.viewer_queue = ArrayQueue(max_mbytes=max_queue_size)
+        self.frame_ring = frame_ring
+        self.volume_ring = volume_ring
+        self.n_planes_mailbox = ParameterMailbox(doorbell=self.doorbell)
         self.calibration_ref_queue = ArrayQueue()
+        # gain maps can be larger than an ArrayQueue, and None disables them:
+        self.gain_map_queue = Queue()
 
-        self.volume_buffer = None
+        # slot of the ring in which the current volume is assembled:
+        self.i_slot = None
         self.calibration_ref = None
+        self.gain_map = None
+        self.parallel_correction = parallel_correction
 
         self.n_planes = 1
         self.i_plane = 0
-        self.first_volume = True
+        self.n_dropped = 0
+        # metadata of the frames of the volume being assembled:
+        self.volume_metadata = None
+        # camera number of the last frame received, to detect lost frames:
+        self.last_frame_number = None
+        self.n_lost_frames = 0
 
     def run(self):
         self.logger.log_message("started")
         while not self.stop_event.is_set():
+            # sleep until there are frames or options to receive:
+            self.wait_for_work(
+                [
+                    self.frame_ring.queue,
+                    self.calibration_ref_queue,
+                    self.gain_map_queue,
+                ],
+                timeout=0.5,
+            )
             self.receive_options()
             self.get_frame()
         self.close_log()
 
-    def process_frame(self, current_frame):
-        if self.calibration_ref is not None and self.noise_subtraction_active.is_set():
-            if np.shape(current_frame) == np.shape(self.calibration_ref):
-                current_frame = neg_dif(current_frame, self.calibration_ref)
+    def process_frame(self, current_frame, metadata=(-1, 0, -1)):
+        """Write a frame in the volume being assembled.
 
-        if self.first_volume or self.volume_buffer.shape[1:3] != current_frame.shape:
-            self.volume_buffer = np.empty(
-                (self.n_planes, *current_frame.shape), dtype=np.uint16
-            )
-            self.first_volume = False
+        Parameters
+        ----------
+        current_frame : np.ndarray
+        metadata : tuple
+            (frame_number, receive_time, hardware_time) of the frame. If the
+            camera numbers the frames, the planes of the frames lost before
+            this one are skipped, so that it lands in its own plane.
+
+        """
+        if (
+            self.i_slot is not None
+            and self.volume_ring.slot(self.i_slot).shape[1:] != current_frame.shape
+        ):
+            # the frame size changed, the volume is restarted:
+            self.reset()
+
+        frame_number = metadata[0]
+        if frame_number >= 0:
+            if self.last_frame_number is not None:
+                n_lost = frame_number - self.last_frame_number - 1
+                if n_lost > 0:
+                    self.skip_lost_frames(n_lost, current_frame.shape)
+            self.last_frame_number = frame_number
+
+        if self.i_plane == 0:
+            self.start_volume(current_frame.shape)
 
         self.logger.log_message(f"received plane {self.i_plane}")
-        self.volume_buffer[self.i_plane, :, :] = current_frame
-        self.i_plane += 1
+        if self.i_slot is not None:
+            plane = self.volume_ring.slot(self.i_slot)[self.i_plane, :, :]
+            if (
+                self.calibration_ref is not None
+                and self.noise_subtraction_active.is_set()
+                and np.shape(current_frame) == np.shape(self.calibration_ref)
+            ):
+                # the corrected frame is written directly in the volume:
+                gain_map = self.gain_map
+                if np.shape(gain_map) != np.shape(current_frame):
+                    gain_map = None
+                correct_frame(
+                    current_frame,
+                    self.calibration_ref,
+                    plane,
+                    gain_map,
+                    self.parallel_correction,
+                )
+            else:
+                plane[:, :] = current_frame
+            plane_metadata = self.volume_metadata[self.i_plane]
+            (
+                plane_metadata["frame_number"],
+                plane_metadata["receive_time"],
+                plane_metadata["hardware_time"],
+            ) = metadata
+        self.advance_planes(1)
+
+    def start_volume(self, frame_shape):
+        self.i_slot = self.volume_ring.acquire((self.n_planes, *frame_shape), np.uint16)
+        if self.i_slot is None:
+            self.n_dropped += 1
+            self.logger.log_message(
+                f"volume ring full, dropped volume ({self.n_dropped} so far)"
+            )
+        self.volume_metadata = np.zeros(self.n_planes, frame_metadata_dtype)
+        self.volume_metadata["plane"] = np.arange(self.n_planes)
+        self.volume_metadata["frame_number"] = -1
+        self.volume_metadata["hardware_time"] = -1
+
+    def advance_planes(self, n_planes):
+        self.i_plane += n_planes
         if self.i_plane == self.n_planes:
             self.fill_queues()
             self.i_plane = 0
 
+    def skip_lost_frames(self, n_lost, frame_shape):
+        """Leave blank the planes of frames lost by the camera, publishing the
+        volumes they complete. Volumes lost entirely are not published.
+        """
+        self.n_lost_frames += n_lost
+        self.logger.log_message(
+            f"lost {n_lost} frames before plane {self.i_plane} "
+            f"({self.n_lost_frames} so far)"
+        )
+        if self.i_plane > 0:
+            n_in_volume = min(n_lost, self.n_planes - self.i_plane)
+            self.blank_planes(n_in_volume)
+            self.advance_planes(n_in_volume)
+            n_lost -= n_in_volume
+        n_lost_volumes, n_lost = divmod(n_lost, self.n_planes)
+        self.n_dropped += n_lost_volumes
+        if n_lost > 0:
+            self.start_volume(frame_shape)
+            self.blank_planes(n_lost)
+            self.advance_planes(n_lost)
+
+    def blank_planes(self, n_planes):
+        if self.i_slot is not None:
+            self.volume_ring.slot(self.i_slot)[
+                self.i_plane : self.i_plane + n_planes
+            ] = 0
+
     def fill_queues(self):
-        if self.viewer_queue.queue.qsize() < 3:
-            self.viewer_queue.put(self.volume_buffer)
+        if self.i_slot is None:
+            return
+        consumers = []
+        if self.volume_ring.qsize("viewer") < 3:
+            consumers.append("viewer")
         else:
             pass  # volume has been dropped from the viewer
         if self.saving_signal.is_set():
-            self.saver_queue.put(self.volume_buffer)
+            consumers.append("saver")
+        # the volume is not copied, the viewer and saver get the same slot:
+        self.volume_ring.publish(self.i_slot, consumers, self.volume_metadata)
+        self.i_slot = None
 
     def get_frame(self):
         if self.wait_signal.is_set():
             self.logger.log_message("wait starting")
-            self.saver_queue.clear()
+            self.volume_ring.clear("saver")
             while self.wait_signal.is_set():
-                try:
-                    _ = self.camera_queue.get(timeout=TIMEOUT_S, block=False)
-                except Empty:
-                    pass
+                self.wait_for_work([self.frame_ring.queue], timeout=0.5)
+                self.frame_ring.clear()
             self.logger.log_message("wait over")
-            self.i_plane = 0
+            self.reset()
         try:
-            current_frame = self.camera_queue.get(timeout=TIMEOUT_S, block=False)
-            self.process_frame(current_frame)
+            batch = self.frame_ring.get_batch(timeout=TIMEOUT_S)
         except Empty:
-            pass
+            return
+        n_skipped = 0
+        for frame_ref, current_frame, metadata in batch:
+            # frames the camera already wrote over are left out, as lost ones:
+            if self.frame_ring.overwritten(frame_ref):
+                n_skipped += 1
+                continue
+            self.process_frame(current_frame, metadata)
+        n_overwritten = (
+            self.frame_ring.release([frame_ref for frame_ref, _, _ in batch])
+            - n_skipped
+        )
+        if n_skipped > 0:
+            self.logger.log_message(
+                f"{n_skipped} frames overwritten by the camera before being read"
+            )
+        if n_overwritten > 0:
+            self.logger.log_message(
+                f"{n_overwritten} frames overwritten by the camera while read"
+            )
 
     def receive_options(self):
         # Get number of planes:
-        n_planes = get_last_parameters(self.n_planes_queue, timeout=TIMEOUT_S)
+        n_planes = self.n_planes_mailbox.get()
 
         if n_planes is not None:
             self.n_planes = n_planes
@@ -120,6 +255,16 @@ class VolumeDispatcher(LoggingProcess):
         if calibration_ref is not None:
             self.calibration_ref = calibration_ref
 
+        # Get flat-field gain map, None to stop using it:
+        try:
+            self.gain_map = self.gain_map_queue.get(timeout=TIMEOUT_S, block=False)
+        except Empty:
+            pass
+
     def reset(self):
-        self.first_volume = True
+        if self.i_slot is not None:
+            # give back the slot of the incomplete volume:
+            self.volume_ring.publish(self.i_slot, [])
+            self.i_slot = None
         self.i_plane = 0
+        self.last_frame_number = None
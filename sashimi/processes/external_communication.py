@@ -1,10 +1,10 @@
 from multiprocessing import Queue
 from sashimi.processes.logging import LoggingProcess
+from sashimi.processes.mailbox import ParameterMailbox
 from sashimi.utilities import clean_json
 from sashimi.events import LoggedEvent
 from sashimi.config import read_config
 from sashimi.hardware.external_trigger import external_comm_class_dict
-from queue import Empty
 from multiprocessing import Event
 
 
@@ -23,11 +23,14 @@ class ExternalComm(LoggingProcess):
         scanning_trigger=True,
     ):
         super().__init__(name="external_comm")
-        self.current_settings_queue = Queue()
+        self.current_settings_mailbox = ParameterMailbox(doorbell=self.doorbell)
         self.current_settings = None
-        self.start_comm = experiment_start_event.new_reference(self.logger)
-        self.stop_event = stop_event.new_reference(self.logger)
-        self.saving_event = is_saving_event.new_reference(self.logger)
+        self.start_comm = experiment_start_event.new_reference(
+            self.logger, self.doorbell
+        )
+        self.stop_event = stop_event.new_reference(self.logger, self.doorbell)
+        self.saving_event = is_saving_event.new_reference(self.logger, self.doorbell)
+        # set from the State, which rings the doorbell when changing it:
         self.is_triggered_event = Event()
         self.duration_queue = duration_queue
         self.address = address
@@ -39,7 +42,9 @@ class ExternalComm(LoggingProcess):
             ](self.address)
         self.scanning_trigger = scanning_trigger
         if self.scanning_trigger:
-            self.waiting_event = is_waiting_event.new_reference(self.logger)
+            self.waiting_event = is_waiting_event.new_reference(
+                self.logger, self.doorbell
+            )
 
     def trigger_condition(self):
         if self.scanning_trigger:
@@ -53,16 +58,15 @@ class ExternalComm(LoggingProcess):
     def run(self):
         self.logger.log_message("started")
         while not self.stop_event.is_set():
-            while True:
-                try:
-                    self.current_settings = self.current_settings_queue.get(
-                        timeout=0.00001
-                    )
-                    current_config = dict(lightsheet=clean_json(self.current_settings))
-                except Empty:
-                    break
+            # sleep until the settings or the trigger conditions change:
+            self.wait_for_work(timeout=0.5)
+            current_settings = self.current_settings_mailbox.get()
+            if current_settings is not None:
+                self.current_settings = current_settings
             if self.trigger_condition():
-                duration = self.comm.trigger_and_receive_duration(current_config)
+                duration = self.comm.trigger_and_receive_duration(
+                    dict(lightsheet=clean_json(self.current_settings))
+                )
                 if duration is not None:
                     self.duration_queue.put(duration)
                 self.logger.log_message("sent communication")
@@ -0,0 +1,293 @@
+import ctypes
+from multiprocessing import Array, Lock, Value
+from queue import Empty, Full
+
+import numpy as np
+from arrayqueues.portable_queue import PortableQueue
+
+# metadata of every frame, saved as a table next to the volumes. The frame
+# number is counted by the camera, the times are in ns, the hardware time
+# and the frame number of frames which were lost are -1:
+frame_metadata_dtype = np.dtype(
+    [
+        ("volume", "i8"),
+        ("plane", "i4"),
+        ("frame_number", "i8"),
+        ("receive_time", "i8"),
+        ("hardware_time", "i8"),
+    ]
+)
+
+
+class FrameRing:
+    """Ring of frame buffers in shared memory, through which the camera hands
+    frames to the dispatcher without copying them. Cameras which can acquire
+    into memory they are given (as the Hamamatsu, whose buffers are attached to
+    the DCAM driver) allocate their buffers in the ring, and putting a frame
+    which is already in them only sends its buffer number to the dispatcher,
+    which reads it in place and releases it once it is in the volume. Frames
+    from elsewhere are copied in the spare buffers of the ring, which the
+    camera does not acquire into. The frames the camera gets at once are sent
+    in a single message, each with its metadata: the frame number given by the
+    camera, the time it was received at and the hardware timestamp of the
+    camera, if it has one.
+
+    The camera writes its buffers in turn whether or not they were released,
+    so the frames it writes are numbered in the order they are written, lost
+    frames included, and the camera reports with written how many it wrote.
+    A frame read in place is overwritten once the camera has written as many
+    frames after it as it has buffers: the dispatcher checks it with overwritten
+    before reading a frame, and learns from release whether it could have been
+    overwritten while it read it. To keep the frames safe when the dispatcher
+    falls behind, once half of the camera buffers are waiting to be read, the
+    next frames are copied in the spare buffers instead.
+
+    Parameters
+    ----------
+    max_mbytes : float
+        Size of the ring, the number of buffers depends on the size of the frames.
+    max_buffers : int
+        Maximum number of buffers, for small frames.
+
+    """
+
+    def __init__(self, max_mbytes=2000, max_buffers=2000):
+        self.maxbytes = int(max_mbytes * 1000000)
+        self.max_buffers = max_buffers
+        self.array = Array("c", self.maxbytes, lock=False)
+        self.n_buffers = Value("i", 0, lock=False)
+        # the first buffers are acquired into by the camera, the others are spare:
+        self.n_camera_buffers = Value("i", 0, lock=False)
+        self.buffer_bytes = Value("Q", 0, lock=False)
+        # incremented at every allocation, to ignore frames of the old one:
+        self.generation = Value("i", 0, lock=False)
+        # since the allocation, frames written by the camera, and frames read
+        # in place put and released:
+        self.n_written = Value("Q", 0, lock=False)
+        self.n_put = Value("Q", 0, lock=False)
+        self.n_released = Value("Q", 0, lock=False)
+        # frames copied in the spare buffers, and released:
+        self.n_copied = Value("Q", 0, lock=False)
+        self.n_copies_released = Value("Q", 0, lock=False)
+        self.lock = Lock()
+        self.queue = PortableQueue()
+
+        # layout of the buffers, set up in each process from the frames it gets:
+        self.buffers = None
+        self.buffers_generation = -1
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["buffers"] = None
+        state["buffers_generation"] = -1
+        return state
+
+    def layout(self, buffer_bytes, n_buffers, generation):
+        self.buffers = np.frombuffer(
+            self.array, np.uint8, n_buffers * buffer_bytes
+        ).reshape((n_buffers, buffer_bytes))
+        self.buffers_generation = generation
+
+    def allocate(self, buffer_bytes, spare_fraction=0.25):
+        """Lay out the ring in buffers of buffer_bytes, dropping the frames
+        not yet received, and returns the buffers the camera acquires into
+        as flat uint16 arrays.
+
+        Parameters
+        ----------
+        buffer_bytes : int
+            Size of every buffer.
+        spare_fraction : float
+            Fraction of the buffers kept for the frames which are copied.
+
+        """
+        n_buffers = min(self.maxbytes // buffer_bytes, self.max_buffers)
+        n_camera_buffers = int(n_buffers * (1 - spare_fraction))
+        if n_buffers == 0 or (spare_fraction > 0 and n_camera_buffers == n_buffers):
+            raise ValueError(
+                f"Frames of {buffer_bytes} bytes do not fit in the ring "
+                f"of {self.maxbytes} bytes"
+            )
+        with self.lock:
+            self.generation.value += 1
+            self.n_buffers.value = n_buffers
+            self.n_camera_buffers.value = n_camera_buffers
+            self.buffer_bytes.value = buffer_bytes
+            for counter in [
+                self.n_written,
+                self.n_put,
+                self.n_released,
+                self.n_copied,
+                self.n_copies_released,
+            ]:
+                counter.value = 0
+            self.layout(buffer_bytes, n_buffers, self.generation.value)
+        self.clear()
+        return [buffer.view(np.uint16) for buffer in self.buffers[:n_camera_buffers]]
+
+    def i_buffer(self, frame):
+        """Returns the number of the buffer the frame is in, or None if it is
+        not in the ring.
+        """
+        if self.buffers is None:
+            return None
+        offset = frame.ctypes.data - ctypes.addressof(self.array)
+        buffer_bytes = self.buffers.shape[1]
+        if (
+            0 <= offset < self.buffers.size
+            and offset % buffer_bytes == 0
+            and frame.nbytes <= buffer_bytes
+            and frame.flags.c_contiguous
+        ):
+            return offset // buffer_bytes
+        return None
+
+    def written(self, n_written):
+        """Record how many frames the camera wrote in turn in its buffers since
+        they were allocated, counting the frames it lost.
+        """
+        self.n_written.value = n_written
+
+    def last_write(self, i_buffer):
+        """Number of the last frame the camera wrote in one of its buffers."""
+        n_written = self.n_written.value
+        return n_written - 1 - (n_written - 1 - i_buffer) % self.n_camera_buffers.value
+
+    def in_place_in_flight(self):
+        """Number of frames read in place put and not yet released."""
+        return self.n_put.value - self.n_released.value
+
+    def in_flight(self):
+        """Number of frames put and not yet released."""
+        return (
+            self.in_place_in_flight()
+            + self.n_copied.value
+            - self.n_copies_released.value
+        )
+
+    def overwritten(self, frame_ref):
+        """Returns True if the camera could have written over the frame."""
+        generation, is_copy, number = frame_ref
+        if generation != self.generation.value:
+            return True
+        return (
+            not is_copy and self.n_written.value - number > self.n_camera_buffers.value
+        )
+
+    def put(self, frame, metadata=(-1, 0, -1)):
+        """Send a single frame, see put_batch."""
+        self.put_batch([frame], [metadata])
+
+    def put_batch(self, frames, metadata):
+        """Send frames to the dispatcher in a single message, together with
+        their (frame_number, receive_time, hardware_time) metadata. Frames in
+        the camera buffers are sent in place, unless half of the camera
+        buffers are already waiting to be read, and the others are copied in
+        the spare buffers. Raises queue.Full if the spare buffers to copy some
+        of them in have not been released yet, after sending the others.
+        """
+        entries = []
+        n_in_place = 0
+        n_dropped = 0
+        for frame, frame_metadata in zip(frames, metadata):
+            i_buffer = self.i_buffer(frame)
+            n_camera_buffers = self.n_camera_buffers.value
+            if (
+                i_buffer is not None
+                and i_buffer < n_camera_buffers
+                and self.in_place_in_flight() + n_in_place < n_camera_buffers // 2
+            ):
+                entries.append(
+                    (
+                        i_buffer,
+                        False,
+                        self.last_write(i_buffer),
+                        frame.shape,
+                        frame_metadata,
+                    )
+                )
+                n_in_place += 1
+                continue
+
+            if i_buffer is None and (
+                self.buffers is None or self.buffers.shape[1] != frame.nbytes
+            ):
+                self.allocate(frame.nbytes, spare_fraction=1)
+                entries = []
+                n_in_place = 0
+            n_camera_buffers = self.n_camera_buffers.value
+            n_spare = len(self.buffers) - n_camera_buffers
+            if self.n_copied.value - self.n_copies_released.value >= n_spare:
+                n_dropped += 1
+                continue
+            number = self.n_copied.value
+            i_buffer = n_camera_buffers + number % n_spare
+            self.buffers[i_buffer].view(frame.dtype)[: frame.size].reshape(frame.shape)[
+                ...
+            ] = frame
+            self.n_copied.value += 1
+            entries.append((i_buffer, True, number, frame.shape, frame_metadata))
+        if entries:
+            self.queue.put((self.buffers_generation, frames[0].dtype.str, entries))
+            self.n_put.value += n_in_place
+        if n_dropped > 0:
+            raise Full(
+                f"All the {len(self.buffers) - self.n_camera_buffers.value} spare "
+                f"frame buffers are in use, {n_dropped} frames dropped"
+            )
+
+    def get_batch(self, timeout=0.01):
+        """Returns the next frames sent together, read in place, as a list of
+        (reference, frame, metadata) tuples. The references have to be released
+        once the frames are not used anymore.
+        Raises queue.Empty if no frames arrive within timeout seconds.
+        """
+        while True:
+            generation, dtype, entries = self.queue.get(timeout=timeout)
+            if generation == self.generation.value:
+                break
+        if self.buffers_generation != generation:
+            self.layout(self.buffer_bytes.value, self.n_buffers.value, generation)
+        dtype = np.dtype(dtype)
+        return [
+            (
+                (generation, is_copy, number),
+                self.buffers[i_buffer][: dtype.itemsize * int(np.prod(shape))]
+                .view(dtype)
+                .reshape(shape),
+                frame_metadata,
+            )
+            for i_buffer, is_copy, number, shape, frame_metadata in entries
+        ]
+
+    def release(self, frame_refs):
+        """Give back the buffers of some frames. Returns the number of them
+        the camera could have written another frame over in the meantime.
+        """
+        n_overwritten = 0
+        with self.lock:
+            for frame_ref in frame_refs:
+                generation, is_copy, _ = frame_ref
+                # frames of a previous allocation have already been dropped:
+                if generation != self.generation.value:
+                    n_overwritten += 1
+                    continue
+                if is_copy:
+                    self.n_copies_released.value += 1
+                else:
+                    self.n_released.value += 1
+                    n_overwritten += self.overwritten(frame_ref)
+        return n_overwritten
+
+    def clear(self):
+        """Release all the frames waiting for the dispatcher."""
+        while self.queue.qsize() > 0:
+            try:
+                # items just put can take a moment to be readable:
+                generation, _, entries = self.queue.get(timeout=0.01)
+            except Empty:
+                break
+            self.release([(generation, entry[1], entry[2]) for entry in entries])
+
+    def qsize(self):
+        return self.queue.qsize()
@@ -1,4 +1,6 @@
-from multiprocessing import Process
+from contextlib import contextmanager
+from multiprocessing import Array, Pipe, Process, Value
+from multiprocessing.connection import wait
 import time
 from pathlib import Path
 from typing import Optional, TextIO
@@ -43,12 +45,95 @@ class ConcurrenceLogger:
             self.file.close()
 
 
+def queue_connection(queue):
+    """Returns the connection that is readable when the queue (multiprocessing
+    or array queue) has items, or None if it cannot be waited on, as for
+    queues from a multiprocessing manager.
+    """
+    queue = getattr(queue, "queue", queue)
+    return getattr(queue, "_reader", None)
+
+
+class Doorbell:
+    """Wakes up a process sleeping until it has some work to do. It is rung
+    by the LoggedEvents the process listens to when they change, and the
+    process also wakes up when items arrive in the queues it waits on.
+    """
+
+    def __init__(self):
+        self.reader, self.writer = Pipe(duplex=False)
+        # avoids filling the pipe if the doorbell is rung many times:
+        self.pending = Value("b", 0, lock=False)
+
+    def ring(self):
+        if not self.pending.value:
+            self.pending.value = 1
+            self.writer.send_bytes(b"")
+
+    def wait(self, queues=(), timeout=None):
+        """Sleep until the doorbell rings or one of the queues has items,
+        at most for timeout seconds. Returns False on timeout.
+        """
+        connections = [self.reader]
+        for queue in queues:
+            connection = queue_connection(queue)
+            if connection is not None:
+                connections.append(connection)
+        ready = wait(connections, timeout)
+        if self.reader in ready:
+            # the pipe is drained before the doorbell can be rung again, so
+            # that no ring is consumed by the drain while pending stays set:
+            while self.reader.poll():
+                self.reader.recv_bytes()
+            self.pending.value = 0
+        return len(ready) > 0
+
+
 class LoggingProcess(Process):
-    """A process with an integrated concurrence logger"""
+    """A process with an integrated concurrence logger, and a doorbell to sleep
+    while it has nothing to do. The time spent waiting (idle) and working (busy),
+    and the CPU time used by the process are kept in the shared load array,
+    and logged every load_log_interval seconds.
+    """
+
+    load_log_interval = 10.0
 
     def __init__(self, *args, name, **kwargs):
         super().__init__(*args, **kwargs)
         self.logger = ConcurrenceLogger(name)
+        self.doorbell = Doorbell()
+        # busy, idle and CPU time in seconds:
+        self.load = Array("d", 3, lock=False)
+        self.load_start_time = None
+        self.idle_time = 0.0
+        self.last_load_log = 0.0
+
+    def wait_for_work(self, queues=(), timeout=None):
+        """Sleep until the doorbell rings or one of the queues has items,
+        at most for timeout seconds.
+        """
+        with self.idle():
+            return self.doorbell.wait(queues, timeout)
+
+    @contextmanager
+    def idle(self):
+        """Count the time spent in the block as idle."""
+        start_time = time.perf_counter()
+        if self.load_start_time is None:
+            self.load_start_time = start_time
+            self.last_load_log = start_time
+        yield
+        end_time = time.perf_counter()
+        self.idle_time += end_time - start_time
+        self.load[0] = end_time - self.load_start_time - self.idle_time
+        self.load[1] = self.idle_time
+        self.load[2] = time.process_time()
+        if end_time - self.last_load_log > self.load_log_interval:
+            self.logger.log_message(
+                f"load: busy {self.load[0]:.1f} s, idle {self.load[1]:.1f} s, "
+                f"CPU {self.load[2]:.1f} s"
+            )
+            self.last_load_log = end_time
 
     def close_log(self):
         self.logger.close()
@@ -0,0 +1,67 @@
+import ctypes
+import pickle
+from multiprocessing import Array, Lock, Value
+
+
+class ParameterMailbox:
+    """Latest value of some parameters, in shared memory, to be read by a
+    process at every iteration of its loop. Putting new parameters replaces
+    the previous ones, and increments a version counter: checking whether the
+    parameters changed only reads the counter, and they are unpickled only
+    when they did. Every process reading the mailbox gets each version once.
+
+    The version is odd while the parameters are being written, so that
+    readers never decode half-written data without taking any lock.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Maximum size of the pickled parameters.
+    doorbell : Doorbell, optional
+        Doorbell of the reading process, rung when new parameters are put.
+
+    """
+
+    def __init__(self, max_bytes=65536, doorbell=None):
+        self.buffer = Array("c", max_bytes, lock=False)
+        self.n_bytes = Value("Q", 0, lock=False)
+        self.version = Value("Q", 0, lock=False)
+        self.write_lock = Lock()
+        self.doorbell = doorbell
+        # version read last by this process:
+        self.last_version = 0
+
+    def put(self, parameters):
+        data = pickle.dumps(parameters, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > len(self.buffer):
+            raise ValueError(
+                f"Parameters of {len(data)} bytes do not fit in the mailbox "
+                f"of {len(self.buffer)} bytes"
+            )
+        with self.write_lock:
+            self.version.value += 1
+            ctypes.memmove(self.buffer, data, len(data))
+            self.n_bytes.value = len(data)
+            self.version.value += 1
+        if self.doorbell is not None:
+            self.doorbell.ring()
+
+    def changed(self):
+        return self.version.value != self.last_version
+
+    def get(self):
+        """Returns the parameters if they changed since the last call in this
+        process, None otherwise.
+        """
+        version = self.version.value
+        if version == self.last_version:
+            return None
+        while True:
+            if version % 2 == 0:
+                data = ctypes.string_at(self.buffer, self.n_bytes.value)
+                if self.version.value == version:
+                    break
+            # new parameters are being written, read again:
+            version = self.version.value
+        self.last_version = version
+        return pickle.loads(data)
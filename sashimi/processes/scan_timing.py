@@ -0,0 +1,110 @@
+from multiprocessing import Array, Value
+
+import numpy as np
+
+
+class ScanTiming:
+    """Timing of the iterations of the scanning loop, in shared memory, to be
+    read from the main process. The durations of the phases of every iteration
+    are counted in histograms with logarithmic bins, and so is the slack before
+    every write: the time left until the board has played all the samples
+    written so far, and its output runs empty. A negative slack means the
+    output underran.
+
+    Parameters
+    ----------
+    block_duration : float
+        Duration of the samples written at every iteration, in seconds.
+    slack_threshold : float, optional
+        Slack under which the scanning loop warns, a quarter of the block
+        duration by default. It can be changed while scanning.
+
+    """
+
+    phases = ("update_settings", "fill_arrays", "write", "read", "iteration")
+    # from 10 us to 10 s, the counts below and above are in the first and last bin:
+    duration_edges = np.logspace(-5, 1, 25)
+
+    def __init__(self, block_duration, slack_threshold=None):
+        self.block_duration = block_duration
+        # slack from minus one block to four blocks:
+        self.slack_edges = np.linspace(-1, 4, 41) * block_duration
+        n_bins = len(self.duration_edges) + 1
+        self.duration_counts = Array("Q", len(self.phases) * n_bins, lock=False)
+        self.total_durations = Array("d", len(self.phases), lock=False)
+        self.max_durations = Array("d", len(self.phases), lock=False)
+        self.slack_counts = Array("Q", len(self.slack_edges) + 1, lock=False)
+        self.min_slack = Value("d", np.inf, lock=False)
+        self.n_low_slack = Value("Q", 0, lock=False)
+        self.slack_threshold = Value(
+            "d",
+            block_duration / 4 if slack_threshold is None else slack_threshold,
+            lock=False,
+        )
+
+    @property
+    def n_iterations(self):
+        return int(self.histograms()["iteration"].sum())
+
+    def add_durations(self, durations):
+        """Count the durations of the phases of an iteration, in seconds, in
+        the order of ScanTiming.phases.
+        """
+        counts = np.frombuffer(self.duration_counts, np.uint64).reshape(
+            len(self.phases), -1
+        )
+        bins = np.searchsorted(self.duration_edges, durations)
+        for i_phase, (i_bin, duration) in enumerate(zip(bins, durations)):
+            counts[i_phase, i_bin] += 1
+            self.total_durations[i_phase] += duration
+            self.max_durations[i_phase] = max(self.max_durations[i_phase], duration)
+
+    def add_slack(self, slack):
+        """Count the slack before a write, returns True if it is below the
+        threshold.
+        """
+        self.slack_counts[np.searchsorted(self.slack_edges, slack)] += 1
+        self.min_slack.value = min(self.min_slack.value, slack)
+        if slack < self.slack_threshold.value:
+            self.n_low_slack.value += 1
+            return True
+        return False
+
+    def histograms(self):
+        """Returns the counts of the durations of every phase, by name."""
+        counts = np.frombuffer(self.duration_counts, np.uint64).reshape(
+            len(self.phases), -1
+        )
+        return {phase: counts[i].copy() for i, phase in enumerate(self.phases)}
+
+    def slack_histogram(self):
+        return np.frombuffer(self.slack_counts, np.uint64).copy()
+
+    def summary(self):
+        """Returns the mean and maximum duration of every phase in seconds,
+        the minimum slack and the number of writes with a slack below the
+        threshold.
+        """
+        n_iterations = max(self.n_iterations, 1)
+        return dict(
+            mean_durations={
+                phase: self.total_durations[i] / n_iterations
+                for i, phase in enumerate(self.phases)
+            },
+            max_durations={
+                phase: self.max_durations[i] for i, phase in enumerate(self.phases)
+            },
+            min_slack=self.min_slack.value,
+            n_low_slack=self.n_low_slack.value,
+        )
+
+    def reset(self):
+        for array in [
+            self.duration_counts,
+            self.total_durations,
+            self.max_durations,
+            self.slack_counts,
+        ]:
+            array[:] = [0] * len(array)
+        self.min_slack.value = np.inf
+        self.n_low_slack.value = 0
@@ -1,4 +1,3 @@
-from multiprocessing import Queue
 from copy import deepcopy
 
 from sashimi.hardware.scanning.scanloops import (
@@ -9,6 +8,7 @@ from sashimi.hardware.scanning.scanloops import (
 )
 from sashimi.hardware.scanning import ScanningError
 from sashimi.hardware.scanning.mock import open_mockboard
+from sashimi.hardware.scanning.simulation import open_simulated_board
 
 try:
     from sashimi.hardware.scanning.ni import open_niboard
@@ -20,16 +20,17 @@ except ImportError:
 from warnings import warn
 from arrayqueues.shared_arrays import ArrayQueue
 
-from sashimi.utilities import get_last_parameters
 from sashimi.config import read_config
 from sashimi.processes.logging import LoggingProcess
+from sashimi.processes.mailbox import ParameterMailbox
+from sashimi.processes.scan_timing import ScanTiming
 from sashimi.events import LoggedEvent
 
 
 conf = read_config()
 
 # Dictionary of options for the context within which the scanning has to run.
-scan_conf_dict = dict(mock=open_mockboard)
+scan_conf_dict = dict(mock=open_mockboard, simulation=open_simulated_board)
 
 # Add NI context if available. NI board will be initialized there.
 if NI_AVAILABLE:
@@ -47,6 +48,13 @@ class ScannerProcess(LoggingProcess):
     start_experiment_from_scanner
     n_samples_waveform
     sample_rate
+    trigger_line
+        Line to which the mock board adds the camera pulses, for the
+        simulated camera.
+    waveform_points : int
+        Number of points of the recorded piezo waveform sent for display.
+    waveform_rate : float
+        Maximum number of times per second the waveform is sent.
 
     The actual implementation of the control of the scanning loop happens in the ScanLoop class and its children.
     In the run method we constantly control the parameters, and we "mount" in the Scanner process a ScanLoop object
@@ -63,25 +71,32 @@ class ScannerProcess(LoggingProcess):
         start_experiment_from_scanner=False,
         n_samples_waveform=10000,
         sample_rate=40000,
+        trigger_line=None,
+        waveform_points=2000,
+        waveform_rate=25.0,
     ):
         """"""
         super().__init__(name="scanner")
 
-        self.stop_event = stop_event.new_reference(self.logger)
+        self.stop_event = stop_event.new_reference(self.logger, self.doorbell)
         self.restart_event = restart_event.new_reference(self.logger)
         self.wait_signal = waiting_event.new_reference(self.logger)
 
-        self.parameter_queue = Queue()
+        self.parameter_mailbox = ParameterMailbox(doorbell=self.doorbell)
 
         self.waveform_queue = ArrayQueue(max_mbytes=100)
         self.n_samples = n_samples_waveform
         self.sample_rate = sample_rate
+        self.timing = ScanTiming(self.n_samples / self.sample_rate)
+        self.trigger_line = trigger_line
+        self.waveform_points = waveform_points
+        self.waveform_rate = waveform_rate
 
         self.parameters = ScanParameters()
         self.start_experiment_from_scanner = start_experiment_from_scanner
 
     def retrieve_parameters(self):
-        new_params = get_last_parameters(self.parameter_queue)
+        new_params = self.parameter_mailbox.get()
         if new_params is not None:
             self.parameters = new_params
 
@@ -91,9 +106,12 @@ class ScannerProcess(LoggingProcess):
         first_volume_run = True
         while not self.stop_event.is_set():
             if self.parameters.state == ScanningState.PAUSED:
+                self.wait_for_work(timeout=0.5)
                 self.retrieve_parameters()
                 continue
-            with configurator(self.sample_rate, self.n_samples, conf) as board:
+            with configurator(
+                self.sample_rate, self.n_samples, conf, trigger_line=self.trigger_line
+            ) as board:
                 if self.parameters.state == ScanningState.PLANAR:
                     loop = PlanarScanLoop
                 elif self.parameters.state == ScanningState.VOLUMETRIC:
@@ -104,13 +122,16 @@ class ScannerProcess(LoggingProcess):
                     self.stop_event,
                     self.restart_event,
                     self.parameters,
-                    self.parameter_queue,
+                    self.parameter_mailbox,
                     self.n_samples,
                     self.sample_rate,
                     self.waveform_queue,
                     self.wait_signal,
                     self.logger,
                     self.start_experiment_from_scanner,
+                    timing=self.timing,
+                    waveform_points=self.waveform_points,
+                    waveform_rate=self.waveform_rate,
                 )
                 try:
                     # A hack to skip the first time the volumetric scan loop is run
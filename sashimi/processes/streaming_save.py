@@ -1,18 +1,26 @@
-from multiprocessing import Queue
+from multiprocessing import Queue, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional
 from queue import Empty
-import flammkuchen as fl
+import tempfile
+import time
 import numpy as np
-import shutil
-import json
-from arrayqueues.shared_arrays import ArrayQueue
 from scopecuisine.notifiers import notifiers
 from sashimi.config import read_config
 from sashimi.processes.logging import LoggingProcess
+from sashimi.processes.volume_ring import VolumeRing
+from sashimi.processes.mailbox import ParameterMailbox
 from sashimi.events import LoggedEvent, SashimiEvents
 from sashimi.utilities import get_last_parameters
+from sashimi.storage import backend_class_dict
+from sashimi.storage.interface import AbstractStorageBackend
+from sashimi.storage.journal import chunk_entry
+from sashimi.storage.packing import storage_dtypes, stored_shape, store_volume
+from sashimi.storage.pyramid import PyramidWriter
+from sashimi.storage.recovery import recoverable_entries
+from sashimi.storage.spill import RawSpillBackend, transcode_spill
 
 conf = read_config()
 
@@ -29,6 +37,18 @@ class SavingParameters:
     volumerate: float = 1
     voxel_size: tuple = (1, 1, 1)
     crop: tuple = (0, 0, None, None)
+    n_writers: int = 2  # if 0, chunks are written by the saver process itself
+    max_chunks_in_flight: int = 2
+    backend: str = "h5"  # one of the keys of sashimi.storage.backend_class_dict
+    time_block: int = 10  # number of volumes per chunk in chunked formats
+    resume: bool = False  # if True, keep on writing an interrupted dataset
+    spill: bool = False  # if True, write uncompressed and compress after the experiment
+    codec: str = "blosclz"  # blosc compressor, see sashimi.storage.benchmark
+    clevel: int = 9
+    shuffle: str = "byte"
+    compression_threads: int = 1
+    storage_dtype: str = "uint16"  # one of sashimi.storage.packing.storage_dtypes
+    pyramid: bool = False  # if True, also save downsampled volumes and projections
 
 
 @dataclass
@@ -38,6 +58,415 @@ class SavingStatus:
     i_volume: int = 0
     i_chunk: int = 0
     n_volumes: int = 10
+    n_writers: int = 0
+    n_chunks_in_flight: int = 0
+    chunk_write_time: float = 0.0  # in seconds, for the last chunk written
+    writers_load: tuple = (0.0, 0.0, 0.0)  # total busy, idle and CPU time in s
+    n_chunks_transcoded: int = 0
+    n_chunks_to_transcode: int = 0
+
+
+@dataclass
+class ChunkWriteTask:
+    backend: AbstractStorageBackend
+    buffer_name: Optional[str]  # None if the chunk is already in a spill file
+    shape: tuple
+    dtype: str
+    n_volumes: int
+    i_chunk: int
+    pyramid: Optional[PyramidWriter] = None
+
+
+class ChunkWriter(LoggingProcess):
+    """Process that compresses and writes to disk the chunks that the StackSaver
+    hands over through shared memory, so that the saver can keep on receiving
+    volumes in the meantime. Processes are used instead of threads as writing
+    hdf5 files from multiple threads is not safe.
+    """
+
+    def __init__(
+        self, task_queue: Queue, done_queue: Queue, i_writer=0, name="chunk_writer"
+    ):
+        super().__init__(name=f"{name}_{i_writer}")
+        self.task_queue = task_queue
+        self.done_queue = done_queue
+
+    def run(self):
+        self.logger.log_message("started")
+        while True:
+            with self.idle():
+                task = self.task_queue.get()
+            if task is None:
+                break
+            start_time = time.perf_counter()
+            if task.buffer_name is None:
+                # the saver stored the volumes in the spill file itself:
+                buffer = None
+                task.backend.sync_chunk(task.i_chunk)
+                chunk = task.backend.read_chunk(task.i_chunk, task.n_volumes)
+            else:
+                buffer = SharedMemory(name=task.buffer_name)
+                # The buffer belongs to the saver, which is in charge of unlinking it:
+                resource_tracker.unregister(buffer._name, "shared_memory")
+                chunk = np.ndarray(task.shape, dtype=task.dtype, buffer=buffer.buf)
+                task.backend.write_chunk(task.i_chunk, chunk[: task.n_volumes])
+                if task.pyramid is not None:
+                    task.pyramid.write_chunk(task.i_chunk, chunk[: task.n_volumes])
+            write_time = time.perf_counter() - start_time
+            entry = chunk_entry(
+                task.i_chunk,
+                task.i_chunk * task.backend.chunk_size,
+                chunk[: task.n_volumes],
+            )
+            self.done_queue.put((task.i_chunk, write_time, entry))
+            self.logger.log_message(f"saved chunk {task.i_chunk}")
+            del chunk
+            if buffer is not None:
+                buffer.close()
+        self.close_log()
+
+
+class SpillTranscoder(LoggingProcess):
+    """Process that compresses a dataset spilled uncompressed by the saver into
+    its final format, reporting the number of chunks done on the progress queue.
+    It runs after the experiment, so that a new one can already be started.
+    """
+
+    def __init__(self, spill_backend: RawSpillBackend, pyramid=False):
+        super().__init__(name="spill_transcoder")
+        self.spill_backend = spill_backend
+        self.pyramid = pyramid
+        self.progress_queue = Queue()
+        self.progress = (0, 0)
+
+    def run(self):
+        self.logger.log_message("started")
+        transcode_spill(
+            self.spill_backend,
+            lambda n_done, n_total: self.progress_queue.put((n_done, n_total)),
+            pyramid=self.pyramid,
+        )
+        self.logger.log_message("finished transcoding")
+        self.close_log()
+
+
+class ChunkBufferRing:
+    """Ring of chunk buffers preallocated in shared memory. The saver fills a
+    buffer while the previous ones are being written, and the buffers are kept
+    across experiments as long as the shape of the chunks does not change, to
+    avoid allocating (and page-faulting) hundreds of MB at every start.
+
+    Parameters
+    ----------
+    shape : tuple
+        Shape of a chunk (n_volumes, n_planes, height, width).
+    dtype :
+        Data type of the chunks.
+    n_buffers : int
+        Number of buffers in the ring.
+
+    """
+
+    def __init__(self, shape, dtype, n_buffers):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        size = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.buffers = [SharedMemory(create=True, size=size) for _ in range(n_buffers)]
+        self.arrays = [
+            np.ndarray(self.shape, dtype=self.dtype, buffer=buffer.buf)
+            for buffer in self.buffers
+        ]
+        self.in_use = [False] * n_buffers
+        self.i_next = 0
+
+    @property
+    def n_buffers(self):
+        return len(self.buffers)
+
+    def matches(self, shape, dtype, n_buffers):
+        return (
+            self.shape == tuple(shape)
+            and self.dtype == np.dtype(dtype)
+            and self.n_buffers == n_buffers
+        )
+
+    def next_is_free(self):
+        return not self.in_use[self.i_next]
+
+    def acquire(self):
+        """Returns the index of the next buffer in the ring, which has to be free."""
+        i_buffer = self.i_next
+        self.in_use[i_buffer] = True
+        self.i_next = (self.i_next + 1) % self.n_buffers
+        return i_buffer
+
+    def release(self, i_buffer):
+        self.in_use[i_buffer] = False
+
+    def close(self):
+        self.arrays = []
+        for buffer in self.buffers:
+            buffer.close()
+            buffer.unlink()
+        self.buffers = []
+
+
+class ChunkWriterPool:
+    """Pool of ChunkWriter processes, living inside the saver process.
+    At most max_chunks_in_flight chunks can be waiting to be written at
+    any time. If the limit is reached, submitting blocks until a chunk is written.
+
+    Parameters
+    ----------
+    n_writers : int
+        Number of writer processes.
+    max_chunks_in_flight : int
+        Maximum number of chunks handed over and not yet written.
+    name : str
+        Name of the writers, numbered, for their logs.
+
+    """
+
+    def __init__(self, n_writers, max_chunks_in_flight, name="chunk_writer"):
+        self.n_writers = n_writers
+        self.max_chunks_in_flight = max(max_chunks_in_flight, 1)
+        self.task_queue = Queue()
+        self.done_queue = Queue()
+        self.writers = [
+            ChunkWriter(self.task_queue, self.done_queue, i_writer, name)
+            for i_writer in range(n_writers)
+        ]
+        for writer in self.writers:
+            writer.start()
+
+        # Ring buffers and backends of the chunks being written, by chunk number:
+        self.in_flight = dict()
+        self.last_write_time = 0.0
+
+    @property
+    def n_in_flight(self):
+        return len(self.in_flight)
+
+    @property
+    def load(self):
+        """Busy, idle and CPU time of all the writers together, in seconds."""
+        return tuple(sum(w.load[i] for w in self.writers) for i in range(3))
+
+    def submit(self, backend, buffer_ring, i_buffer, n_volumes, i_chunk, pyramid=None):
+        """Hand over a filled buffer of the ring to the writers. Once the chunk
+        is written, along with its pyramid levels if a PyramidWriter is given,
+        the buffer is released in the ring and the chunk is recorded in the journal
+        of the backend. If buffer_ring is None, the chunk has been stored in the
+        file of a RawSpillBackend, and the writers only sync it to the disk.
+        """
+        while self.n_in_flight >= self.max_chunks_in_flight:
+            self.collect(block=True)
+        self.in_flight[i_chunk] = (buffer_ring, i_buffer, backend)
+        self.task_queue.put(
+            ChunkWriteTask(
+                backend=backend,
+                buffer_name=(
+                    buffer_ring.buffers[i_buffer].name
+                    if buffer_ring is not None
+                    else None
+                ),
+                shape=(n_volumes, *backend.frame_shape),
+                dtype=np.dtype(backend.dtype).str,
+                n_volumes=n_volumes,
+                i_chunk=i_chunk,
+                pyramid=pyramid,
+            )
+        )
+
+    def collect(self, block=False):
+        """Release the buffers of the chunks that have been written, and record them
+        in the journal. If block is True, wait for at least one chunk to be written.
+        """
+        while self.n_in_flight > 0:
+            try:
+                i_chunk, write_time, entry = self.done_queue.get(block=block, timeout=1)
+            except Empty:
+                if block and not any(w.is_alive() for w in self.writers):
+                    raise RuntimeError("All chunk writers have stopped")
+                if block:
+                    continue
+                return
+            buffer_ring, i_buffer, backend = self.in_flight.pop(i_chunk)
+            if buffer_ring is not None:
+                buffer_ring.release(i_buffer)
+            backend.journal.append(entry)
+            self.last_write_time = write_time
+            block = False
+
+    def wait_all(self):
+        while self.n_in_flight > 0:
+            self.collect(block=True)
+
+    def shutdown(self):
+        self.wait_all()
+        for _ in self.writers:
+            self.task_queue.put(None)
+        for writer in self.writers:
+            writer.join()
+
+
+def backend_options(save_parameters):
+    return dict(
+        time_block=save_parameters.time_block,
+        codec=save_parameters.codec,
+        clevel=save_parameters.clevel,
+        shuffle=save_parameters.shuffle,
+        compression_threads=save_parameters.compression_threads,
+    )
+
+
+def create_backend(save_parameters, output_dir=None):
+    """Returns the storage backend for the saving parameters, writing in output_dir
+    if given instead of the experiment directory.
+    """
+    if output_dir is None:
+        output_dir = save_parameters.output_dir
+    options = backend_options(save_parameters)
+    if save_parameters.spill:
+        return RawSpillBackend(output_dir, save_parameters.backend, **options)
+    return backend_class_dict[save_parameters.backend](output_dir, **options)
+
+
+def create_pyramid(save_parameters, output_dir=None):
+    """Returns the PyramidWriter of the downsampled levels, saved in the same
+    format and with the same compression as the original volumes.
+    """
+    if output_dir is None:
+        output_dir = save_parameters.output_dir
+    options = backend_options(save_parameters)
+    backend_class = backend_class_dict[save_parameters.backend]
+    return PyramidWriter(
+        lambda name: backend_class(output_dir, name=name, **options),
+        save_parameters.storage_dtype,
+    )
+
+
+def optimal_chunk_size(backend, frame_shape, dtype, optimal_chunk_MB_RAM):
+    """Number of volumes in a chunk of about optimal_chunk_MB_RAM megabytes,
+    adjusted to the storage backend.
+    """
+    array_megabytes = np.dtype(dtype).itemsize * int(np.prod(frame_shape)) / 1048576
+    return backend.adjust_chunk_size(
+        max(int(optimal_chunk_MB_RAM / array_megabytes), 1)
+    )
+
+
+def measure_saving_rate(
+    volumes, save_parameters, n_chunks=None, work_dir=None, chunk_size=None
+):
+    """Measure how many volumes per second can be saved with the saving parameters,
+    by writing a few chunks of sample volumes as the StackSaver would, with the same
+    storage backend, chunk size and number of writers.
+
+    Parameters
+    ----------
+    volumes : np.ndarray
+        Sample volumes, repeated to fill the chunks, of shape
+        (n_volumes, n_planes, height, width).
+    save_parameters : SavingParameters
+        Parameters of the experiment.
+    n_chunks : int, optional
+        Number of chunks to write, by default one for every writer.
+    work_dir : Path, optional
+        Where to write the test files, by default in the experiment directory.
+    chunk_size : int, optional
+        Number of volumes in every chunk, by default the one the StackSaver
+        would use for these volumes.
+
+    Returns
+    -------
+    float
+        Volumes saved per second.
+
+    """
+    # the volumes are converted as the StackSaver would:
+    storage_dtype = save_parameters.storage_dtype
+    stored = np.empty(
+        (len(volumes), *stored_shape(volumes.shape[1:], storage_dtype)),
+        dtype=storage_dtypes[storage_dtype],
+    )
+    for volume, stored_volume in zip(volumes, stored):
+        store_volume(volume, stored_volume, storage_dtype)
+    volume_shape = volumes.shape[1:]
+    frame_shape = stored.shape[1:]
+
+    n_writers = save_parameters.n_writers
+    if n_chunks is None:
+        n_chunks = max(n_writers, 1)
+    if work_dir is None:
+        work_dir = Path(save_parameters.output_dir)
+        work_dir.mkdir(parents=True, exist_ok=True)
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as test_dir:
+        backend = create_backend(save_parameters, test_dir)
+        if chunk_size is None:
+            chunk_size = optimal_chunk_size(
+                backend, frame_shape, stored.dtype, save_parameters.optimal_chunk_MB_RAM
+            )
+        # one more chunk is written before starting to measure, to wait for the
+        # writers:
+        n_volumes = (n_chunks + 1) * chunk_size
+        backend.prepare(frame_shape, stored.dtype, n_volumes, chunk_size)
+        pyramid = None
+        if save_parameters.pyramid and not save_parameters.spill:
+            pyramid = create_pyramid(save_parameters, test_dir)
+            pyramid.prepare(volume_shape, n_volumes, chunk_size)
+
+        # as many buffers as the StackSaver, filled with the sample volumes:
+        writer_pool = None
+        n_buffers = 1
+        if n_writers > 0:
+            # named apart, not to write over the logs of the saver's writers:
+            writer_pool = ChunkWriterPool(
+                n_writers,
+                save_parameters.max_chunks_in_flight,
+                name="benchmark_chunk_writer",
+            )
+            n_buffers = writer_pool.max_chunks_in_flight + 1
+        buffer_ring = ChunkBufferRing(
+            (chunk_size, *frame_shape), stored.dtype, n_buffers
+        )
+        for chunk in buffer_ring.arrays:
+            np.take(stored, np.arange(chunk_size), axis=0, out=chunk, mode="wrap")
+
+        for i_chunk in range(n_chunks + 1):
+            if writer_pool is not None:
+                while not buffer_ring.next_is_free():
+                    writer_pool.collect(block=True)
+            i_buffer = buffer_ring.acquire()
+            if save_parameters.spill:
+                # the StackSaver stores the volumes in the spill files directly:
+                backend.chunk_array(i_chunk)[:] = buffer_ring.arrays[i_buffer]
+                buffer_ring.release(i_buffer)
+                if writer_pool is not None:
+                    writer_pool.submit(backend, None, None, chunk_size, i_chunk)
+                else:
+                    backend.sync_chunk(i_chunk)
+            elif writer_pool is not None:
+                writer_pool.submit(
+                    backend, buffer_ring, i_buffer, chunk_size, i_chunk, pyramid
+                )
+            else:
+                backend.write_chunk(i_chunk, buffer_ring.arrays[i_buffer])
+                if pyramid is not None:
+                    pyramid.write_chunk(i_chunk, buffer_ring.arrays[i_buffer])
+                buffer_ring.release(i_buffer)
+            if i_chunk == 0:
+                if writer_pool is not None:
+                    writer_pool.wait_all()
+                start_time = time.perf_counter()
+        if writer_pool is not None:
+            writer_pool.wait_all()
+        elapsed = time.perf_counter() - start_time
+        if writer_pool is not None:
+            writer_pool.shutdown()
+        buffer_ring.close()
+    return n_chunks * chunk_size / elapsed
 
 
 class StackSaver(LoggingProcess):
@@ -47,26 +476,45 @@ class StackSaver(LoggingProcess):
         is_saving_event: LoggedEvent,
         duration_queue: Queue,
         max_queue_size=2000,
+        volume_ring: Optional[VolumeRing] = None,
     ):
         super().__init__(name="saver")
-        self.stop_event = stop_event.new_reference(self.logger)
-        self.save_queue = ArrayQueue(max_mbytes=max_queue_size)
+        self.stop_event = stop_event.new_reference(self.logger, self.doorbell)
+        # volumes to save are received from the dispatcher through the ring:
+        if volume_ring is None:
+            volume_ring = VolumeRing(max_mbytes=max_queue_size, consumers=("saver",))
+        self.volume_ring = volume_ring
         self.saving_signal = is_saving_event
+        self.saving_signal.add_doorbell(self.doorbell)
         self.saver_stopped_signal = LoggedEvent(
             self.logger, SashimiEvents.SAVING_STOPPED
         )
         self.saving = False
-        self.saving_parameter_queue = Queue()
+        self.saving_parameter_mailbox = ParameterMailbox(doorbell=self.doorbell)
         self.save_parameters: Optional[SavingParameters] = SavingParameters()
         self.i_in_chunk = 0
         self.i_chunk = 0
         self.i_plane = 0
         self.i_volume = 0
         self.n_volumes = 10
+        self.n_volumes_resumed = 0
         self.current_data = None
+        # metadata of the frames of the saved volumes, in a table per volume:
+        self.frame_metadata = []
+        self.buffer_ring: Optional[ChunkBufferRing] = None
+        self.i_buffer = 0
+        self.writer_pool: Optional[ChunkWriterPool] = None
+        self.backend: Optional[AbstractStorageBackend] = None
+        self.pyramid: Optional[PyramidWriter] = None
+        self.chunk_write_time = 0.0
+        self.transcoders = []
         self.saved_status_queue = Queue()
+        # shape and dtype of the volumes as they are stored, which differ from
+        # the acquired volumes if they are packed:
         self.frame_shape = None
         self.dtype = np.uint16
+        self.volume_shape = None
+        self.storage_dtype = "uint16"
         self.duration_queue = duration_queue
         self.notifier = notifiers[conf["notifier"]]
 
@@ -76,25 +524,79 @@ class StackSaver(LoggingProcess):
             if self.saving_signal.is_set() and self.save_parameters is not None:
                 self.save_loop()
             else:
+                # the duration queue cannot be waited on, so it is checked at
+                # least every timeout:
+                self.wait_for_work(
+                    [t.progress_queue for t in self.transcoders],
+                    timeout=0.1,
+                )
                 self.receive_save_parameters()
+                if self.poll_transcoders():
+                    self.update_saved_status_queue()
+        if self.writer_pool is not None:
+            self.writer_pool.shutdown()
+        # spilled data has to be compressed before quitting:
+        for transcoder in self.transcoders:
+            transcoder.join()
+        if self.buffer_ring is not None:
+            self.buffer_ring.close()
         self.close_log()
 
+    def setup_writer_pool(self):
+        """Start the pool of chunk writers, or restart it if its settings
+        have changed since the last experiment.
+        """
+        n_writers = self.save_parameters.n_writers
+        max_in_flight = self.save_parameters.max_chunks_in_flight
+        if self.writer_pool is not None and (
+            self.writer_pool.n_writers != n_writers
+            or self.writer_pool.max_chunks_in_flight != max_in_flight
+        ):
+            self.writer_pool.shutdown()
+            self.writer_pool = None
+        if self.writer_pool is None and n_writers > 0:
+            self.writer_pool = ChunkWriterPool(n_writers, max_in_flight)
+
+    def create_backend(self):
+        return create_backend(self.save_parameters)
+
+    def start_transcoder(self):
+        transcoder = SpillTranscoder(self.backend, self.save_parameters.pyramid)
+        transcoder.progress = (0, self.i_chunk)
+        transcoder.start()
+        self.transcoders.append(transcoder)
+
+    def poll_transcoders(self):
+        """Update the progress of the transcoders, and forget the finished ones.
+        Returns True if anything changed.
+        """
+        changed = False
+        for transcoder in self.transcoders:
+            progress = get_last_parameters(transcoder.progress_queue)
+            if progress is not None:
+                transcoder.progress = progress
+                changed = True
+        running = [t for t in self.transcoders if t.is_alive()]
+        if len(running) < len(self.transcoders):
+            for transcoder in self.transcoders:
+                if not transcoder.is_alive():
+                    transcoder.join()
+            self.transcoders = running
+            changed = True
+        return changed
+
     def save_loop(self):
         notifier = self.notifier("lightsheet", **conf["notifier_options"])
-        # remove files if some are found at the save location
         Path(self.save_parameters.output_dir).mkdir(parents=True, exist_ok=True)
-        if (
-            Path(self.save_parameters.output_dir) / "original" / "stack_metadata.json"
-        ).is_file():
-            shutil.rmtree(Path(self.save_parameters.output_dir) / "original")
-
-        (Path(self.save_parameters.output_dir) / "original").mkdir(
-            parents=True, exist_ok=True
-        )
+        self.backend = self.create_backend()
+        self.pyramid = None
         self.i_in_chunk = 0
         self.i_chunk = 0
         self.i_volume = 0
+        self.n_volumes_resumed = 0
         self.current_data = None
+        self.frame_metadata = []
+        self.setup_writer_pool()
 
         while (
             self.i_volume < self.n_volumes
@@ -102,19 +604,30 @@ class StackSaver(LoggingProcess):
             and not self.stop_event.is_set()
         ):
             self.receive_save_parameters()
+            self.wait_for_work([self.volume_ring.queues["saver"]], timeout=0.01)
             try:
-                frame = self.save_queue.get(timeout=0.01)
-                self.logger.log_message("received volume")
-                self.fill_dataset(frame)
+                slot, volume, metadata = self.volume_ring.get(
+                    "saver", timeout=0.001, with_metadata=True
+                )
             except Empty:
-                pass
+                continue
+            self.logger.log_message("received volume")
+            self.fill_dataset(volume, metadata)
+            if self.volume_ring.release(slot):
+                self.logger.log_message(
+                    "volume ring laid out again while saving a volume, "
+                    "it could be corrupted"
+                )
 
         if self.i_volume > 0:
             if self.i_in_chunk != 0:
                 self.save_chunk()
+            if self.writer_pool is not None:
+                self.writer_pool.wait_all()
             self.update_saved_status_queue()
             self.finalize_dataset()
-            self.current_data = None
+            if self.save_parameters.spill:
+                self.start_transcoder()
             if self.saving_signal.is_set():
                 notifier.notify()
 
@@ -128,24 +641,161 @@ class StackSaver(LoggingProcess):
         self.i_volume = 0
         self.save_parameters = None
 
-    def fill_dataset(self, volume):
+    def fill_dataset(self, volume, metadata=None):
+        if self.i_volume == 0:
+            self.set_storage_format(volume)
+            if not (self.save_parameters.resume and self.resume_dataset()):
+                self.start_dataset()
+
+        if metadata is not None:
+            metadata["volume"] = self.n_volumes_resumed + self.i_volume
+            self.frame_metadata.append(metadata)
+
         if self.current_data is None:
-            self.calculate_optimal_size(volume)
-            self.current_data = np.empty(
-                (self.save_parameters.chunk_size, *volume.shape),
-                dtype=self.dtype,
-            )
+            self.current_data = self.acquire_buffer()
 
-        self.current_data[self.i_in_chunk, :, :, :] = volume
+        store_volume(volume, self.current_data[self.i_in_chunk], self.storage_dtype)
 
         self.i_volume += 1
         self.i_in_chunk += 1
         self.update_saved_status_queue()
 
-        if self.i_in_chunk == self.save_parameters.chunk_size:
+        if self.i_in_chunk == self.backend.chunk_size:
             self.save_chunk()
 
+    def set_storage_format(self, volume):
+        self.storage_dtype = self.save_parameters.storage_dtype
+        if self.storage_dtype not in storage_dtypes:
+            raise TypeError(
+                f"Saving data type {self.storage_dtype} not supported, "
+                f"only {', '.join(storage_dtypes.keys())} are"
+            )
+        self.volume_shape = volume.shape
+        self.frame_shape = stored_shape(volume.shape, self.storage_dtype)
+        self.dtype = storage_dtypes[self.storage_dtype]
+
+    def start_dataset(self):
+        self.calculate_optimal_size()
+        self.backend.prepare(
+            self.frame_shape,
+            self.dtype,
+            self.n_volumes,
+            self.save_parameters.chunk_size,
+        )
+        self.backend.start_journal(self.dataset_metadata())
+        if self.pyramid_enabled:
+            self.pyramid = create_pyramid(self.save_parameters)
+            self.pyramid.prepare(
+                self.volume_shape, self.n_volumes, self.backend.chunk_size
+            )
+        self.setup_buffer_ring()
+
+    @property
+    def spills_in_place(self):
+        # the volumes are stored straight into the spill files:
+        return self.save_parameters.spill
+
+    @property
+    def pyramid_enabled(self):
+        # spilled datasets get their pyramid when they are transcoded:
+        return self.save_parameters.pyramid and not self.save_parameters.spill
+
+    def resume_dataset(self):
+        """Keep on writing the interrupted dataset found at the saving location,
+        after the chunks recorded in its journal. If the last chunk was not full,
+        it is read back and completed with the new volumes.
+
+        Returns
+        -------
+        bool
+            False if there is no dataset that can be resumed with the
+            current volume shape.
+
+        """
+        if not self.backend.journal.exists():
+            self.logger.log_message("no dataset to resume")
+            return False
+        header, entries = recoverable_entries(self.backend, verify=False)
+        if (
+            tuple(header["frame_shape"]) != tuple(self.frame_shape)
+            or np.dtype(header["dtype"]) != np.dtype(self.dtype)
+            or header["metadata"].get("packing") != self.packing
+        ):
+            self.logger.log_message("could not resume, volume format changed")
+            return False
+
+        self.backend.resume(header)
+        self.backend.discard_chunks(len(entries))
+        self.backend.journal.start(header, entries)
+        self.save_parameters.chunk_size = self.backend.chunk_size
+        self.setup_buffer_ring()
+
+        self.i_chunk = len(entries)
+        self.n_volumes_resumed = entries[-1]["volumes"][1] if len(entries) > 0 else 0
+        self.backend.set_n_volumes(self.n_volumes_resumed + self.n_volumes)
+        if self.pyramid_enabled:
+            self.pyramid = create_pyramid(self.save_parameters)
+            self.pyramid.resume(
+                self.volume_shape,
+                self.n_volumes_resumed + self.n_volumes,
+                self.backend.chunk_size,
+            )
+        if len(entries) > 0 and entries[-1]["shape"][0] < self.backend.chunk_size:
+            self.i_chunk -= 1
+            self.i_in_chunk = entries[-1]["shape"][0]
+            self.current_data = self.acquire_buffer()
+            if not self.spills_in_place:
+                self.current_data[: self.i_in_chunk] = self.backend.read_chunk(
+                    self.i_chunk, self.i_in_chunk
+                )
+        if self.frame_metadata_path.is_file():
+            metadata = np.load(self.frame_metadata_path)
+            self.frame_metadata = [
+                metadata[metadata["volume"] < self.n_volumes_resumed]
+            ]
+        self.logger.log_message(f"resumed dataset at chunk {self.i_chunk}")
+        return True
+
+    def setup_buffer_ring(self):
+        """Allocate the chunk buffers, unless the ones from the previous
+        experiment can be reused. No buffers are needed when spilling, as the
+        volumes are stored in the spill files.
+        """
+        if self.spills_in_place:
+            return
+        chunk_shape = (self.backend.chunk_size, *self.frame_shape)
+        if self.writer_pool is not None:
+            # one buffer being filled while the others are being written:
+            n_buffers = self.writer_pool.max_chunks_in_flight + 1
+        else:
+            n_buffers = 1
+        if self.buffer_ring is not None and not self.buffer_ring.matches(
+            chunk_shape, self.dtype, n_buffers
+        ):
+            self.buffer_ring.close()
+            self.buffer_ring = None
+        if self.buffer_ring is None:
+            self.buffer_ring = ChunkBufferRing(chunk_shape, self.dtype, n_buffers)
+            self.logger.log_message("allocated chunk buffers")
+
+    def acquire_buffer(self):
+        """Returns the next buffer of the ring, waiting for it to be written
+        if it is still in use. When spilling, returns the preallocated spill
+        file of the chunk instead.
+        """
+        if self.spills_in_place:
+            self.i_buffer = None
+            return self.backend.chunk_array(self.i_chunk)
+        while not self.buffer_ring.next_is_free():
+            self.writer_pool.collect(block=True)
+        self.i_buffer = self.buffer_ring.acquire()
+        return self.buffer_ring.arrays[self.i_buffer]
+
     def update_saved_status_queue(self):
+        self.poll_transcoders()
+        if self.writer_pool is not None:
+            self.writer_pool.collect()
+            self.chunk_write_time = self.writer_pool.last_write_time
         self.saved_status_queue.put(
             SavingStatus(
                 target_params=self.save_parameters,
@@ -153,56 +803,113 @@ class StackSaver(LoggingProcess):
                 i_chunk=self.i_chunk,
                 i_volume=self.i_volume,
                 n_volumes=self.n_volumes,
+                n_writers=(
+                    self.writer_pool.n_writers if self.writer_pool is not None else 0
+                ),
+                n_chunks_in_flight=(
+                    self.writer_pool.n_in_flight if self.writer_pool is not None else 0
+                ),
+                chunk_write_time=self.chunk_write_time,
+                writers_load=(
+                    self.writer_pool.load
+                    if self.writer_pool is not None
+                    else (0.0, 0.0, 0.0)
+                ),
+                n_chunks_transcoded=sum(t.progress[0] for t in self.transcoders),
+                n_chunks_to_transcode=sum(t.progress[1] for t in self.transcoders),
             )
         )
 
+    def dataset_metadata(self, n_volumes=None):
+        """Returns the metadata of the dataset, with n_volumes volumes, by
+        default the planned ones.
+        """
+        if n_volumes is None:
+            n_volumes = self.n_volumes_resumed + self.n_volumes
+        return {
+            "shape_full": (
+                n_volumes,
+                *self.frame_shape,
+            ),
+            "shape_block": (
+                self.backend.chunk_size,
+                *self.frame_shape,
+            ),
+            "crop": self.save_parameters.crop,  # order of params here is [hpos, vpos, hsize, vsize,]
+            "padding": [0, 0, 0, 0],
+            "voxel_size": self.save_parameters.voxel_size,
+            # to restore the volumes with sashimi.storage.packing.restore_volumes:
+            "dtype": "uint8" if self.storage_dtype == "uint8" else "uint16",
+            "packing": self.packing,
+            "volume_shape": self.volume_shape,
+        }
+
+    @property
+    def packing(self):
+        return "12bit" if self.storage_dtype == "uint12" else None
+
+    @property
+    def frame_metadata_path(self):
+        return Path(self.save_parameters.output_dir) / "frame_metadata.npy"
+
+    def save_frame_metadata(self):
+        """Save the metadata of all the frames of the saved volumes as a table,
+        with the dtype sashimi.processes.frame_ring.frame_metadata_dtype, in
+        which the lost frames have a frame_number of -1.
+        """
+        if len(self.frame_metadata) > 0:
+            np.save(self.frame_metadata_path, np.concatenate(self.frame_metadata))
+
     def finalize_dataset(self):
         self.logger.log_message("finished saving")
-        with open(
-            (
-                Path(self.save_parameters.output_dir)
-                / "original"
-                / "stack_metadata.json"
-            ),
-            "w",
-        ) as f:
-            json.dump(
-                {
-                    "shape_full": (
-                        self.n_volumes,
-                        *self.current_data.shape[1:],
-                    ),
-                    "shape_block": (
-                        self.save_parameters.chunk_size,
-                        *self.current_data.shape[1:],
-                    ),
-                    "crop": self.save_parameters.crop,  # order of params here is [hpos, vpos, hsize, vsize,]
-                    "padding": [0, 0, 0, 0],
-                    "voxel_size": self.save_parameters.voxel_size,
-                },
-                f,
-            )
+        self.save_frame_metadata()
+        # the experiment could have been stopped before the planned duration:
+        n_volumes_saved = self.n_volumes_resumed + self.i_volume
+        metadata = self.dataset_metadata(n_volumes_saved)
+        self.backend.finalize(metadata, n_volumes_saved)
+        if self.pyramid is not None:
+            self.pyramid.finalize(metadata, n_volumes_saved)
 
     def save_chunk(self):
-        self.logger.log_message("saved chunk")
-        fl.save(
-            Path(self.save_parameters.output_dir)
-            / "original/{:04d}.h5".format(self.i_chunk),
-            {"stack_4D": self.current_data[: self.i_in_chunk, :, :, :]},
-            compression="blosc",
-        )
+        if self.writer_pool is not None:
+            # The filled buffer is handed over to the writers, and the next
+            # one in the ring is used when the next volume arrives:
+            self.writer_pool.submit(
+                self.backend,
+                None if self.spills_in_place else self.buffer_ring,
+                self.i_buffer,
+                self.i_in_chunk,
+                self.i_chunk,
+                self.pyramid,
+            )
+            self.logger.log_message("handed over chunk")
+        else:
+            start_time = time.perf_counter()
+            data = self.current_data[: self.i_in_chunk, :, :, :]
+            if self.spills_in_place:
+                self.backend.sync_chunk(self.i_chunk)
+            else:
+                self.backend.write_chunk(self.i_chunk, data)
+            if self.pyramid is not None:
+                self.pyramid.write_chunk(self.i_chunk, data)
+            self.chunk_write_time = time.perf_counter() - start_time
+            self.backend.journal.append(
+                chunk_entry(self.i_chunk, self.i_chunk * self.backend.chunk_size, data)
+            )
+            del data
+            if not self.spills_in_place:
+                self.buffer_ring.release(self.i_buffer)
+            self.logger.log_message("saved chunk")
+        self.current_data = None
         self.i_in_chunk = 0
         self.i_chunk += 1
 
-    def calculate_optimal_size(self, volume):
-        if self.dtype == np.uint16:
-            array_megabytes = (
-                2 * volume.shape[0] * volume.shape[1] * volume.shape[2] / 1048576
-            )
-        else:
-            raise TypeError("Saving data type not supported. Only uint16 is supported")
-        self.save_parameters.chunk_size = int(
-            self.save_parameters.optimal_chunk_MB_RAM / array_megabytes
+    def calculate_optimal_size(self):
+        self.save_parameters.chunk_size = optimal_chunk_size(
+            self.backend,
+            self.frame_shape,
+            self.dtype,
+            self.save_parameters.optimal_chunk_MB_RAM,
         )
 
     def receive_save_parameters(self):
@@ -210,7 +917,7 @@ class StackSaver(LoggingProcess):
         from either the `EsternalTrigger` or the `State` if triggering is disabled.
         """
         # Get parameters:
-        parameters = get_last_parameters(self.saving_parameter_queue)
+        parameters = self.saving_parameter_mailbox.get()
         if parameters is not None:
             self.save_parameters = parameters
 
@@ -220,3 +927,7 @@ class StackSaver(LoggingProcess):
             self.n_volumes = int(
                 np.ceil(self.save_parameters.volumerate * new_duration)
             )
+            if self.backend is not None and self.i_volume > 0:
+                self.backend.set_n_volumes(self.n_volumes_resumed + self.n_volumes)
+                if self.pyramid is not None:
+                    self.pyramid.set_n_volumes(self.n_volumes_resumed + self.n_volumes)
@@ -0,0 +1,179 @@
+from multiprocessing import Array, Lock, Value
+from queue import Empty, Full
+
+import numpy as np
+from arrayqueues.portable_queue import PortableQueue
+
+
+class VolumeRing:
+    """Ring of volume slots in shared memory, through which the dispatcher hands
+    the same volume to the viewer and the saver without copying it. The dispatcher
+    assembles the planes of a volume directly in a free slot and publishes it to
+    some of the consumers, which receive the slot number on their own queue and
+    read the volume in place. Every slot keeps count of the consumers which have
+    not released it yet, and is reused only once they all have.
+
+    The slots are laid out for the shape of the volumes being acquired. When the
+    shape changes, the ring is laid out again and the volumes not yet received
+    are dropped. The consumers still holding a volume of the previous layout can
+    find out with is_stale or when releasing it, as it could have been written
+    over in the meantime.
+
+    Parameters
+    ----------
+    max_mbytes : float
+        Size of the ring, the number of slots depends on the size of the volumes.
+    consumers : tuple of str
+        Names of the consumers the volumes can be published to.
+    max_slots : int
+        Maximum number of slots, for small volumes.
+
+    """
+
+    def __init__(self, max_mbytes=2000, consumers=("viewer", "saver"), max_slots=4096):
+        self.maxbytes = int(max_mbytes * 1000000)
+        self.array = Array("c", self.maxbytes, lock=False)
+        self.refcounts = Array("i", max_slots, lock=False)
+        self.lock = Lock()
+        # incremented at every change of layout, to ignore slots of the old one:
+        self.generation = Value("i", 0, lock=False)
+        # references to slots of previous layouts, not released yet:
+        self.n_stale = Value("i", 0, lock=False)
+        self.queues = {name: PortableQueue() for name in consumers}
+
+        # layout of the slots, set up in each process from the volumes it gets:
+        self.slots = None
+        self.slots_generation = -1
+        self.i_next = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["slots"] = None
+        state["slots_generation"] = -1
+        return state
+
+    @property
+    def n_slots(self):
+        return 0 if self.slots is None else len(self.slots)
+
+    def layout(self, shape, dtype, generation):
+        dtype = np.dtype(dtype)
+        n_slots = min(
+            self.maxbytes // (dtype.itemsize * int(np.prod(shape))),
+            len(self.refcounts),
+        )
+        self.slots = np.frombuffer(
+            self.array, dtype, n_slots * int(np.prod(shape))
+        ).reshape((n_slots, *shape))
+        self.slots_generation = generation
+
+    def acquire(self, shape, dtype=np.uint16):
+        """Returns the number of a free slot to write a volume of the given shape
+        in, or None if all the slots are in use.
+        """
+        if (
+            self.slots is None
+            or self.slots.shape[1:] != tuple(shape)
+            or self.slots.dtype != np.dtype(dtype)
+        ):
+            with self.lock:
+                # the slots still referenced belong to the old layout from now on:
+                self.n_stale.value += sum(self.refcounts)
+                self.generation.value += 1
+                for i_slot in range(len(self.refcounts)):
+                    self.refcounts[i_slot] = 0
+                self.layout(shape, dtype, self.generation.value)
+            for name in self.queues.keys():
+                self.clear(name)
+            self.i_next = 0
+
+        with self.lock:
+            for i_offset in range(self.n_slots):
+                i_slot = (self.i_next + i_offset) % self.n_slots
+                if self.refcounts[i_slot] == 0:
+                    # the slot is held by the dispatcher until it is published:
+                    self.refcounts[i_slot] = 1
+                    self.i_next = (i_slot + 1) % self.n_slots
+                    return i_slot
+        return None
+
+    def slot(self, i_slot):
+        return self.slots[i_slot]
+
+    def publish(self, i_slot, consumers, metadata=None):
+        """Send a filled slot to the consumers, with the metadata of its frames
+        if given. If there are none, the slot is free again.
+        """
+        with self.lock:
+            self.refcounts[i_slot] += len(consumers) - 1
+        for name in consumers:
+            self.queues[name].put(
+                (
+                    self.slots_generation,
+                    i_slot,
+                    self.slots.shape[1:],
+                    self.slots.dtype.str,
+                    metadata,
+                )
+            )
+
+    def put(self, volume, consumers=None):
+        """Copy a volume in a free slot and publish it, raising queue.Full
+        if all the slots are in use.
+        """
+        i_slot = self.acquire(volume.shape, volume.dtype)
+        if i_slot is None:
+            raise Full(f"All the {self.n_slots} volume slots are in use")
+        self.slots[i_slot] = volume
+        self.publish(i_slot, self.queues.keys() if consumers is None else consumers)
+
+    def get(self, consumer, timeout=0.01, with_metadata=False):
+        """Returns the next volume published to the consumer, together with its
+        slot, which has to be released once the volume is not used anymore,
+        and if with_metadata is True with the metadata of its frames.
+        Raises queue.Empty if no volume arrives within timeout seconds.
+        """
+        while True:
+            generation, i_slot, shape, dtype, metadata = self.queues[consumer].get(
+                timeout=timeout
+            )
+            if generation == self.generation.value:
+                break
+            self.release((generation, i_slot))
+        if self.slots_generation != generation:
+            self.layout(shape, dtype, generation)
+        if with_metadata:
+            return (generation, i_slot), self.slots[i_slot], metadata
+        return (generation, i_slot), self.slots[i_slot]
+
+    def is_stale(self, slot):
+        """Returns True if the slot is of a previous layout of the ring, and
+        its volume could have been written over.
+        """
+        return slot[0] != self.generation.value
+
+    def release(self, slot):
+        """Give back a slot. Returns True if it was of a previous layout of
+        the ring, see is_stale.
+        """
+        generation, i_slot = slot
+        with self.lock:
+            if generation != self.generation.value:
+                self.n_stale.value -= 1
+                return True
+            self.refcounts[i_slot] -= 1
+        return False
+
+    def clear(self, consumer):
+        """Release all the volumes waiting for the consumer."""
+        queue = self.queues[consumer]
+        while queue.qsize() > 0:
+            try:
+                # items just put can take a moment to be readable:
+                generation, i_slot, _, _, _ = queue.get(timeout=0.01)
+            except Empty:
+                break
+            self.release((generation, i_slot))
+
+    def qsize(self, consumer):
+        return self.queues[consumer].qsize()
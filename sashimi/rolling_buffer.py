@@ -1,72 +1,101 @@
 import numpy as np
-from numba import jit
 
 
-@jit(nopython=True)
-def read_circular(a, i_start, n):
-    output = np.zeros(n)
-    n_el = len(a)
-    i_read = i_start % len(a)
-    for i_insert in range(n):
-        output[i_insert] = a[i_read]
-        i_read = (i_read + 1) % n_el
-    return output
+def circular_slices(length, i_start, n):
+    """Returns the (start, end) of the at most two contiguous parts of the n
+    elements of a circular buffer of the given length from i_start on, with
+    n not larger than the length.
+    """
+    i_start = i_start % length
+    if i_start + n <= length:
+        return [(i_start, i_start + n)]
+    return [(i_start, length), (0, i_start + n - length)]
 
 
-@jit(nopython=True)
-def write_circular(a, i_start, data):
-    # TODO remove redundant writing
-    i_insert = i_start % len(a)
-    n_el = len(a)
-    for i_read in range(len(data)):
-        a[i_insert] = data[i_read]
-        i_insert = (i_insert + 1) % n_el
+def read_circular(a, i_start, n, out=None):
+    if out is None:
+        out = np.empty(n, a.dtype)
+    if n > len(a):
+        # the buffer is read more than once:
+        return np.take(a, np.arange(i_start, i_start + n), out=out, mode="wrap")
+    i_out = 0
+    for start, end in circular_slices(len(a), i_start, n):
+        out[i_out : i_out + end - start] = a[start:end]
+        i_out += end - start
+    return out
 
 
-@jit(nopython=True)
-def fill_circular(a, i_start, n_fill, val):
-    # TODO remove redundant writing
-    i_insert = i_start
-    n_el = len(a)
-    for i_read in range(n_fill):
-        a[i_insert] = val
-        i_insert = (i_insert + 1) % n_el
+def write_circular(a, i_start, data):
+    if len(data) > len(a):
+        # only the last values remain in the buffer:
+        i_start += len(data) - len(a)
+        data = data[len(data) - len(a) :]
+    i_data = 0
+    for start, end in circular_slices(len(a), i_start, len(data)):
+        a[start:end] = data[i_data : i_data + end - start]
+        i_data += end - start
 
 
 class RollingBuffer:
+    """Circular buffer, read and written with at most two slice copies."""
+
     def __init__(self, length):
         self.buffer = np.zeros(length)
 
-    def read(self, start, n_samples_total):
-        """Function to read from circular numpy buffer
+    def read(self, start, n_samples_total, out=None):
+        """Read from the circular buffer.
+
+        Parameters
+        ----------
+        start : int
+            First sample read, wrapped around the length of the buffer.
+        n_samples_total : int
+            Number of samples read, wrapping around the buffer if needed.
+        out : np.ndarray, optional
+            Array in which the samples are read, a new one by default.
+
+        Returns
+        -------
+        np.ndarray
+            The samples read.
 
-        :param arr:
-        :param start:
-        :param n_samples:
-        :return:
         """
-        return read_circular(self.buffer, start, n_samples_total)
+        return read_circular(self.buffer, start, n_samples_total, out)
 
     def write(self, to_write, start):
-        """Function to write to circular numpy buffer
+        """Write to the circular buffer.
+
+        Parameters
+        ----------
+        to_write : np.ndarray
+            Samples written, wrapping around the buffer if needed.
+        start : int
+            Position of the first sample written.
 
-        :param arr:
-        :param to_write: array to fill the buffer
-        :param start:
-        :param n_samples:
-        :return:
         """
         write_circular(self.buffer, start, to_write)
 
 
 class FillingRollingBuffer(RollingBuffer):
+    """Circular buffer keeping count of the samples written at least once."""
+
     def __init__(self, length):
         super().__init__(length)
-        self.filled = np.zeros(length, dtype=np.bool)
+        self.filled = np.zeros(length, dtype=bool)
+        self.n_filled = 0
 
     def write(self, to_write, start):
         super().write(to_write, start)
-        fill_circular(self.filled, start, len(to_write), True)
+        if self.is_complete():
+            return
+        n_write = min(len(to_write), len(self.buffer))
+        for i_start, i_end in circular_slices(
+            len(self.buffer), start + len(to_write) - n_write, n_write
+        ):
+            self.n_filled += (
+                i_end - i_start - np.count_nonzero(self.filled[i_start:i_end])
+            )
+            self.filled[i_start:i_end] = True
 
     def is_complete(self):
-        return np.all(self.filled)
+        return self.n_filled == len(self.buffer)
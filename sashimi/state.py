@@ -22,6 +22,8 @@ from sashimi.hardware.scanning.scanloops import (
 )
 from sashimi.processes.external_communication import ExternalComm
 from sashimi.processes.dispatcher import VolumeDispatcher
+from sashimi.processes.volume_ring import VolumeRing
+from sashimi.hardware.cameras.simulation import TriggerLine
 from sashimi.processes.logging import ConcurrenceLogger
 from multiprocessing import Event
 import json
@@ -31,7 +33,21 @@ from sashimi.processes.camera import (
     CameraMode,
     TriggerMode,
 )
-from sashimi.processes.streaming_save import StackSaver, SavingParameters, SavingStatus
+from sashimi.processes.streaming_save import (
+    StackSaver,
+    SavingParameters,
+    SavingStatus,
+    measure_saving_rate,
+)
+from sashimi.storage import backend_class_dict
+from sashimi.storage.packing import storage_dtypes
+from sashimi.storage.benchmark import (
+    benchmark_compression,
+    ThroughputCheck,
+    check_throughput,
+    choose_compression,
+    synthetic_volumes,
+)
 from sashimi.events import LoggedEvent, SashimiEvents
 from pathlib import Path
 from enum import Enum
@@ -57,6 +73,19 @@ class SaveSettings(ParametrizedQt):
         self.save_dir = Param(conf["default_paths"]["data"], gui=False)
         self.notification_email = Param("")
         self.overwrite_save_folder = Param(0, (0, 1), gui=False, loadable=False)
+        self.n_writers = Param(2, (0, 16))
+        self.max_chunks_in_flight = Param(2, (1, 16))
+        self.file_format = Param("h5", list(backend_class_dict.keys()))
+        self.time_block = Param(10, (1, 1000), unit="volumes")
+        self.resume = Param(False, [False, True])
+        self.spill = Param(False, [False, True])
+        self.codec = Param("blosclz", ["blosclz", "lz4", "zstd"])
+        self.compression_level = Param(9, (0, 9))
+        self.shuffle = Param("byte", ["none", "byte", "bit"])
+        self.compression_threads = Param(1, (1, 16))
+        self.check_throughput = Param(True, [True, False])
+        self.storage_dtype = Param("uint16", list(storage_dtypes.keys()))
+        self.pyramid = Param(False, [False, True])
 
 
 class TriggerSettings(ParametrizedQt):
@@ -246,6 +275,18 @@ def get_voxel_size(
     )
 
 
+def get_frame_shape(camera_settings: CameraSettings):
+    """Shape of the frames the camera sends with the current ROI and binning.
+    The ROI is in pixels of the binned image, and is set on the sensor in
+    multiples of 4 sensor pixels.
+    """
+    binning = int(camera_settings.binning)
+    # the ROI is [vpos, hpos, vsize, hsize]:
+    return tuple(
+        (int(size) * binning // 4) * 4 // binning for size in camera_settings.roi[2:]
+    )
+
+
 def convert_save_params(
     save_settings: SaveSettings,
     scanning_settings: Union[ZRecordingSettings, SinglePlaneSettings],
@@ -263,6 +304,18 @@ def convert_save_params(
         output_dir=Path(save_settings.save_dir),
         n_planes=n_planes,
         notification_email=str(save_settings.notification_email),
+        n_writers=int(save_settings.n_writers),
+        max_chunks_in_flight=int(save_settings.max_chunks_in_flight),
+        backend=save_settings.file_format,
+        time_block=int(save_settings.time_block),
+        resume=bool(save_settings.resume),
+        spill=bool(save_settings.spill),
+        codec=save_settings.codec,
+        clevel=int(save_settings.compression_level),
+        shuffle=save_settings.shuffle,
+        compression_threads=int(save_settings.compression_threads),
+        storage_dtype=save_settings.storage_dtype,
+        pyramid=bool(save_settings.pyramid),
         volumerate=scanning_settings.frequency,
         voxel_size=get_voxel_size(scanning_settings, camera_settings),
         crop=[
@@ -340,11 +393,14 @@ class State:
         self.experiment_state = ExperimentPrepareState.PREVIEW
         self.status = ScanningSettings()
 
+        # camera pulses of the mock board, followed by the simulated camera:
+        self.trigger_line = TriggerLine()
         self.scanner = ScannerProcess(
             stop_event=self.stop_event,
             restart_event=self.restart_event,
             waiting_event=self.is_waiting_event,
             sample_rate=self.sample_rate,
+            trigger_line=self.trigger_line,
         )
         self.camera_settings = CameraSettings()
         self.trigger_settings = TriggerSettings()
@@ -362,6 +418,7 @@ class State:
             stop_event=self.stop_event,
             wait_event=self.scanner.wait_signal,
             exp_trigger_event=self.experiment_start_event,
+            trigger_line=self.trigger_line,
         )
 
         self.multiprocessing_manager = MultiprocessingManager()
@@ -376,10 +433,15 @@ class State:
             duration_queue=self.experiment_duration_queue,
         )
 
+        self.volume_ring = VolumeRing(consumers=("viewer", "saver"))
+        # slot of the volume being displayed, released when the next one arrives:
+        self.viewer_slot = None
+
         self.saver = StackSaver(
             stop_event=self.stop_event,
             is_saving_event=self.is_saving_event,
             duration_queue=self.experiment_duration_queue,
+            volume_ring=self.volume_ring,
         )
 
         self.dispatcher = VolumeDispatcher(
@@ -387,8 +449,8 @@ class State:
             saving_signal=self.saver.saving_signal,
             wait_signal=self.scanner.wait_signal,
             noise_subtraction_on=self.noise_subtraction_active,
-            camera_queue=self.camera.image_queue,
-            saver_queue=self.saver.save_queue,
+            frame_ring=self.camera.frame_ring,
+            volume_ring=self.volume_ring,
         )
 
         self.camera_settings = CameraSettings()
@@ -407,6 +469,9 @@ class State:
         )
 
         self.save_status: Optional[SavingStatus] = None
+        self.throughput_check: Optional[ThroughputCheck] = None
+        # measured saving rates, by volume shape and saving settings:
+        self.saving_rates = dict()
 
         self.single_plane_settings = SinglePlaneSettings()
         self.volume_setting = ZRecordingSettings()
@@ -459,8 +524,8 @@ class State:
         self.send_scansave_settings()
 
     def send_camera_settings(self):
-        self.camera.image_queue.clear()
-        self.camera.parameter_queue.put(self.camera_params)
+        self.camera.frame_ring.clear()
+        self.camera.parameter_mailbox.put(self.camera_params)
 
     def send_scan_settings(self, param_changed=None):
         # Restart scanning loop if scanning params have changed:
@@ -566,12 +631,12 @@ class State:
         if self.global_state == GlobalState.VOLUME_PREVIEW:
             self.current_plane = min(self.current_plane, self.n_planes - 1)
 
-        self.scanner.parameter_queue.put(self.scan_params)
-        self.external_comm.current_settings_queue.put(self.all_settings)
+        self.scanner.parameter_mailbox.put(self.scan_params)
+        self.external_comm.current_settings_mailbox.put(self.all_settings)
 
         self.voxel_size = get_voxel_size(self.volume_setting, self.camera_settings)
-        self.saver.saving_parameter_queue.put(self.save_params)
-        self.dispatcher.n_planes_queue.put(self.n_planes)
+        self.saver.saving_parameter_mailbox.put(self.save_params)
+        self.dispatcher.n_planes_mailbox.put(self.n_planes)
 
     def start_experiment(self) -> None:
         """
@@ -583,8 +648,8 @@ class State:
         self.scanner.wait_signal.set()
         self.send_scansave_settings()
         self.restart_event.set()
-        self.saver.save_queue.empty()
-        self.camera.image_queue.empty()
+        self.volume_ring.clear("saver")
+        self.camera.frame_ring.clear()
         time.sleep(0.01)
         self.is_saving_event.set()
 
@@ -596,7 +661,7 @@ class State:
         self.logger.log_message("experiment ended")
         self.is_saving_event.clear()
         self.experiment_start_event.clear()
-        self.saver.save_queue.clear()
+        self.volume_ring.clear("saver")
         self.send_scansave_settings()
         self.current_exp_state = GlobalState.PAUSED
 
@@ -674,16 +739,220 @@ class State:
         self.calibration_ref = None
         self.noise_subtraction_active.clear()
 
+    def set_flat_field(self, gain_map=None):
+        """Set the gain of every pixel of the camera, by which the frames are
+        multiplied after the noise subtraction, or stop the flat-field correction
+        if gain_map is None. The correction is applied only while the noise
+        subtraction is active, and if the gain map has the shape of the frames.
+
+        Parameters
+        ----------
+        gain_map : np.ndarray, optional
+            Gain of every pixel, e.g. the mean of a flat-field image divided by it.
+
+        """
+        if gain_map is not None:
+            gain_map = np.ascontiguousarray(gain_map, dtype=np.float32)
+        self.dispatcher.gain_map_queue.put(gain_map)
+
     def get_volume(self):
         # TODO consider get_last_parameters method
         try:
-            return self.dispatcher.viewer_queue.get(timeout=0.001)
+            slot, volume = self.volume_ring.get("viewer", timeout=0.001)
         except Empty:
             return None
+        # the volume is read in place in the ring, so the previous one is
+        # released only now that it is not displayed anymore:
+        if self.viewer_slot is not None:
+            self.volume_ring.release(self.viewer_slot)
+        self.viewer_slot = slot
+        return volume
+
+    def get_sample_volumes(self, n_volumes=2, timeout=2.0):
+        """Returns n_volumes volumes from the preview, or synthetic ones of the
+        size of the camera frames with the current ROI and binning if the preview
+        does not provide them within timeout seconds.
+        """
+        volumes = []
+        start_time = time.time()
+        while len(volumes) < n_volumes and time.time() - start_time < timeout:
+            volume = self.get_volume()
+            if volume is not None:
+                volumes.append(volume.copy())
+        if len(volumes) == n_volumes:
+            return np.stack(volumes)
+        volume_shape = (
+            max(self.save_params.n_planes, 1),
+            *get_frame_shape(self.camera_settings),
+        )
+        return synthetic_volumes(volume_shape, n_volumes)
+
+    def overwrites_dataset(self):
+        """Returns True if starting the experiment would overwrite a dataset
+        at the saving location: a dataset is there, and it is not resumed
+        because resuming is off or it has no valid journal.
+        """
+        backend = backend_class_dict[self.save_settings.file_format](
+            Path(self.save_settings.save_dir)
+        )
+        if not backend.has_dataset():
+            return False
+        return not (self.save_settings.resume and backend.journal.is_valid())
+
+    def check_saving_throughput(self, volumes=None):
+        """Measure how fast sample volumes are saved with the current settings,
+        on the saving disk, and project whether the saving queue would overflow
+        over the experiment. The saving rate is measured once for every volume
+        shape and set of saving settings. This is slow, and can be called from
+        a thread other than the GUI one if the sample volumes are given.
+
+        Parameters
+        ----------
+        volumes : np.ndarray, optional
+            Sample volumes, repeated to fill the test chunks. By default
+            taken with get_sample_volumes, which reads the preview volumes
+            of the viewer and has to be called from the GUI thread.
+
+        Returns
+        -------
+        ThroughputCheck
+
+        """
+        save_params = self.save_params
+        if volumes is None:
+            volumes = self.get_sample_volumes()
+        key = (
+            volumes.shape[1:],
+            str(save_params.output_dir),
+            save_params.optimal_chunk_MB_RAM,
+            save_params.n_writers,
+            save_params.max_chunks_in_flight,
+            save_params.backend,
+            save_params.time_block,
+            save_params.spill,
+            save_params.codec,
+            save_params.clevel,
+            save_params.shuffle,
+            save_params.compression_threads,
+            save_params.storage_dtype,
+            save_params.pyramid,
+        )
+        if key not in self.saving_rates:
+            self.saving_rates[key] = measure_saving_rate(volumes, save_params)
+        saving_rate = self.saving_rates[key]
+        self.throughput_check = check_throughput(
+            volume_rate=save_params.volumerate,
+            saving_rate=saving_rate,
+            volume_MB=volumes[0].nbytes / 1e6,
+            n_volumes=int(
+                np.ceil(
+                    save_params.volumerate * self.trigger_settings.experiment_duration
+                )
+            ),
+            max_queue_MB=self.volume_ring.maxbytes / 1e6,
+        )
+        self.logger.log_message(
+            f"saving rate {saving_rate:.2f} volumes/s, "
+            f"peak queue {self.throughput_check.peak_queue_MB:.0f} MB"
+        )
+        return self.throughput_check
+
+    def benchmark_compression(self, volumes=None, progress_callback=None):
+        """Benchmark the compression settings on volumes from the preview (or on
+        synthetic ones if there is no preview), and rank them by how well they
+        suit the current volume rate. The settings are not changed, so this can
+        be called from a thread other than the GUI one if the sample volumes
+        are given.
+
+        Parameters
+        ----------
+        volumes : np.ndarray, optional
+            Sample volumes. By default taken with get_sample_volumes, which
+            reads the preview volumes of the viewer and has to be called from
+            the GUI thread.
+        progress_callback : callable, optional
+            Called as progress_callback(n_settings_done, n_settings).
+
+        Returns
+        -------
+        list of CompressionResult
+            All the results of the benchmark, the chosen one first.
+
+        """
+        save_params = self.save_params
+        if volumes is None:
+            volumes = self.get_sample_volumes()
+
+        # test files are written on the saving disk, if possible:
+        work_dir = Path(self.save_settings.save_dir)
+        results = benchmark_compression(
+            volumes,
+            self.save_settings.file_format,
+            work_dir=work_dir if work_dir.is_dir() else None,
+            progress_callback=progress_callback,
+        )
+        best = choose_compression(
+            results, save_params.volumerate, n_writers=save_params.n_writers
+        )
+        results.remove(best)
+        return [best] + results
+
+    def set_compression(self, result):
+        """Use the compression settings of a CompressionResult."""
+        self.save_settings.codec = result.codec
+        self.save_settings.compression_level = result.clevel
+        self.save_settings.shuffle = result.shuffle
+        self.save_settings.compression_threads = result.compression_threads
+
+    def tune_compression(self, n_volumes=2, timeout=2.0):
+        """Benchmark the compression settings and select the one with the best
+        compression ratio that keeps up with the current volume rate, see
+        benchmark_compression.
+
+        Returns
+        -------
+        list of CompressionResult
+            All the results of the benchmark, the chosen one first.
+
+        """
+        results = self.benchmark_compression(
+            self.get_sample_volumes(n_volumes, timeout)
+        )
+        self.set_compression(results[0])
+        return results
 
     def get_save_status(self) -> Optional[SavingStatus]:
         return get_last_parameters(self.saver.saved_status_queue)
 
+    def process_loads(self):
+        """Returns the busy, idle and CPU time in seconds of every process,
+        by name, as counted by the processes (see LoggingProcess).
+        """
+        return {
+            process.logger.process_name: tuple(process.load)
+            for process in [
+                self.camera,
+                self.scanner,
+                self.external_comm,
+                self.saver,
+                self.dispatcher,
+            ]
+        }
+
+    def scan_timing(self):
+        """Returns the summary of the timing of the scanning loop, with the
+        histograms of the durations of its phases and of the slack before
+        every write (see ScanTiming).
+        """
+        timing = self.scanner.timing
+        return dict(
+            timing.summary(),
+            duration_edges=timing.duration_edges,
+            histograms=timing.histograms(),
+            slack_edges=timing.slack_edges,
+            slack_histogram=timing.slack_histogram(),
+        )
+
     def get_triggered_frame_rate(self):
         return get_last_parameters(self.camera.triggered_frame_rate_queue)
 
@@ -701,6 +970,7 @@ class State:
             self.external_comm.is_triggered_event.set()
         else:
             self.external_comm.is_triggered_event.clear()
+        self.external_comm.doorbell.ring()
 
     def send_manual_duration(self):
         self.experiment_duration_queue.put(self.trigger_settings.experiment_duration)
@@ -0,0 +1,15 @@
+from sashimi.storage.h5 import H5Backend
+
+# Update this dictionary and add the import above when adding a new storage backend
+backend_class_dict = dict(
+    h5=H5Backend,
+)
+
+# Chunked formats are available only if zarr is installed:
+try:
+    from sashimi.storage.zarr_store import ZarrBackend, N5Backend
+
+    backend_class_dict["zarr"] = ZarrBackend
+    backend_class_dict["n5"] = N5Backend
+except ImportError:
+    pass
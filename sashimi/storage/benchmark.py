@@ -0,0 +1,206 @@
+import tempfile
+import time
+from dataclasses import dataclass
+from itertools import product
+
+import numpy as np
+from scipy.ndimage import gaussian_filter, zoom
+
+from sashimi.storage import backend_class_dict
+
+CODECS = ("lz4", "zstd", "blosclz")
+LEVELS = (1, 5, 9)
+THREADS = (1, 4)
+
+
+@dataclass
+class CompressionResult:
+    codec: str
+    clevel: int
+    shuffle: str
+    compression_threads: int
+    write_time: float = 0.0  # in seconds, for all the sample volumes
+    ratio: float = 1.0  # uncompressed over compressed size
+    volumes_per_second: float = 0.0
+
+
+def synthetic_volumes(volume_shape, n_volumes=2, background=100, dtype=np.uint16):
+    """Volumes with statistics similar to the ones of lightsheet recordings:
+    a camera offset with shot noise, and smooth bright structures.
+
+    Parameters
+    ----------
+    volume_shape : tuple
+        Shape of a volume (n_planes, height, width).
+    n_volumes : int
+        Number of volumes.
+    background : int
+        Camera offset.
+    dtype :
+        Data type of the volumes.
+
+    """
+    rng = np.random.default_rng()
+    n_planes, height, width = volume_shape
+    # the structures are generated at a lower resolution, to be fast on large ROIs:
+    coarse = gaussian_filter(
+        rng.random((n_planes, height // 8 + 1, width // 8 + 1)), sigma=(0, 1, 1)
+    )
+    coarse = (coarse - coarse.min()) / (np.ptp(coarse) + 1e-9)
+    structure = zoom(
+        coarse, (1, height / coarse.shape[1], width / coarse.shape[2]), order=1
+    )
+    signal = (background + 1000 * structure**4).astype(np.float32)
+    # shot noise, approximated as gaussian:
+    noise = rng.standard_normal((n_volumes, *volume_shape), dtype=np.float32)
+    return np.clip(signal + np.sqrt(signal) * noise, 0, None).astype(dtype)
+
+
+def benchmark_compression(
+    volumes,
+    file_format="h5",
+    codecs=CODECS,
+    levels=LEVELS,
+    threads=THREADS,
+    work_dir=None,
+    progress_callback=None,
+):
+    """Write the sample volumes with every combination of compression settings
+    supported by the file format, measuring writing time and compression ratio.
+
+    Parameters
+    ----------
+    volumes : np.ndarray
+        Sample volumes, of shape (n_volumes, n_planes, height, width).
+    file_format : str
+        Key in the backend_class_dict.
+    codecs : tuple
+        Blosc compressors to test.
+    levels : tuple
+        Compression levels to test.
+    threads : tuple
+        Numbers of blosc threads to test.
+    work_dir : Path, optional
+        Where to write the test files, ideally on the disk used for saving.
+    progress_callback : callable, optional
+        Called as progress_callback(n_settings_done, n_settings) after every
+        setting tested.
+
+    Returns
+    -------
+    list of CompressionResult
+
+    """
+    backend_class = backend_class_dict[file_format]
+    settings = list(product(codecs, levels, backend_class.shuffle_modes, threads))
+    results = []
+    for codec, clevel, shuffle, n_threads in settings:
+        result = CompressionResult(codec, clevel, shuffle, n_threads)
+        with tempfile.TemporaryDirectory(dir=work_dir) as test_dir:
+            backend = backend_class(
+                test_dir,
+                codec=codec,
+                clevel=clevel,
+                shuffle=shuffle,
+                compression_threads=n_threads,
+                time_block=volumes.shape[0],
+            )
+            backend.prepare(
+                volumes.shape[1:], volumes.dtype, volumes.shape[0], volumes.shape[0]
+            )
+            start_time = time.perf_counter()
+            backend.write_chunk(0, volumes)
+            result.write_time = time.perf_counter() - start_time
+            written = sum(
+                f.stat().st_size for f in backend.root.rglob("*") if f.is_file()
+            )
+        result.ratio = volumes.nbytes / max(written, 1)
+        result.volumes_per_second = volumes.shape[0] / result.write_time
+        results.append(result)
+        if progress_callback is not None:
+            progress_callback(len(results), len(settings))
+    return results
+
+
+def choose_compression(results, volume_rate, n_writers=1, headroom=2.0):
+    """Returns the setting with the best compression ratio among the ones that
+    write volumes faster than they are acquired, with some headroom. If none is
+    fast enough, the fastest one.
+
+    Parameters
+    ----------
+    results : list of CompressionResult
+        Output of benchmark_compression.
+    volume_rate : float
+        Volumes acquired per second.
+    n_writers : int
+        Number of processes writing chunks in parallel (0 if the saver
+        writes them itself).
+    headroom : float
+        Factor by which writing has to be faster than acquiring.
+
+    """
+    required_rate = volume_rate * headroom / max(n_writers, 1)
+    fast_enough = [r for r in results if r.volumes_per_second >= required_rate]
+    if len(fast_enough) == 0:
+        return max(results, key=lambda r: r.volumes_per_second)
+    return max(fast_enough, key=lambda r: (r.ratio, r.volumes_per_second))
+
+
+@dataclass
+class ThroughputCheck:
+    volume_rate: float  # volumes acquired per second
+    saving_rate: float  # volumes saved per second
+    volume_MB: float
+    n_volumes: int
+    max_queue_MB: float
+    peak_queue_MB: float = 0.0
+
+    @property
+    def peak_queue_occupancy(self):
+        return self.peak_queue_MB / self.max_queue_MB
+
+    @property
+    def overflows(self):
+        return self.peak_queue_MB > self.max_queue_MB
+
+    @property
+    def seconds_to_overflow(self):
+        """Time after which the queue is full, if it ever is."""
+        if self.saving_rate >= self.volume_rate:
+            return np.inf
+        return self.max_queue_MB / (
+            (self.volume_rate - self.saving_rate) * self.volume_MB
+        )
+
+
+def check_throughput(volume_rate, saving_rate, volume_MB, n_volumes, max_queue_MB):
+    """Project the peak size of the saving queue over an experiment, in which
+    volumes are acquired at volume_rate and saved at saving_rate. The queue
+    grows as long as volumes are acquired faster than they are saved.
+
+    Parameters
+    ----------
+    volume_rate : float
+        Volumes acquired per second.
+    saving_rate : float
+        Volumes saved per second, e.g. from measure_saving_rate.
+    volume_MB : float
+        Size of a volume in MB.
+    n_volumes : int
+        Number of volumes of the experiment.
+    max_queue_MB : float
+        Capacity of the saving queue in MB.
+
+    Returns
+    -------
+    ThroughputCheck
+
+    """
+    check = ThroughputCheck(
+        volume_rate, saving_rate, volume_MB, n_volumes, max_queue_MB
+    )
+    if saving_rate < volume_rate:
+        duration = n_volumes / volume_rate
+        check.peak_queue_MB = (volume_rate - saving_rate) * duration * volume_MB
+    return check
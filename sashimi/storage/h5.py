@@ -0,0 +1,58 @@
+import json
+import shutil
+
+import flammkuchen as fl
+import tables
+
+from sashimi.storage.interface import AbstractStorageBackend, StorageException
+
+
+class H5Backend(AbstractStorageBackend):
+    """Each chunk is saved in a separate NNNN.h5 file in the folder of the dataset
+    (original by default), and the metadata in a stack_metadata.json file, so that
+    the data can be opened as a split_dataset. The chunks are compressed with blosc
+    through flammkuchen, which always applies the byte shuffle filter.
+    """
+
+    shuffle_modes = ("byte",)
+
+    @property
+    def root(self):
+        return self.output_dir / self.name
+
+    def has_dataset(self):
+        return (self.root / "stack_metadata.json").is_file() or self.journal.exists()
+
+    def prepare(self, *args, **kwargs):
+        super().prepare(*args, **kwargs)
+        # remove files if some are found at the save location
+        if self.has_dataset():
+            shutil.rmtree(self.root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def write_chunk(self, i_chunk, data):
+        tables.parameters.MAX_BLOSC_THREADS = self.compression_threads
+        fl.save(
+            self.root / "{:04d}.h5".format(i_chunk),
+            {"stack_4D": data},
+            compression=("blosc:" + self.codec, self.clevel),
+        )
+
+    def read_chunk(self, i_chunk, n_volumes):
+        return fl.load(self.root / "{:04d}.h5".format(i_chunk), "/stack_4D")
+
+    def read_metadata(self):
+        path = self.root / "stack_metadata.json"
+        if not path.is_file():
+            raise StorageException(f"No complete dataset found in {self.root}")
+        with open(path) as f:
+            return json.load(f)
+
+    def discard_chunks(self, n_chunks):
+        for path in self.root.glob("*.h5"):
+            if path.stem.isdigit() and int(path.stem) >= n_chunks:
+                path.unlink()
+
+    def finalize(self, metadata, n_volumes_saved):
+        with open(self.root / "stack_metadata.json", "w") as f:
+            json.dump(metadata, f)
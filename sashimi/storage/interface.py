@@ -0,0 +1,174 @@
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import numpy as np
+
+from sashimi.storage.journal import ChunkJournal
+
+
+class StorageException(Exception):
+    pass
+
+
+class AbstractStorageBackend(ABC):
+    """Format in which the StackSaver writes the volumes of an experiment.
+
+    The backend is created in the saver process and prepared when the first
+    volume arrives. It is then sent to the ChunkWriter processes together with
+    the chunks to write, so write_chunk has to be safe to call at the same time
+    from different processes for different chunks.
+
+    Every written chunk is recorded in a ChunkJournal kept in the root of the
+    dataset, from which an interrupted dataset can be recovered or resumed.
+
+    Parameters
+    ----------
+    output_dir : Path
+        Directory of the experiment.
+    name : str
+        Name of the dataset in the experiment directory.
+    codec : str
+        Blosc compressor ("blosclz", "lz4" or "zstd").
+    clevel : int
+        Compression level, from 0 to 9.
+    shuffle : str
+        Shuffle filter applied before compressing ("none", "byte" or "bit"),
+        if supported by the backend (see shuffle_modes).
+    compression_threads : int
+        Number of threads used by blosc in every writer.
+    **kwargs :
+        Backend-specific options. All backends are created with the same options
+        from the SavingParameters, and ignore the ones they do not use.
+
+    """
+
+    # shuffle filters that the backend can apply:
+    shuffle_modes = ("none", "byte", "bit")
+
+    def __init__(
+        self,
+        output_dir,
+        name="original",
+        codec="blosclz",
+        clevel=9,
+        shuffle="byte",
+        compression_threads=1,
+        **kwargs,
+    ):
+        self.output_dir = Path(output_dir)
+        self.name = name
+        self.codec = codec
+        self.clevel = clevel
+        self.shuffle = (
+            shuffle if shuffle in self.shuffle_modes else self.shuffle_modes[0]
+        )
+        self.compression_threads = compression_threads
+        self.frame_shape = None
+        self.dtype = None
+        self.n_volumes = 0
+        self.chunk_size = 1
+
+    @property
+    @abstractmethod
+    def root(self):
+        """Path of the saved dataset."""
+        return None
+
+    @property
+    def journal(self):
+        return ChunkJournal(self.root)
+
+    @abstractmethod
+    def has_dataset(self):
+        """Returns True if a complete or interrupted dataset is found at the
+        saving location.
+        """
+        return False
+
+    def adjust_chunk_size(self, chunk_size):
+        """Returns the closest number of volumes per chunk that the backend
+        can write efficiently.
+        """
+        return chunk_size
+
+    def prepare(self, frame_shape, dtype, n_volumes, chunk_size):
+        """Remove previous data and set up the dataset before writing chunks.
+
+        Parameters
+        ----------
+        frame_shape : tuple
+            Shape of a volume (n_planes, height, width).
+        dtype :
+            Data type of the volumes.
+        n_volumes : int
+            Expected number of volumes of the experiment.
+        chunk_size : int
+            Number of volumes per chunk.
+
+        """
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = dtype
+        self.n_volumes = n_volumes
+        self.chunk_size = chunk_size
+
+    def start_journal(self, metadata):
+        """Start the journal of a prepared dataset, with the metadata that
+        will be written when finalizing it.
+        """
+        self.journal.start(
+            dict(
+                frame_shape=list(self.frame_shape),
+                dtype=np.dtype(self.dtype).str,
+                chunk_size=self.chunk_size,
+                n_volumes=self.n_volumes,
+                metadata=metadata,
+            )
+        )
+
+    def resume(self, header):
+        """Set up the backend to keep on writing an interrupted dataset, described
+        by the header of its journal, without removing the chunks already written.
+        """
+        self.frame_shape = tuple(header["frame_shape"])
+        self.dtype = np.dtype(header["dtype"])
+        self.n_volumes = header["n_volumes"]
+        self.chunk_size = header["chunk_size"]
+
+    def discard_chunks(self, n_chunks):
+        """Remove the chunks from n_chunks on, which are not part of the
+        recovered dataset.
+        """
+        pass
+
+    def set_n_volumes(self, n_volumes):
+        """Update the expected number of volumes after the dataset has been prepared."""
+        self.n_volumes = n_volumes
+
+    @abstractmethod
+    def write_chunk(self, i_chunk, data):
+        """Write the volumes of chunk i_chunk, with shape (n, n_planes, height, width)."""
+        pass
+
+    @abstractmethod
+    def read_chunk(self, i_chunk, n_volumes):
+        """Read back the n_volumes volumes of chunk i_chunk, as they were written."""
+        pass
+
+    def read_metadata(self):
+        """Returns the metadata written when finalizing the dataset."""
+        raise StorageException(f"{type(self).__name__} datasets cannot be read back")
+
+    @abstractmethod
+    def finalize(self, metadata, n_volumes_saved):
+        """Write the metadata after all the chunks have been written.
+
+        Parameters
+        ----------
+        metadata : dict
+            Metadata of the dataset, as in the stack_metadata.json file.
+        n_volumes_saved : int
+            Number of volumes actually saved, which can be lower than the
+            expected one if the experiment was interrupted.
+
+        """
+        pass
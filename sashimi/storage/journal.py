@@ -0,0 +1,107 @@
+import json
+import os
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+
+def chunk_entry(i_chunk, i_start, data):
+    """Journal entry of a chunk that has been written, with the checksum
+    of its (uncompressed) data.
+    """
+    data = np.ascontiguousarray(data)
+    return dict(
+        i_chunk=int(i_chunk),
+        volumes=[int(i_start), int(i_start + data.shape[0])],
+        shape=list(data.shape),
+        nbytes=int(data.nbytes),
+        crc32=zlib.crc32(data),
+    )
+
+
+def checksum_matches(entry, data):
+    data = np.ascontiguousarray(data)
+    return list(data.shape) == entry["shape"] and zlib.crc32(data) == entry["crc32"]
+
+
+class ChunkJournal:
+    """Append-only record of the chunks of a dataset, updated every time a chunk
+    is safely on disk, so that an interrupted dataset can be recovered or resumed.
+
+    Every line of the journal file is a json dictionary. The first one describes
+    the dataset (frame shape, dtype, chunk size and metadata), the following ones
+    the chunks written, in the order in which they were completed.
+
+    Parameters
+    ----------
+    root : Path
+        Folder of the dataset, where the journal file is kept.
+
+    """
+
+    filename = "chunk_journal.jsonl"
+
+    def __init__(self, root):
+        self.path = Path(root) / self.filename
+
+    def exists(self):
+        return self.path.is_file()
+
+    def is_valid(self):
+        """Returns True if the journal exists and describes a dataset which
+        can be resumed.
+        """
+        if not self.exists():
+            return False
+        try:
+            header, _ = self.read()
+        except (OSError, UnicodeDecodeError):
+            return False
+        return isinstance(header, dict) and "frame_shape" in header
+
+    def start(self, header, entries=()):
+        """Start a new journal for a dataset described by the header dictionary,
+        optionally with the entries of chunks already written.
+        """
+        with open(self.path, "w") as f:
+            for entry in [header, *entries]:
+                self._write_line(f, entry)
+
+    def append(self, entry):
+        with open(self.path, "a") as f:
+            self._write_line(f, entry)
+
+    @staticmethod
+    def _write_line(f, entry):
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+    def read(self):
+        """Returns the header of the journal and a dictionary of the chunk
+        entries, by chunk number. A line cut by a crash is ignored.
+        """
+        header = None
+        chunks = dict()
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if header is None:
+                    header = entry
+                else:
+                    chunks[entry["i_chunk"]] = entry
+        return header, chunks
+
+    def contiguous_chunks(self):
+        """Returns the header and the entries of the chunks written without gaps
+        from the beginning of the dataset.
+        """
+        header, chunks = self.read()
+        contiguous = []
+        while len(contiguous) in chunks:
+            contiguous.append(chunks[len(contiguous)])
+        return header, contiguous
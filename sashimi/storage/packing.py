@@ -0,0 +1,101 @@
+import numpy as np
+from numba import jit
+
+# Formats in which the volumes can be stored, with the dtype of the stored arrays:
+storage_dtypes = dict(uint16=np.uint16, uint8=np.uint8, uint12=np.uint8)
+
+
+@jit(nopython=True)
+def pack_12bit(volume, out):
+    """Pack the rows of a uint16 volume in 12 bits per pixel, saturating larger
+    values: every two pixels a and b are stored in three bytes, as
+    [a & 0xFF, (a >> 8) | (b & 0x0F) << 4, b >> 4]. An odd row is padded with 0.
+    """
+    n_planes, height, width = volume.shape
+    for i_plane in range(n_planes):
+        for i_row in range(height):
+            for i_pair in range((width + 1) // 2):
+                a = min(volume[i_plane, i_row, 2 * i_pair], 4095)
+                b = 0
+                if 2 * i_pair + 1 < width:
+                    b = min(volume[i_plane, i_row, 2 * i_pair + 1], 4095)
+                out[i_plane, i_row, 3 * i_pair] = a & 0xFF
+                out[i_plane, i_row, 3 * i_pair + 1] = (a >> 8) | ((b & 0x0F) << 4)
+                out[i_plane, i_row, 3 * i_pair + 2] = b >> 4
+
+
+@jit(nopython=True)
+def unpack_12bit(packed, out):
+    """Unpack volumes packed with pack_12bit into the uint16 array out,
+    of shape (..., height, width).
+    """
+    stacked_packed = packed.reshape((-1, *packed.shape[-2:]))
+    stacked_out = out.reshape((-1, *out.shape[-2:]))
+    n_planes, height, width = stacked_out.shape
+    for i_plane in range(n_planes):
+        for i_row in range(height):
+            for i_pair in range((width + 1) // 2):
+                b0 = np.uint16(stacked_packed[i_plane, i_row, 3 * i_pair])
+                b1 = np.uint16(stacked_packed[i_plane, i_row, 3 * i_pair + 1])
+                b2 = np.uint16(stacked_packed[i_plane, i_row, 3 * i_pair + 2])
+                stacked_out[i_plane, i_row, 2 * i_pair] = b0 | ((b1 & 0x0F) << 8)
+                if 2 * i_pair + 1 < width:
+                    stacked_out[i_plane, i_row, 2 * i_pair + 1] = (b1 >> 4) | (b2 << 4)
+
+
+@jit(nopython=True)
+def saturate_uint8(volume, out):
+    n_planes, height, width = volume.shape
+    for i_plane in range(n_planes):
+        for i_row in range(height):
+            for i_col in range(width):
+                out[i_plane, i_row, i_col] = min(volume[i_plane, i_row, i_col], 255)
+
+
+def metadata_storage_dtype(metadata):
+    """Storage format of a dataset, from the dtype and packing in its metadata."""
+    if metadata.get("packing") == "12bit":
+        return "uint12"
+    return metadata.get("dtype", "uint16")
+
+
+def stored_shape(volume_shape, storage_dtype):
+    """Shape in which a volume of volume_shape (n_planes, height, width)
+    is stored.
+    """
+    if storage_dtype == "uint12":
+        return (*volume_shape[:-1], (volume_shape[-1] + 1) // 2 * 3)
+    return tuple(volume_shape)
+
+
+def store_volume(volume, out, storage_dtype):
+    """Convert a volume to the storage format, writing it in out. Values that
+    do not fit in the storage format are saturated.
+    """
+    if storage_dtype == "uint12":
+        pack_12bit(volume, out)
+    elif storage_dtype == "uint8" and volume.dtype != np.uint8:
+        saturate_uint8(volume, out)
+    else:
+        out[:] = volume
+
+
+def restore_volumes(stored, storage_dtype, width):
+    """Returns the volumes as they were acquired from the stored array of
+    shape (..., height, stored width), e.g. a chunk read from disk.
+
+    Parameters
+    ----------
+    stored : np.ndarray
+        Stored volumes.
+    storage_dtype : str
+        Storage format, one of the keys of storage_dtypes.
+    width : int
+        Width of the acquired frames.
+
+    """
+    if storage_dtype == "uint12":
+        out = np.empty((*stored.shape[:-1], width), dtype=np.uint16)
+        unpack_12bit(np.ascontiguousarray(stored), out)
+        return out
+    return np.asarray(stored)
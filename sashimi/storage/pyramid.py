@@ -0,0 +1,118 @@
+import shutil
+
+import numpy as np
+
+from sashimi.storage.packing import restore_volumes
+
+
+def block_mean(volumes, factor):
+    """Downsample volumes of shape (n_volumes, n_planes, height, width) in x and y,
+    averaging blocks of factor x factor pixels. Pixels that do not fill a whole
+    block at the borders are discarded.
+    """
+    n_volumes, n_planes, height, width = volumes.shape
+    height, width = height // factor, width // factor
+    blocks = volumes[:, :, : height * factor, : width * factor].reshape(
+        n_volumes, n_planes, height, factor, width, factor
+    )
+    return blocks.mean(axis=(3, 5), dtype=np.float32).astype(volumes.dtype)
+
+
+def max_projection(volumes):
+    """Maximum intensity projection of every volume along z, keeping a single plane."""
+    return volumes.max(axis=1, keepdims=True)
+
+
+class PyramidWriter:
+    """Writes, next to the original dataset, lower resolution versions of every
+    chunk for quick review: volumes downsampled 2x and 4x in x and y
+    (downsampled_2x and downsampled_4x), and their maximum intensity projections
+    along z (mip). Every level is a dataset in the same format as the original.
+
+    Parameters
+    ----------
+    backend_factory : callable
+        Called with the name of a level, returns its storage backend.
+    storage_dtype : str
+        Format in which the original volumes are stored, see sashimi.storage.packing.
+
+    """
+
+    factors = dict(downsampled_2x=2, downsampled_4x=4)
+
+    def __init__(self, backend_factory, storage_dtype="uint16"):
+        self.levels = {
+            name: backend_factory(name) for name in [*self.factors.keys(), "mip"]
+        }
+        self.storage_dtype = storage_dtype
+        # dtype of the volumes once unpacked:
+        self.dtype = np.uint8 if storage_dtype == "uint8" else np.uint16
+        self.volume_shape = None
+
+    def level_shape(self, name):
+        n_planes, height, width = self.volume_shape
+        if name == "mip":
+            return 1, height, width
+        factor = self.factors[name]
+        return n_planes, height // factor, width // factor
+
+    def prepare(self, volume_shape, n_volumes, chunk_size):
+        """Set up the levels, removing previous ones, for volumes of volume_shape
+        as acquired.
+        """
+        self.volume_shape = tuple(volume_shape)
+        for name, backend in self.levels.items():
+            if backend.root.exists():
+                shutil.rmtree(backend.root)
+            backend.prepare(self.level_shape(name), self.dtype, n_volumes, chunk_size)
+
+    def resume(self, volume_shape, n_volumes, chunk_size):
+        """Set up the levels to keep on writing an interrupted dataset."""
+        self.volume_shape = tuple(volume_shape)
+        for name, backend in self.levels.items():
+            if backend.root.exists():
+                backend.resume(
+                    dict(
+                        frame_shape=self.level_shape(name),
+                        dtype=np.dtype(self.dtype).str,
+                        n_volumes=n_volumes,
+                        chunk_size=chunk_size,
+                    )
+                )
+            else:
+                backend.prepare(
+                    self.level_shape(name), self.dtype, n_volumes, chunk_size
+                )
+
+    def set_n_volumes(self, n_volumes):
+        for backend in self.levels.values():
+            backend.set_n_volumes(n_volumes)
+
+    def write_chunk(self, i_chunk, data):
+        """Compute and write the levels of a chunk, as stored by the saver."""
+        volumes = restore_volumes(data, self.storage_dtype, self.volume_shape[-1])
+        downsampled_2x = block_mean(volumes, 2)
+        self.levels["downsampled_2x"].write_chunk(i_chunk, downsampled_2x)
+        # the 4x level is computed from the 2x one, which up to rounding is the
+        # same as averaging 4x4 blocks of the original:
+        downsampled_4x = block_mean(downsampled_2x, 2)
+        self.levels["downsampled_4x"].write_chunk(i_chunk, downsampled_4x)
+        self.levels["mip"].write_chunk(i_chunk, max_projection(volumes))
+
+    def finalize(self, metadata, n_volumes_saved):
+        for name, backend in self.levels.items():
+            level_metadata = dict(metadata)
+            level_shape = self.level_shape(name)
+            level_metadata["shape_full"] = (metadata["shape_full"][0], *level_shape)
+            level_metadata["shape_block"] = (metadata["shape_block"][0], *level_shape)
+            level_metadata["volume_shape"] = level_shape
+            level_metadata["packing"] = None
+            if name in self.factors:
+                factor = self.factors[name]
+                voxel_size = metadata["voxel_size"]
+                level_metadata["voxel_size"] = [
+                    voxel_size[0],
+                    voxel_size[1] * factor,
+                    voxel_size[2] * factor,
+                ]
+            backend.finalize(level_metadata, n_volumes_saved)
@@ -0,0 +1,161 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Lock
+
+import numpy as np
+
+from sashimi.storage import backend_class_dict
+from sashimi.storage.interface import StorageException
+from sashimi.storage.packing import metadata_storage_dtype, restore_volumes
+
+
+def find_saved_backend(output_dir, name="original"):
+    """Returns the backend of the complete dataset called name in output_dir."""
+    for backend_class in backend_class_dict.values():
+        backend = backend_class(output_dir, name=name)
+        if backend.root.exists():
+            try:
+                return backend, backend.read_metadata()
+            except StorageException:
+                pass
+    raise StorageException(
+        f"No complete dataset {name} found in {output_dir}, "
+        "if the experiment was interrupted run sashimi-recover first"
+    )
+
+
+class SavedDataset:
+    """Saved experiment presented as a lazy array of shape (t, z, y, x), that
+    can be sliced like a numpy array. Only the chunks of shape_block volumes
+    containing the requested volumes are read and decompressed, and the decoded
+    chunks are kept in a cache, dropping the least recently used ones when it
+    is full. Packed volumes are returned as they were acquired.
+
+    Parameters
+    ----------
+    output_dir : Path
+        Directory of the experiment.
+    name : str
+        Dataset to read, original or one of the levels of sashimi.storage.pyramid.
+    cache_MB : float
+        Maximum size of the decoded chunks kept in memory.
+    prefetch : bool
+        If True, the chunk after the last one read is decoded in a thread,
+        which speeds up reading the volumes in order.
+
+    """
+
+    def __init__(self, output_dir, name="original", cache_MB=512, prefetch=False):
+        self.backend, self.metadata = find_saved_backend(Path(output_dir), name)
+        self.storage_dtype = metadata_storage_dtype(self.metadata)
+        n_volumes = self.metadata["shape_full"][0]
+        self.volume_shape = tuple(
+            self.metadata.get("volume_shape", self.metadata["shape_full"][1:])
+        )
+        self.shape = (n_volumes, *self.volume_shape)
+        self.dtype = np.dtype(self.metadata.get("dtype", "uint16"))
+        self.chunk_size = self.metadata["shape_block"][0]
+        self.backend.chunk_size = self.chunk_size
+
+        self.cache_bytes = cache_MB * 1048576
+        self.cache = OrderedDict()
+        self.n_chunks_read = 0
+        # the backends are not safe to read from multiple threads:
+        self.read_lock = Lock()
+        self.cache_lock = Lock()
+        self.prefetching = dict()
+        self.executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def n_chunks(self):
+        return -(-self.shape[0] // self.chunk_size)
+
+    @property
+    def voxel_size(self):
+        return self.metadata.get("voxel_size")
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        self.cache.clear()
+
+    def read_chunk(self, i_chunk):
+        """Read and decode a chunk from disk, without caching it."""
+        n_volumes = min(self.chunk_size, self.shape[0] - i_chunk * self.chunk_size)
+        with self.read_lock:
+            stored = self.backend.read_chunk(i_chunk, n_volumes)
+            self.n_chunks_read += 1
+        return restore_volumes(stored, self.storage_dtype, self.volume_shape[-1])
+
+    def cache_chunk(self, i_chunk, data):
+        with self.cache_lock:
+            self.cache[i_chunk] = data
+            self.cache.move_to_end(i_chunk)
+            while (
+                len(self.cache) > 1
+                and sum(c.nbytes for c in self.cache.values()) > self.cache_bytes
+            ):
+                self.cache.popitem(last=False)
+
+    def chunk(self, i_chunk):
+        """Returns the decoded volumes of chunk i_chunk, from the cache if possible."""
+        with self.cache_lock:
+            if i_chunk in self.cache:
+                self.cache.move_to_end(i_chunk)
+                return self.cache[i_chunk]
+            pending = self.prefetching.pop(i_chunk, None)
+        data = pending.result() if pending is not None else self.read_chunk(i_chunk)
+        self.cache_chunk(i_chunk, data)
+        return data
+
+    def prefetch(self, i_chunk):
+        if self.executor is None or not 0 <= i_chunk < self.n_chunks:
+            return
+        with self.cache_lock:
+            if i_chunk in self.cache or i_chunk in self.prefetching:
+                return
+            self.prefetching[i_chunk] = self.executor.submit(self.read_chunk, i_chunk)
+
+    def __getitem__(self, item):
+        if not isinstance(item, tuple):
+            item = (item,)
+        i_time, other = item[0], (slice(None), *item[1:])
+        if isinstance(i_time, slice):
+            i_volumes = np.arange(self.shape[0])[i_time]
+        else:
+            i_volumes = np.asarray(i_time)
+            if np.any(i_volumes >= self.shape[0]) or np.any(i_volumes < -self.shape[0]):
+                raise IndexError(f"Volume index out of range for {len(self)} volumes")
+            i_volumes = i_volumes % self.shape[0]
+
+        flat_volumes = i_volumes.ravel()
+        if len(flat_volumes) == 0:
+            selected = np.empty((0, *self.shape[1:]), self.dtype)[other]
+        else:
+            # consecutive volumes in the same chunk are selected together:
+            i_chunks = flat_volumes // self.chunk_size
+            i_starts = np.flatnonzero(np.diff(i_chunks, prepend=-1) != 0)
+            i_ends = np.append(i_starts[1:], len(i_chunks))
+            parts = []
+            for i_start, i_end in zip(i_starts, i_ends):
+                i_chunk = i_chunks[i_start]
+                in_chunk = flat_volumes[i_start:i_end] - i_chunk * self.chunk_size
+                parts.append(self.chunk(i_chunk)[in_chunk][other])
+            selected = np.concatenate(parts)
+            self.prefetch(i_chunks[-1] + 1)
+        return selected.reshape(*i_volumes.shape, *selected.shape[1:])
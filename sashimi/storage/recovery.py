@@ -0,0 +1,83 @@
+from pathlib import Path
+
+import click
+
+from sashimi.storage import backend_class_dict
+from sashimi.storage.interface import StorageException
+from sashimi.storage.journal import checksum_matches
+
+
+def find_journaled_backend(output_dir):
+    """Returns the backend of the dataset with a chunk journal in output_dir,
+    or None if there is none.
+    """
+    for backend_class in backend_class_dict.values():
+        backend = backend_class(output_dir)
+        if backend.journal.exists():
+            return backend
+    return None
+
+
+def recoverable_entries(backend, verify=True):
+    """Returns the journal header and the entries of the chunks that can be kept:
+    the ones written without gaps from the beginning of the dataset, optionally
+    checking that the data on disk matches the checksum in the journal.
+    """
+    header, entries = backend.journal.contiguous_chunks()
+    recovered = []
+    for entry in entries:
+        n_volumes = entry["volumes"][1] - entry["volumes"][0]
+        if verify:
+            try:
+                data = backend.read_chunk(entry["i_chunk"], n_volumes)
+            except (OSError, KeyError, ValueError):
+                break
+            if not checksum_matches(entry, data):
+                break
+        recovered.append(entry)
+        # only the last chunk of a dataset can be partially filled:
+        if n_volumes < header["chunk_size"]:
+            break
+    return header, recovered
+
+
+def recover_dataset(output_dir, verify=True):
+    """Rebuild a readable dataset from the chunk journal of an interrupted
+    experiment. The chunks after the first missing or corrupted one are discarded.
+
+    Parameters
+    ----------
+    output_dir : Path
+        Directory of the experiment.
+    verify : bool
+        If True, the chunks are read back and compared with their checksum.
+
+    Returns
+    -------
+    int
+        Number of volumes recovered.
+
+    """
+    backend = find_journaled_backend(output_dir)
+    if backend is None:
+        raise StorageException(f"No chunk journal found in {output_dir}")
+    header, entries = recoverable_entries(backend, verify=verify)
+    backend.resume(header)
+    backend.discard_chunks(len(entries))
+    backend.journal.start(header, entries)
+    n_volumes = entries[-1]["volumes"][1] if len(entries) > 0 else 0
+
+    metadata = dict(header["metadata"])
+    metadata["shape_full"] = [n_volumes, *header["frame_shape"]]
+    backend.finalize(metadata, n_volumes)
+    return n_volumes
+
+
+@click.command()
+@click.argument("output_dir")
+@click.option(
+    "--no-verify", is_flag=True, help="Do not check the chunks against the checksums"
+)
+def cli_recover_dataset(output_dir, no_verify=False):
+    n_volumes = recover_dataset(Path(output_dir), verify=not no_verify)
+    click.echo(f"Recovered {n_volumes} volumes in {output_dir}")
@@ -0,0 +1,203 @@
+import json
+import os
+import shutil
+from pathlib import Path
+
+import click
+import numpy as np
+
+from sashimi.storage import backend_class_dict
+from sashimi.storage.interface import AbstractStorageBackend, StorageException
+from sashimi.storage.packing import metadata_storage_dtype
+from sashimi.storage.pyramid import PyramidWriter
+from sashimi.storage.recovery import recoverable_entries
+
+
+class RawSpillBackend(AbstractStorageBackend):
+    """Writes the chunks uncompressed in preallocated memory-mapped files
+    (spill/NNNN.raw), which takes almost no CPU, to keep up with acquisition
+    rates at which compressing the chunks is too slow. The StackSaver stores
+    the volumes directly in the mapped files (see chunk_array), and the
+    writers only sync them to the disk. The spilled dataset is transcoded to
+    the final format afterwards with transcode_spill.
+
+    Parameters
+    ----------
+    output_dir : Path
+        Directory of the experiment.
+    target_format : str
+        Key in the backend_class_dict of the format to transcode to.
+    **kwargs :
+        Options of the target backend.
+
+    """
+
+    def __init__(self, output_dir, target_format="h5", **kwargs):
+        super().__init__(output_dir, **kwargs)
+        self.target_format = target_format
+        self.target_options = kwargs
+        self.target = backend_class_dict[target_format](output_dir, **kwargs)
+
+    @classmethod
+    def from_output_dir(cls, output_dir):
+        """Returns the backend of a spilled dataset found in output_dir."""
+        path = Path(output_dir) / "spill" / "spill_target.json"
+        if not path.is_file():
+            raise StorageException(f"No spilled dataset found in {output_dir}")
+        with open(path) as f:
+            target = json.load(f)
+        return cls(output_dir, target["format"], **target["options"])
+
+    @property
+    def root(self):
+        return self.output_dir / "spill"
+
+    def has_dataset(self):
+        return self.journal.exists()
+
+    def adjust_chunk_size(self, chunk_size):
+        # the chunks are transcoded one to one:
+        return self.target.adjust_chunk_size(chunk_size)
+
+    def prepare(self, *args, **kwargs):
+        super().prepare(*args, **kwargs)
+        if self.root.exists():
+            shutil.rmtree(self.root)
+        self.root.mkdir(parents=True)
+        with open(self.root / "spill_target.json", "w") as f:
+            json.dump(dict(format=self.target_format, options=self.target_options), f)
+
+    def chunk_path(self, i_chunk):
+        return self.root / "{:04d}.raw".format(i_chunk)
+
+    def chunk_array(self, i_chunk):
+        """Returns the file of a full chunk mapped in memory, to store the
+        volumes in it directly. The file is created with the size of a full
+        chunk, with its disk space allocated at once where the system allows.
+        """
+        shape = (self.chunk_size, *self.frame_shape)
+        nbytes = int(np.prod(shape)) * np.dtype(self.dtype).itemsize
+        with open(self.chunk_path(i_chunk), "ab") as f:
+            if os.fstat(f.fileno()).st_size < nbytes:
+                if hasattr(os, "posix_fallocate"):
+                    os.posix_fallocate(f.fileno(), 0, nbytes)
+                else:
+                    f.truncate(nbytes)
+        return np.memmap(
+            self.chunk_path(i_chunk), dtype=self.dtype, mode="r+", shape=shape
+        )
+
+    def sync_chunk(self, i_chunk):
+        """Make sure that the volumes stored in the mapped file of a chunk
+        are on the disk.
+        """
+        fd = os.open(self.chunk_path(i_chunk), os.O_RDWR)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def write_chunk(self, i_chunk, data):
+        spilled = self.chunk_array(i_chunk)
+        spilled[: len(data)] = data
+        spilled.flush()
+        del spilled
+
+    def read_chunk(self, i_chunk, n_volumes):
+        return np.memmap(
+            self.chunk_path(i_chunk),
+            dtype=self.dtype,
+            mode="r",
+            shape=(n_volumes, *self.frame_shape),
+        )
+
+    def discard_chunks(self, n_chunks):
+        for path in self.root.glob("*.raw"):
+            if int(path.stem) >= n_chunks:
+                path.unlink()
+
+    def finalize(self, metadata, n_volumes_saved):
+        with open(self.root / "spill_metadata.json", "w") as f:
+            json.dump(dict(metadata, n_volumes_saved=n_volumes_saved), f)
+
+
+def transcode_spill(spill_backend, progress_callback=None, pyramid=False):
+    """Compress a spilled dataset into its target format, chunk by chunk,
+    and delete the spill files when done.
+
+    Parameters
+    ----------
+    spill_backend : RawSpillBackend
+        Backend of the spilled dataset.
+    progress_callback : callable, optional
+        Called as progress_callback(n_chunks_done, n_chunks) after every chunk.
+    pyramid : bool
+        If True, also write the downsampled levels of sashimi.storage.pyramid.
+
+    Returns
+    -------
+    int
+        Number of volumes transcoded.
+
+    """
+    header, entries = recoverable_entries(spill_backend, verify=False)
+    spill_backend.resume(header)
+    n_volumes = entries[-1]["volumes"][1] if len(entries) > 0 else 0
+
+    target = spill_backend.target
+    target.prepare(
+        spill_backend.frame_shape,
+        spill_backend.dtype,
+        n_volumes,
+        spill_backend.chunk_size,
+    )
+    target.start_journal(header["metadata"])
+    pyramid_writer = None
+    if pyramid:
+        target_class = backend_class_dict[spill_backend.target_format]
+        pyramid_writer = PyramidWriter(
+            lambda name: target_class(
+                spill_backend.output_dir,
+                **dict(spill_backend.target_options, name=name),
+            ),
+            metadata_storage_dtype(header["metadata"]),
+        )
+        pyramid_writer.prepare(
+            header["metadata"]["volume_shape"], n_volumes, spill_backend.chunk_size
+        )
+    for i_entry, entry in enumerate(entries):
+        data = spill_backend.read_chunk(entry["i_chunk"], entry["shape"][0])
+        target.write_chunk(entry["i_chunk"], data)
+        # the data is the same, so is the journal entry:
+        target.journal.append(entry)
+        if pyramid_writer is not None:
+            pyramid_writer.write_chunk(entry["i_chunk"], data)
+        del data
+        if progress_callback is not None:
+            progress_callback(i_entry + 1, len(entries))
+
+    metadata = dict(header["metadata"])
+    if (spill_backend.root / "spill_metadata.json").is_file():
+        with open(spill_backend.root / "spill_metadata.json") as f:
+            metadata = json.load(f)
+        metadata.pop("n_volumes_saved")
+    # without the final metadata, after a crash, the planned volumes are fewer:
+    metadata["shape_full"] = [n_volumes, *header["frame_shape"]]
+    target.finalize(metadata, n_volumes)
+    if pyramid_writer is not None:
+        pyramid_writer.finalize(metadata, n_volumes)
+    shutil.rmtree(spill_backend.root)
+    return n_volumes
+
+
+@click.command()
+@click.argument("output_dir")
+@click.option("--pyramid", is_flag=True, help="Also save downsampled volumes.")
+def cli_transcode_spill(output_dir, pyramid):
+    spill_backend = RawSpillBackend.from_output_dir(Path(output_dir))
+    n_volumes = transcode_spill(
+        spill_backend,
+        lambda n_done, n_total: click.echo(f"Transcoded chunk {n_done} of {n_total}"),
+        pyramid=pyramid,
+    )
+    click.echo(f"Transcoded {n_volumes} volumes in {output_dir}")
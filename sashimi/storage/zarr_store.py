@@ -0,0 +1,121 @@
+import shutil
+
+import zarr
+from numcodecs import Blosc, blosc
+
+from sashimi.storage.interface import AbstractStorageBackend, StorageException
+
+
+class ZarrBackend(AbstractStorageBackend):
+    """All the volumes are saved in a single chunked zarr array of shape
+    (t, z, y, x). Every zarr chunk contains one plane for time_block volumes, so
+    that single planes can be read without decompressing whole volumes. The number
+    of volumes per saver chunk is a multiple of time_block, so the ChunkWriters
+    never write to the same zarr chunk and need no locking.
+
+    Parameters
+    ----------
+    output_dir : Path
+        Directory of the experiment.
+    time_block : int
+        Number of volumes in a zarr chunk.
+    **kwargs :
+        Compression options, see AbstractStorageBackend.
+
+    """
+
+    extension = ".zarr"
+    blosc_shuffles = dict(
+        none=Blosc.NOSHUFFLE, byte=Blosc.SHUFFLE, bit=Blosc.BITSHUFFLE
+    )
+
+    def __init__(self, output_dir, time_block=10, **kwargs):
+        super().__init__(output_dir, **kwargs)
+        self.time_block = max(int(time_block), 1)
+
+    @property
+    def root(self):
+        return self.output_dir / (self.name + self.extension)
+
+    def store(self):
+        return zarr.DirectoryStore(str(self.root))
+
+    def has_dataset(self):
+        if not self.root.exists():
+            return False
+        if self.journal.exists():
+            return True
+        try:
+            return "complete" in zarr.open_array(self.store(), mode="r").attrs
+        except ValueError:
+            return False
+
+    def adjust_chunk_size(self, chunk_size):
+        return max(chunk_size // self.time_block, 1) * self.time_block
+
+    def prepare(self, *args, **kwargs):
+        super().prepare(*args, **kwargs)
+        if self.root.exists():
+            shutil.rmtree(self.root)
+        zarr.open_array(
+            self.store(),
+            mode="w",
+            shape=(self.n_volumes, *self.frame_shape),
+            chunks=(
+                min(self.time_block, self.chunk_size),
+                1,
+                *self.frame_shape[1:],
+            ),
+            dtype=self.dtype,
+            compressor=Blosc(
+                cname=self.codec,
+                clevel=self.clevel,
+                shuffle=self.blosc_shuffles[self.shuffle],
+            ),
+        )
+
+    def resume(self, header):
+        super().resume(header)
+        # The array could have been cut to the volumes saved when finalizing:
+        self.set_n_volumes(self.n_volumes)
+
+    def set_n_volumes(self, n_volumes):
+        super().set_n_volumes(n_volumes)
+        array = zarr.open_array(self.store(), mode="r+")
+        array.resize((max(n_volumes, array.shape[0]), *self.frame_shape))
+
+    def write_chunk(self, i_chunk, data):
+        blosc.set_nthreads(self.compression_threads)
+        array = zarr.open_array(self.store(), mode="r+")
+        i_start = i_chunk * self.chunk_size
+        array[i_start : i_start + data.shape[0]] = data
+
+    def read_chunk(self, i_chunk, n_volumes):
+        array = zarr.open_array(self.store(), mode="r")
+        i_start = i_chunk * self.chunk_size
+        return array[i_start : i_start + n_volumes]
+
+    def read_metadata(self):
+        try:
+            attrs = dict(zarr.open_array(self.store(), mode="r").attrs)
+        except ValueError:
+            attrs = dict()
+        if not attrs.pop("complete", False):
+            raise StorageException(f"No complete dataset found in {self.root}")
+        return attrs
+
+    def finalize(self, metadata, n_volumes_saved):
+        array = zarr.open_array(self.store(), mode="r+")
+        # The experiment could have been interrupted before the planned duration:
+        array.resize((n_volumes_saved, *self.frame_shape))
+        array.attrs.update(metadata)
+        array.attrs["complete"] = True
+
+
+class N5Backend(ZarrBackend):
+    """Same layout as the ZarrBackend, in the N5 format."""
+
+    extension = ".n5"
+
+    def store(self):
+        return zarr.N5Store(str(self.root))
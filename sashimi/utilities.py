@@ -5,7 +5,7 @@ from enum import Enum
 
 import ctypes
 import numpy as np
-from numba import vectorize, uint16
+from numba import jit, prange, vectorize, uint16
 
 
 @vectorize([uint16(uint16, uint16)])
@@ -24,6 +24,89 @@ def neg_dif(x, y):
         return 0
 
 
+def _correct_frame(frame, dark, out, gain):
+    height, width = frame.shape
+    for i_row in prange(height):
+        for i_col in range(width):
+            if dark[i_row, i_col] < frame[i_row, i_col]:
+                value = frame[i_row, i_col] - dark[i_row, i_col]
+            else:
+                value = 0
+            if gain is None:
+                out[i_row, i_col] = value
+            else:
+                corrected = value * gain[i_row, i_col] + 0.5
+                out[i_row, i_col] = min(max(corrected, 0), 65535)
+
+
+# The same kernel is compiled in the two versions, the parallel one only if used:
+_correct_frame_serial = jit(nopython=True, nogil=True)(_correct_frame)
+_correct_frame_parallel = jit(nopython=True, nogil=True, parallel=True)(_correct_frame)
+
+
+def correct_frame(frame, dark, out, gain=None, parallel=False):
+    """Subtract the camera noise from a uint16 frame, clipping at 0, and optionally
+    multiply it by a flat-field gain map, writing the result in out (which can
+    be frame itself) without allocating any array.
+
+    Parameters
+    ----------
+    frame : np.ndarray
+        Frame from the camera.
+    dark : np.ndarray
+        Noise image to subtract, with the same shape and dtype as the frame.
+    out : np.ndarray
+        uint16 array in which the corrected frame is written, e.g. a plane of
+        the volume being assembled.
+    gain : np.ndarray, optional
+        float32 gain of every pixel, applied after subtracting the noise.
+    parallel : bool
+        If True, the rows are processed in parallel by numba threads.
+
+    """
+    if parallel:
+        _correct_frame_parallel(frame, dark, out, gain)
+    else:
+        _correct_frame_serial(frame, dark, out, gain)
+
+
+def decimate_envelope(values, n_bins):
+    """Decimate a signal to plot it with few points, keeping its peaks: the
+    signal is divided in n_bins bins, and the minimum and maximum of every bin
+    are kept, in the order in which they occur.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        Signal to decimate.
+    n_bins : int
+        Number of bins, the decimated signal has twice as many points.
+
+    Returns
+    -------
+    tuple
+        The indices of the points kept and their values.
+
+    """
+    n_values = len(values)
+    if n_values <= 2 * n_bins:
+        return np.arange(n_values), values.copy()
+    bin_length = -(-n_values // n_bins)
+    n_bins = -(-n_values // bin_length)
+    # the last bin is completed with the last value:
+    bins = np.pad(values, (0, n_bins * bin_length - n_values), mode="edge").reshape(
+        n_bins, bin_length
+    )
+    i_min, i_max = bins.argmin(axis=1), bins.argmax(axis=1)
+    starts = np.arange(n_bins) * bin_length
+    indices = np.stack(
+        [starts + np.minimum(i_min, i_max), starts + np.maximum(i_min, i_max)],
+        axis=1,
+    ).ravel()
+    indices = np.minimum(indices, n_values - 1)
+    return indices, values[indices]
+
+
 def lcm(a, b):
     """Return lowest common multiple."""
     return a * b // gcd(a, b)
@@ -65,12 +148,15 @@ class SpeedyArrayBuffer:
     Buffer for large data arrays based on numpy and using ctypes for speedy copy of data
     """
 
-    def __init__(self, size=None, *args, **kwargs):
+    def __init__(self, size=None, *args, array=None, **kwargs):
         """
-        Create a data object of the appropriate size.
+        Create a data object of the appropriate size, or wrap an existing uint16 array,
+        for instance one in shared memory.
         """
         super().__init__(**kwargs)
-        self.np_array = np.ascontiguousarray(np.empty(size // 2, dtype=np.uint16))
+        if array is None:
+            array = np.empty(size // 2, dtype=np.uint16)
+        self.np_array = np.ascontiguousarray(array)
         self.size = size
 
     def __getitem__(self, slice):
@@ -34,6 +34,8 @@ setup(
         "console_scripts": [
             "sashimi=sashimi.main:main",
             "sashimi-config=sashimi.config:cli_modify_config",
+            "sashimi-recover=sashimi.storage.recovery:cli_recover_dataset",
+            "sashimi-transcode=sashimi.storage.spill:cli_transcode_spill",
         ]
     },
 )
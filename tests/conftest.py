@@ -10,3 +10,22 @@ def temp_path():
     path = Path(tempfile.mkdtemp())
     yield path
     shutil.rmtree(path)
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--benchmark", action="store_true", help="Also run the benchmarks."
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: timing comparison, not a test")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmark"):
+        return
+    skip_benchmark = pytest.mark.skip(reason="benchmark, run with --benchmark")
+    for item in items:
+        if item.get_closest_marker("benchmark") is not None:
+            item.add_marker(skip_benchmark)
@@ -0,0 +1,59 @@
+import numpy as np
+from sashimi.storage.benchmark import (
+    CompressionResult,
+    benchmark_compression,
+    check_throughput,
+    choose_compression,
+    synthetic_volumes,
+)
+
+
+def test_benchmark_compression(temp_path):
+    volumes = synthetic_volumes((2, 32, 32), n_volumes=2)
+    assert volumes.shape == (2, 2, 32, 32)
+    assert volumes.dtype == np.uint16
+
+    progress = []
+    results = benchmark_compression(
+        volumes,
+        "h5",
+        codecs=("lz4", "zstd"),
+        levels=(1, 5),
+        threads=(1,),
+        progress_callback=lambda n_done, n_total: progress.append((n_done, n_total)),
+    )
+    assert len(results) == 4
+    assert progress == [(1, 4), (2, 4), (3, 4), (4, 4)]
+    assert all(r.shuffle == "byte" for r in results)
+    assert all(r.volumes_per_second > 0 for r in results)
+
+
+def test_choose_compression():
+    results = [
+        CompressionResult("lz4", 1, "byte", 1, ratio=1.5, volumes_per_second=100),
+        CompressionResult("zstd", 5, "byte", 1, ratio=2.5, volumes_per_second=30),
+        CompressionResult("zstd", 9, "byte", 1, ratio=3.0, volumes_per_second=5),
+    ]
+    assert choose_compression(results, volume_rate=10).codec == "zstd"
+    assert choose_compression(results, volume_rate=10).clevel == 5
+    # two writers share the load:
+    assert choose_compression(results, volume_rate=20, n_writers=2).clevel == 5
+    assert choose_compression(results, volume_rate=40).codec == "lz4"
+    # if nothing keeps up, the fastest:
+    assert choose_compression(results, volume_rate=1000).codec == "lz4"
+
+
+def test_check_throughput():
+    check = check_throughput(
+        volume_rate=10, saving_rate=12, volume_MB=5, n_volumes=1000, max_queue_MB=100
+    )
+    assert check.peak_queue_MB == 0
+    assert not check.overflows
+
+    # 8 volumes/s backlog over 100 s:
+    check = check_throughput(
+        volume_rate=10, saving_rate=2, volume_MB=5, n_volumes=1000, max_queue_MB=1000
+    )
+    assert check.peak_queue_MB == 4000
+    assert check.overflows
+    assert check.seconds_to_overflow == 25
@@ -0,0 +1,43 @@
+import time
+
+from sashimi.hardware.cameras.interface import SdkCallCounter
+from sashimi.hardware.cameras.mock import MockCamera
+
+
+class FakeSdk:
+    def __init__(self):
+        self.n_reads = 0
+
+    def getvalue(self, value):
+        self.n_reads += 1
+        return value
+
+
+def test_sdk_call_counter():
+    sdk = FakeSdk()
+    counter = SdkCallCounter(sdk)
+    assert counter.rates() == dict()
+    for i in range(10):
+        assert counter.getvalue(i) == i
+    time.sleep(0.01)
+    rates = counter.rates()
+    assert list(rates.keys()) == ["getvalue"]
+    assert 0 < rates["getvalue"] <= 10 / 0.01
+    assert counter.counts["getvalue"] == sdk.n_reads == 10
+    # only the calls since the previous check are counted:
+    assert counter.rates() == dict()
+
+
+def test_property_cache():
+    camera = MockCamera()
+    sdk = FakeSdk()
+    for _ in range(3):
+        assert camera.cached("frame_shape", lambda: sdk.getvalue((256, 256))) == (
+            256,
+            256,
+        )
+    assert sdk.n_reads == 1
+    camera.invalidate_cache()
+    camera.cached("frame_shape", lambda: sdk.getvalue((128, 128)))
+    assert camera.cached("frame_shape", lambda: None) == (128, 128)
+    assert sdk.n_reads == 2
@@ -0,0 +1,54 @@
+import numpy as np
+from sashimi.events import LoggedEvent, SashimiEvents
+from sashimi.processes.dispatcher import VolumeDispatcher
+from sashimi.processes.frame_ring import FrameRing
+from sashimi.processes.logging import ConcurrenceLogger
+from sashimi.processes.volume_ring import VolumeRing
+
+
+def make_dispatcher(n_planes):
+    logger = ConcurrenceLogger("test")
+    saving_signal = LoggedEvent(logger, SashimiEvents.IS_SAVING)
+    saving_signal.set()
+    dispatcher = VolumeDispatcher(
+        stop_event=LoggedEvent(logger, SashimiEvents.CLOSE_ALL),
+        saving_signal=saving_signal,
+        wait_signal=LoggedEvent(logger, SashimiEvents.WAITING_FOR_TRIGGER),
+        noise_subtraction_on=LoggedEvent(
+            logger, SashimiEvents.NOISE_SUBTRACTION_ACTIVE
+        ),
+        frame_ring=FrameRing(max_mbytes=1),
+        volume_ring=VolumeRing(max_mbytes=1),
+    )
+    dispatcher.n_planes = n_planes
+    return dispatcher
+
+
+def test_dispatcher_skips_lost_frames():
+    dispatcher = make_dispatcher(n_planes=3)
+    frame_numbers = [0, 1, 2, 4, 5, 10, 11, 13, 17]
+    for frame_number in frame_numbers:
+        dispatcher.process_frame(
+            np.full((4, 5), frame_number + 1, np.uint16), (frame_number, 0, -1)
+        )
+    assert dispatcher.n_lost_frames == 9
+    # frames 6, 7 and 8 would have made a volume, which is not published:
+    assert dispatcher.n_dropped == 1
+
+    volumes = []
+    while dispatcher.volume_ring.qsize("saver") > 0:
+        _, volume, metadata = dispatcher.volume_ring.get(
+            "saver", timeout=1, with_metadata=True
+        )
+        volumes.append((volume.copy(), metadata))
+    # the lost frames leave blank planes, and the others are in their plane:
+    for volume, metadata in volumes:
+        for plane, frame_number in zip(volume, metadata["frame_number"]):
+            assert np.all(plane == frame_number + 1)
+    assert [list(metadata["frame_number"]) for _, metadata in volumes] == [
+        [0, 1, 2],
+        [-1, 4, 5],
+        [-1, 10, 11],
+        [-1, 13, -1],
+        [-1, -1, 17],
+    ]
@@ -0,0 +1,89 @@
+import time
+from multiprocessing import Queue
+
+from arrayqueues.shared_arrays import ArrayQueue
+import numpy as np
+from sashimi.events import LoggedEvent, SashimiEvents
+from sashimi.processes.logging import ConcurrenceLogger, Doorbell, LoggingProcess
+
+
+def test_doorbell_rings_on_event_changes():
+    logger = ConcurrenceLogger("test")
+    event = LoggedEvent(logger, SashimiEvents.IS_SAVING)
+    doorbell = Doorbell()
+    reference = event.new_reference(logger, doorbell)
+
+    assert not doorbell.wait(timeout=0.01)
+    event.set()
+    assert doorbell.wait(timeout=1)
+    # the doorbell is silent again after waking up:
+    assert not doorbell.wait(timeout=0.01)
+    reference.clear()
+    event.clear()
+    assert doorbell.wait(timeout=1)
+    assert not doorbell.wait(timeout=0.01)
+
+
+def test_doorbell_wakes_on_queues():
+    doorbell = Doorbell()
+    queue, array_queue = Queue(), ArrayQueue(max_mbytes=1)
+    assert not doorbell.wait([queue, array_queue], timeout=0.01)
+    array_queue.put(np.zeros(10))
+    assert doorbell.wait([queue, array_queue], timeout=1)
+    array_queue.get()
+    queue.put(1)
+    assert doorbell.wait([queue, array_queue], timeout=1)
+
+
+class RingingReader:
+    """Reader of the doorbell pipe which rings the doorbell while it is
+    drained, as another process could.
+    """
+
+    def __init__(self, doorbell):
+        self.doorbell = doorbell
+        self.reader = doorbell.reader
+        self.n_rings = 1
+
+    def __getattr__(self, name):
+        return getattr(self.reader, name)
+
+    def recv_bytes(self):
+        received = self.reader.recv_bytes()
+        if self.n_rings > 0:
+            self.n_rings -= 1
+            self.doorbell.ring()
+        return received
+
+
+def test_doorbell_rung_while_waking_up():
+    doorbell = Doorbell()
+    doorbell.reader = RingingReader(doorbell)
+    doorbell.ring()
+    assert doorbell.wait(timeout=1)
+    # the doorbell still rings after a ring during the drain:
+    doorbell.ring()
+    assert doorbell.wait(timeout=1)
+    assert not doorbell.wait(timeout=0.01)
+
+
+class SleepingProcess(LoggingProcess):
+    def __init__(self, stop_event):
+        super().__init__(name="sleeping")
+        self.stop_event = stop_event.new_reference(self.logger, self.doorbell)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.wait_for_work(timeout=10)
+
+
+def test_process_sleeps_until_stopped():
+    stop_event = LoggedEvent(ConcurrenceLogger("test"), SashimiEvents.CLOSE_ALL)
+    process = SleepingProcess(stop_event)
+    process.start()
+    time.sleep(0.5)
+    stop_event.set()
+    process.join(timeout=5)
+    assert not process.is_alive()
+    busy, idle, cpu = process.load
+    assert idle > busy
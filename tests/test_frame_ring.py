@@ -0,0 +1,94 @@
+from queue import Empty, Full
+
+import numpy as np
+import pytest
+from sashimi.processes.frame_ring import FrameRing
+
+
+def test_frame_ring_in_place():
+    ring = FrameRing(max_mbytes=8 * 4 * 5 * 2 / 1e6)
+    buffers = ring.allocate(4 * 5 * 2)
+    # two of the eight buffers are kept for copies:
+    assert len(buffers) == 6
+
+    # the camera acquires in the buffers, the frames are not copied:
+    for i_frame in range(3):
+        buffers[i_frame][:] = i_frame
+    ring.written(3)
+    ring.put_batch(
+        [buffers[i_frame].reshape(4, 5) for i_frame in range(3)],
+        [(i_frame, 0, -1) for i_frame in range(3)],
+    )
+    assert ring.in_flight() == 3
+    assert ring.qsize() == 1
+    batch = ring.get_batch()
+    assert [metadata[0] for _, _, metadata in batch] == [0, 1, 2]
+    frame_ref, frame, _ = batch[0]
+    assert np.shares_memory(frame, buffers[0])
+    np.testing.assert_array_equal(frame, np.zeros((4, 5)))
+    assert ring.release([frame_ref]) == 0
+
+    # the camera wrote over the second frame before it was read, counting
+    # frames it lost in the numbering:
+    ring.written(8)
+    assert ring.overwritten(batch[1][0])
+    assert not ring.overwritten(batch[2][0])
+    assert ring.release([frame_ref for frame_ref, _, _ in batch[1:]]) == 1
+    assert ring.in_flight() == 0
+
+
+def test_frame_ring_copies_out_when_behind():
+    ring = FrameRing(max_mbytes=8 * 4 * 5 * 2 / 1e6)
+    buffers = ring.allocate(4 * 5 * 2)
+    for i_frame in range(5):
+        buffers[i_frame][:] = i_frame
+    ring.written(5)
+    ring.put_batch(
+        [buffers[i_frame].reshape(4, 5) for i_frame in range(5)],
+        [(i_frame, 0, -1) for i_frame in range(5)],
+    )
+    batch = ring.get_batch()
+    # once half of the camera buffers wait to be read, the frames are copied:
+    assert [frame_ref[1] for frame_ref, _, _ in batch] == [
+        False,
+        False,
+        False,
+        True,
+        True,
+    ]
+    assert not np.shares_memory(batch[3][1], buffers[3])
+    np.testing.assert_array_equal(batch[4][1], np.full((4, 5), 4))
+    # the copies are safe from the camera writing its buffers again:
+    ring.written(20)
+    assert ring.release([frame_ref for frame_ref, _, _ in batch]) == 3
+    assert ring.in_flight() == 0
+
+
+def test_frame_ring_copy():
+    frame = np.random.randint(0, 1000, (4, 5)).astype(np.uint16)
+    ring = FrameRing(max_mbytes=2 * frame.nbytes / 1e6)
+    ring.put(frame)
+    with pytest.raises(Full):
+        ring.put_batch([frame, frame], [(0, 0, -1), (1, 0, -1)])
+    frame_ref, received, _ = ring.get_batch()[0]
+    np.testing.assert_array_equal(received, frame)
+    assert len(ring.get_batch()) == 1  # the frame which fitted was sent
+    assert ring.release([frame_ref]) == 0
+    ring.put(frame)
+
+    # a new frame size drops the frames not yet received:
+    ring.put(np.ones((2, 5), np.uint16))
+    _, received, _ = ring.get_batch()[0]
+    assert received.shape == (2, 5)
+    with pytest.raises(Empty):
+        ring.get_batch(timeout=0.01)
+
+
+def test_frame_ring_clear():
+    ring = FrameRing(max_mbytes=0.01)
+    frame = np.ones((8, 8), np.uint16)
+    ring.put_batch([frame, frame], [(0, 0, -1), (1, 0, -1)])
+    ring.put(frame)
+    assert ring.qsize() == 2
+    ring.clear()
+    assert ring.in_flight() == 0
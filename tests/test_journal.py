@@ -0,0 +1,59 @@
+import json
+import numpy as np
+import flammkuchen as fl
+from sashimi.storage import H5Backend
+from sashimi.storage.journal import ChunkJournal, chunk_entry
+from sashimi.storage.recovery import recover_dataset
+
+
+def test_journal_ignores_cut_lines(temp_path):
+    journal = ChunkJournal(temp_path)
+    journal.start(dict(chunk_size=2))
+    data = np.arange(2 * 3 * 4, dtype=np.uint16).reshape(2, 1, 3, 4)
+    journal.append(chunk_entry(1, 2, data))
+    journal.append(chunk_entry(0, 0, data))
+    with open(journal.path, "a") as f:
+        f.write('{"i_chunk": 2, "volu')
+
+    header, entries = journal.contiguous_chunks()
+    assert header == dict(chunk_size=2)
+    assert [entry["i_chunk"] for entry in entries] == [0, 1]
+    assert entries[1]["volumes"] == [2, 4]
+    assert entries[1]["nbytes"] == data.nbytes
+
+
+def test_journal_validity(temp_path):
+    journal = ChunkJournal(temp_path)
+    assert not journal.is_valid()
+    # a dataset without a journal header cannot be resumed:
+    with open(journal.path, "w") as f:
+        f.write('{"frame_sh')
+    assert not journal.is_valid()
+    journal.start(dict(frame_shape=[1, 3, 4], chunk_size=2))
+    assert journal.is_valid()
+
+
+def test_recover_interrupted_dataset(temp_path):
+    backend = H5Backend(temp_path)
+    backend.prepare((1, 4, 4), np.uint16, n_volumes=20, chunk_size=3)
+    backend.start_journal(dict(voxel_size=[1, 2, 3], shape_full=[20, 1, 4, 4]))
+    data = np.random.randint(0, 1000, (10, 1, 4, 4)).astype(np.uint16)
+    for i_chunk, i_start in enumerate(range(0, 10, 3)):
+        chunk = data[i_start : i_start + 3]
+        backend.write_chunk(i_chunk, chunk)
+        backend.journal.append(chunk_entry(i_chunk, i_start, chunk))
+    # corrupt the third chunk, the ones from there on cannot be recovered:
+    fl.save(temp_path / "original" / "0002.h5", {"stack_4D": data[:3] + 1})
+    assert not (temp_path / "original" / "stack_metadata.json").is_file()
+
+    n_volumes = recover_dataset(temp_path)
+
+    assert n_volumes == 6
+    assert sorted(p.name for p in backend.root.glob("*.h5")) == [
+        "0000.h5",
+        "0001.h5",
+    ]
+    with open(backend.root / "stack_metadata.json") as f:
+        metadata = json.load(f)
+    assert metadata["shape_full"] == [6, 1, 4, 4]
+    assert metadata["voxel_size"] == [1, 2, 3]
@@ -0,0 +1,45 @@
+from multiprocessing import Process, Queue
+
+import pytest
+from sashimi.processes.logging import Doorbell
+from sashimi.processes.mailbox import ParameterMailbox
+
+
+def test_mailbox_returns_latest_parameters_once():
+    doorbell = Doorbell()
+    mailbox = ParameterMailbox(doorbell=doorbell)
+    assert mailbox.get() is None
+
+    mailbox.put(dict(n_planes=3))
+    mailbox.put(dict(n_planes=4))
+    assert doorbell.wait(timeout=1)
+    assert mailbox.changed()
+    assert mailbox.get() == dict(n_planes=4)
+    assert not mailbox.changed()
+    assert mailbox.get() is None
+
+
+def test_mailbox_rejects_large_parameters():
+    mailbox = ParameterMailbox(max_bytes=100)
+    with pytest.raises(ValueError):
+        mailbox.put(list(range(1000)))
+    assert mailbox.get() is None
+
+
+def read_mailbox(mailbox, results):
+    results.put(mailbox.get())
+    results.put(mailbox.get())
+
+
+def test_mailbox_read_by_another_process():
+    mailbox = ParameterMailbox()
+    mailbox.put("first")
+    # reading in this process does not consume the parameters for the others:
+    assert mailbox.get() == "first"
+    mailbox.put("second")
+    results = Queue()
+    process = Process(target=read_mailbox, args=(mailbox, results))
+    process.start()
+    assert results.get(timeout=5) == "second"
+    assert results.get(timeout=5) is None
+    process.join(timeout=5)
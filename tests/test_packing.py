@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+from sashimi.storage.packing import (
+    storage_dtypes,
+    stored_shape,
+    store_volume,
+    restore_volumes,
+)
+
+
+@pytest.mark.parametrize("width", [8, 9])
+@pytest.mark.parametrize("storage_dtype", ["uint16", "uint8", "uint12"])
+def test_store_restore(storage_dtype, width):
+    volumes = np.random.randint(0, 5000, (2, 3, 4, width)).astype(np.uint16)
+    stored = np.empty(
+        (2, *stored_shape(volumes.shape[1:], storage_dtype)),
+        dtype=storage_dtypes[storage_dtype],
+    )
+    for volume, stored_volume in zip(volumes, stored):
+        store_volume(volume, stored_volume, storage_dtype)
+
+    saturation = dict(uint16=65535, uint8=255, uint12=4095)[storage_dtype]
+    restored = restore_volumes(stored, storage_dtype, width)
+    np.testing.assert_array_equal(restored, np.minimum(volumes, saturation))
+    if storage_dtype == "uint12":
+        assert stored.nbytes == 2 * 3 * 4 * ((width + 1) // 2) * 3
@@ -0,0 +1,53 @@
+import json
+
+import numpy as np
+import flammkuchen as fl
+from sashimi.storage.h5 import H5Backend
+from sashimi.storage.packing import storage_dtypes, stored_shape, store_volume
+from sashimi.storage.pyramid import PyramidWriter, block_mean, max_projection
+
+
+def test_block_mean_and_projection():
+    volumes = np.arange(2 * 3 * 4 * 5, dtype=np.uint16).reshape(2, 3, 4, 5)
+    downsampled = block_mean(volumes, 2)
+    assert downsampled.shape == (2, 3, 2, 2)
+    assert downsampled.dtype == np.uint16
+    assert downsampled[0, 0, 0, 0] == int(np.mean(volumes[0, 0, :2, :2]))
+    np.testing.assert_array_equal(max_projection(volumes), volumes[:, -1:])
+
+
+def test_pyramid_writer(temp_path):
+    volumes = np.random.randint(0, 4000, (6, 3, 8, 8)).astype(np.uint16)
+    stored = np.empty(
+        (6, *stored_shape(volumes.shape[1:], "uint12")), dtype=storage_dtypes["uint12"]
+    )
+    for volume, stored_volume in zip(volumes, stored):
+        store_volume(volume, stored_volume, "uint12")
+
+    pyramid = PyramidWriter(lambda name: H5Backend(temp_path, name=name), "uint12")
+    pyramid.prepare(volumes.shape[1:], n_volumes=6, chunk_size=4)
+    pyramid.write_chunk(0, stored[:4])
+    pyramid.write_chunk(1, stored[4:])
+    pyramid.finalize(
+        dict(
+            shape_full=(6, *stored.shape[1:]),
+            shape_block=(4, *stored.shape[1:]),
+            voxel_size=[10, 1, 1],
+            packing="12bit",
+        ),
+        6,
+    )
+
+    def load(name):
+        return np.concatenate(
+            [fl.load(temp_path / name / f"{i:04d}.h5", "/stack_4D") for i in (0, 1)]
+        )
+
+    np.testing.assert_array_equal(load("downsampled_2x"), block_mean(volumes, 2))
+    assert load("downsampled_4x").shape == (6, 3, 2, 2)
+    np.testing.assert_array_equal(load("mip"), max_projection(volumes))
+    with open(temp_path / "downsampled_4x" / "stack_metadata.json") as f:
+        metadata = json.load(f)
+    assert metadata["shape_full"] == [6, 3, 2, 2]
+    assert metadata["voxel_size"] == [10, 4, 4]
+    assert metadata["packing"] is None
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from sashimi.storage import backend_class_dict
+from sashimi.storage.interface import StorageException
+from sashimi.storage.reader import SavedDataset
+
+
+def save_dataset(path, file_format, data, chunk_size):
+    backend = backend_class_dict[file_format](path, time_block=chunk_size)
+    backend.prepare(data.shape[1:], data.dtype, len(data), chunk_size)
+    for i_chunk, i_start in enumerate(range(0, len(data), chunk_size)):
+        backend.write_chunk(i_chunk, data[i_start : i_start + chunk_size])
+    backend.finalize(
+        dict(
+            shape_full=data.shape,
+            shape_block=(chunk_size, *data.shape[1:]),
+            voxel_size=[1, 1, 1],
+            dtype="uint16",
+        ),
+        len(data),
+    )
+
+
+@pytest.mark.parametrize("file_format", ["h5", "zarr"])
+def test_saved_dataset_slicing(temp_path, file_format):
+    if file_format not in backend_class_dict:
+        pytest.skip(f"{file_format} not installed")
+    data = np.random.randint(0, 1000, (11, 2, 4, 5)).astype(np.uint16)
+    save_dataset(temp_path, file_format, data, chunk_size=3)
+
+    with SavedDataset(temp_path, cache_MB=1e-3, prefetch=True) as dataset:
+        assert dataset.shape == data.shape
+        assert dataset.n_chunks == 4
+        np.testing.assert_array_equal(dataset[4], data[4])
+        np.testing.assert_array_equal(dataset[-1, 1], data[-1, 1])
+        np.testing.assert_array_equal(dataset[1:10:2, 0, 1:3], data[1:10:2, 0, 1:3])
+        np.testing.assert_array_equal(dataset[[7, 2, 3]], data[[7, 2, 3]])
+        assert dataset[5:5].shape == (0, 2, 4, 5)
+        with pytest.raises(IndexError):
+            dataset[11]
+
+
+def test_saved_dataset_reads_needed_chunks(temp_path):
+    data = np.random.randint(0, 1000, (12, 2, 4, 5)).astype(np.uint16)
+    save_dataset(temp_path, "h5", data, chunk_size=4)
+
+    dataset = SavedDataset(temp_path)
+    np.testing.assert_array_equal(dataset[:6, 1], data[:6, 1])
+    assert dataset.n_chunks_read == 2
+    np.testing.assert_array_equal(dataset[2:8, 0], data[2:8, 0])
+    assert dataset.n_chunks_read == 2
+
+    with pytest.raises(StorageException):
+        SavedDataset(temp_path / "missing")
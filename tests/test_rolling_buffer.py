@@ -0,0 +1,140 @@
+import timeit
+
+import numpy as np
+import pytest
+from sashimi.rolling_buffer import FillingRollingBuffer, RollingBuffer
+
+
+@pytest.mark.parametrize("start, n", [(2, 5), (8, 5), (13, 10), (6, 25)])
+def test_rolling_buffer_read(start, n):
+    buffer = RollingBuffer(10)
+    buffer.buffer[:] = np.arange(10)
+    expected = np.arange(start, start + n) % 10
+    np.testing.assert_array_equal(buffer.read(start, n), expected)
+    out = np.empty(n)
+    assert buffer.read(start, n, out=out) is out
+    np.testing.assert_array_equal(out, expected)
+
+
+@pytest.mark.parametrize("start, n", [(2, 5), (8, 5), (13, 10), (6, 25)])
+def test_rolling_buffer_write(start, n):
+    buffer = RollingBuffer(10)
+    buffer.write(np.arange(n), start)
+    expected = np.zeros(10)
+    for value in range(n):
+        expected[(start + value) % 10] = value
+    np.testing.assert_array_equal(buffer.buffer, expected)
+
+
+def test_filling_rolling_buffer():
+    buffer = FillingRollingBuffer(10)
+    buffer.write(np.ones(4), 8)
+    buffer.write(np.ones(4), 9)
+    assert buffer.n_filled == 5
+    assert not buffer.is_complete()
+    buffer.write(np.ones(5), 3)
+    assert buffer.is_complete()
+    buffer = FillingRollingBuffer(10)
+    buffer.write(np.ones(25), 7)
+    assert buffer.is_complete()
+
+
+def read_circular_previous(a, i_start, n):
+    output = np.zeros(n)
+    n_el = len(a)
+    i_read = i_start % len(a)
+    for i_insert in range(n):
+        output[i_insert] = a[i_read]
+        i_read = (i_read + 1) % n_el
+    return output
+
+
+def write_circular_previous(a, i_start, data):
+    i_insert = i_start % len(a)
+    n_el = len(a)
+    for i_read in range(len(data)):
+        a[i_insert] = data[i_read]
+        i_insert = (i_insert + 1) % n_el
+
+
+class PreviousFillingRollingBuffer:
+    """The sample by sample implementation the vectorized one replaced, with
+    its functions compiled by numba when given.
+    """
+
+    def __init__(self, length, jit=None):
+        self.buffer = np.zeros(length)
+        self.filled = np.zeros(length, dtype=bool)
+        self.read_circular = read_circular_previous
+        self.write_circular = write_circular_previous
+        if jit is not None:
+            self.read_circular = jit(read_circular_previous)
+            self.write_circular = jit(write_circular_previous)
+
+    def read(self, start, n_samples_total):
+        return self.read_circular(self.buffer, start, n_samples_total)
+
+    def write(self, to_write, start):
+        self.write_circular(self.buffer, start, to_write)
+        self.write_circular(self.filled, start, np.ones(len(to_write), dtype=bool))
+
+    def is_complete(self):
+        return np.all(self.filled)
+
+
+def test_rolling_buffer_matches_previous():
+    rng = np.random.default_rng(0)
+    buffer = FillingRollingBuffer(100)
+    previous = PreviousFillingRollingBuffer(100)
+    for _ in range(50):
+        start, n = rng.integers(0, 1000), rng.integers(1, 250)
+        data = rng.random(n)
+        buffer.write(data, start)
+        previous.write(data, start)
+        np.testing.assert_array_equal(buffer.buffer, previous.buffer)
+        assert buffer.is_complete() == previous.is_complete()
+        start, n = rng.integers(0, 1000), rng.integers(1, 250)
+        np.testing.assert_array_equal(buffer.read(start, n), previous.read(start, n))
+
+
+@pytest.mark.benchmark
+def test_rolling_buffer_benchmark():
+    """Compare the speed of reading and writing blocks of a scanning loop with
+    the previous implementation compiled by numba, run with
+    pytest --benchmark -s to see the timings.
+    """
+    numba = pytest.importorskip("numba")
+    length, n_samples, n_repeats = 40000, 10000, 200
+    block = np.random.rand(n_samples)
+    out = np.empty(n_samples)
+    timings, results = {}, {}
+    for name, buffer, read_kwargs in [
+        ("previous", PreviousFillingRollingBuffer(length, numba.njit), dict()),
+        ("sashimi", FillingRollingBuffer(length), dict(out=out)),
+    ]:
+        # compile the numba functions before timing:
+        buffer.write(block, 0)
+        buffer.read(35000, n_samples, **read_kwargs)
+        timings[name] = dict(
+            write=timeit.timeit(lambda: buffer.write(block, 35000), number=n_repeats),
+            read=timeit.timeit(
+                lambda: buffer.read(35000, n_samples, **read_kwargs),
+                number=n_repeats,
+            ),
+            is_complete=timeit.timeit(buffer.is_complete, number=n_repeats),
+        )
+        results[name] = (
+            buffer.read(35000, n_samples, **read_kwargs).copy(),
+            buffer.is_complete(),
+        )
+    # both give the same results:
+    np.testing.assert_array_equal(results["previous"][0], results["sashimi"][0])
+    assert results["previous"][1] == results["sashimi"][1]
+    for name, timing in timings.items():
+        print(
+            name,
+            ", ".join(
+                f"{operation} {duration / n_repeats * 1e6:.1f} us"
+                for operation, duration in timing.items()
+            ),
+        )
@@ -0,0 +1,32 @@
+import numpy as np
+from sashimi.processes.scan_timing import ScanTiming
+
+
+def test_scan_timing_histograms():
+    timing = ScanTiming(block_duration=0.1)
+    timing.add_durations([1e-4, 2e-3, 0.05, 0.1, 0.2])
+    timing.add_durations([1e-4, 2e-3, 0.05, 0.05, 0.1])
+    assert timing.n_iterations == 2
+    histograms = timing.histograms()
+    assert histograms["update_settings"].sum() == 2
+    bin_read = np.searchsorted(timing.duration_edges, [0.05, 0.1])
+    assert histograms["read"][bin_read[0]] == 1
+    assert histograms["read"][bin_read[1]] == 1
+    summary = timing.summary()
+    assert summary["max_durations"]["iteration"] == 0.2
+    np.testing.assert_allclose(summary["mean_durations"]["read"], 0.075)
+
+
+def test_scan_timing_slack():
+    timing = ScanTiming(block_duration=0.1)
+    assert not timing.add_slack(0.15)
+    assert timing.add_slack(0.01)
+    # an underrun is counted in the first bins:
+    assert timing.add_slack(-0.2)
+    assert timing.slack_histogram()[0] == 1
+    assert timing.slack_histogram().sum() == 3
+    assert timing.summary()["n_low_slack"] == 2
+    assert timing.summary()["min_slack"] == -0.2
+    timing.reset()
+    assert timing.slack_histogram().sum() == 0
+    assert timing.min_slack.value == np.inf
@@ -0,0 +1,123 @@
+from dataclasses import replace
+from multiprocessing import Event
+from queue import Queue
+
+import numpy as np
+import pytest
+from sashimi.hardware.scanning import ScanningWarning
+from sashimi.hardware.scanning.mock import MockBoard
+from sashimi.hardware.scanning.scanloops import (
+    ScanningState,
+    ScanParameters,
+    TriggeringParameters,
+    VolumetricScanLoop,
+    ZScanning,
+)
+from sashimi.processes.logging import ConcurrenceLogger
+from sashimi.processes.mailbox import ParameterMailbox
+from sashimi.waveforms import SawtoothWaveform
+
+
+def make_volumetric_loop(parameters, sample_rate=1000, n_samples=100):
+    mailbox = ParameterMailbox()
+    loop = VolumetricScanLoop(
+        board=MockBoard(sample_rate, n_samples, dict()),
+        stop_event=Event(),
+        restart_event=Event(),
+        initial_parameters=parameters,
+        parameter_mailbox=mailbox,
+        n_samples=n_samples,
+        sample_rate=sample_rate,
+        waveform_queue=None,
+        wait_signal=Event(),
+        logger=ConcurrenceLogger("test"),
+        trigger_exp_from_scanner=Event(),
+    )
+    return loop, mailbox
+
+
+def test_waveform_table_blocks():
+    parameters = ScanParameters(
+        state=ScanningState.VOLUMETRIC,
+        z=ZScanning(piezo_min=1, piezo_max=3, frequency=2),
+        triggering=TriggeringParameters(n_planes=4),
+    )
+    loop, mailbox = make_volumetric_loop(parameters)
+    loop.update_settings()
+    assert loop.n_samples_period() == 500
+
+    # the blocks, also wrapping around the end of the period, are the
+    # waveform at the samples of the period:
+    waveform = SawtoothWaveform(frequency=2, vmin=1, vmax=3)
+    for i_sample in [0, 200, 450]:
+        loop.i_sample = i_sample
+        loop.fill_arrays()
+        samples = (np.arange(100) + i_sample) % 500
+        np.testing.assert_allclose(
+            loop.board.piezo_array, waveform.values(samples / 1000)
+        )
+
+    # the table is computed again only for new parameters:
+    table = loop.waveform_table
+    loop.fill_arrays()
+    assert loop.waveform_table is table
+    mailbox.put(replace(parameters, z=ZScanning(piezo_min=0, piezo_max=1)))
+    loop.update_settings()
+    loop.fill_arrays()
+    assert loop.waveform_table is not table
+    assert loop.board.piezo_array.max() <= 1
+
+
+def test_scan_loop_low_slack_warning():
+    loop, _ = make_volumetric_loop(
+        ScanParameters(state=ScanningState.VOLUMETRIC, z=ZScanning(frequency=2))
+    )
+    assert loop.slack() is None
+    loop.check_start()
+    loop.write()
+    assert 0 < loop.slack() <= 0.1
+    # the board has played more samples than were written:
+    loop.start_time -= 1
+    with pytest.warns(ScanningWarning):
+        loop.check_slack()
+    assert loop.timing.n_low_slack.value == 1
+
+
+def test_long_period_computed_per_block():
+    parameters = ScanParameters(
+        state=ScanningState.VOLUMETRIC,
+        z=ZScanning(piezo_min=1, piezo_max=3, frequency=2),
+        triggering=TriggeringParameters(n_planes=4),
+    )
+    loop, _ = make_volumetric_loop(parameters)
+    loop.max_table_samples = 200
+    loop.update_settings()
+    loop.i_sample = 450
+    loop.fill_arrays()
+    assert loop.waveform_table is None
+    # without the table the blocks are computed on the time of their samples:
+    waveform = SawtoothWaveform(frequency=2, vmin=1, vmax=3)
+    np.testing.assert_allclose(
+        loop.board.piezo_array, waveform.values((np.arange(100) + 450) / 1000)
+    )
+
+
+def test_waveform_sent_decimated_and_throttled():
+    loop, _ = make_volumetric_loop(
+        ScanParameters(
+            state=ScanningState.VOLUMETRIC,
+            z=ZScanning(frequency=0.2),
+            triggering=TriggeringParameters(n_planes=4),
+        )
+    )
+    loop.waveform_queue = Queue()
+    loop.waveform_points = 200
+    loop.waveform_interval = 10
+    loop.update_settings()
+    for _ in range(3):
+        loop.read()
+    # the waveform is sent only once in an interval:
+    assert loop.waveform_queue.qsize() == 1
+    waveform = loop.waveform_queue.get()
+    assert waveform.shape == (2, 200)
+    assert waveform[0, -1] < 5
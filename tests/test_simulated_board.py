@@ -0,0 +1,50 @@
+import warnings
+
+import numpy as np
+from sashimi.hardware.cameras.simulation import TriggerLine
+from sashimi.hardware.scanning import ScanningWarning
+from sashimi.hardware.scanning.simulation import SimulatedBoard
+
+
+def test_simulated_board_piezo_response():
+    board = SimulatedBoard(
+        1000, 100, dict(), piezo_delay=0.01, piezo_time_constant=0.005
+    )
+    for _ in range(3):
+        board.z_piezo = np.ones(100)
+        board.write()
+    board.start()
+    board.read()
+    position = board.z_piezo.copy()
+    # the piezo follows the command with a delay and a low-pass filter:
+    np.testing.assert_array_equal(position[:10], 0)
+    assert np.all(np.diff(position[10:]) > 0)
+    assert position[-1] > 0.99
+    board.read()
+    np.testing.assert_allclose(board.z_piezo, 1, atol=0.01)
+
+
+def test_simulated_board_underrun():
+    line = TriggerLine()
+    board = SimulatedBoard(10000, 100, dict(), trigger_line=line)
+    pulses = np.zeros(100)
+    pulses[0] = 5
+    board.camera_trigger = pulses
+    board.write()
+    board.start()
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        board.write()
+        assert len(board.underruns) == 0
+        # the clock plays the first buffer in 10 ms:
+        board.wait_for_sample(300)
+        board.write()
+    assert len(board.underruns) == 1
+    assert any(issubclass(w.category, ScanningWarning) for w in caught)
+    assert board.min_margin < 0
+
+    # the pulses of the buffer written late are played when it is written:
+    times, _ = line.pending()
+    assert len(times) == 3
+    np.testing.assert_allclose(times[1] - times[0], 0.01, atol=1e-6)
+    assert times[2] - times[0] >= 0.03
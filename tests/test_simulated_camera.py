@@ -0,0 +1,67 @@
+import time
+
+import numpy as np
+from sashimi.hardware.cameras.interface import TriggerMode
+from sashimi.hardware.cameras.simulation import SimulatedCamera, TriggerLine
+from sashimi.hardware.scanning.mock import MockBoard
+from sashimi.processes.frame_ring import FrameRing
+
+
+def test_trigger_line():
+    line = TriggerLine(capacity=4)
+    now = time.time()
+    line.add([now - 2, now - 1, now + 10])
+    times, n_lost = line.take(now)
+    assert list(times) == [now - 2, now - 1]
+    assert n_lost == 0
+    assert line.next_pulse() == now + 10
+    # pulses which are not taken in time are lost:
+    line.add([now + 11, now + 12, now + 13, now + 14])
+    times, n_lost = line.take(now + 20)
+    assert n_lost == 1
+    assert list(times) == [now + 11, now + 12, now + 13, now + 14]
+
+
+def test_mock_board_pulses():
+    line = TriggerLine()
+    board = MockBoard(1000, 100, dict(), trigger_line=line)
+    board.start()
+    pulses = np.zeros(100)
+    pulses[[0, 50]] = 5
+    for _ in range(2):
+        board.camera_trigger = pulses
+        board.write()
+    times, _ = line.pending()
+    assert len(times) == 4
+    # the times are absolute, in s from time.time:
+    np.testing.assert_allclose(np.diff(times), 0.05, atol=1e-6)
+
+
+def test_simulated_camera_follows_pulses():
+    line = TriggerLine()
+    ring = FrameRing(max_mbytes=1)
+    camera = SimulatedCamera(max_sensor_resolution=(64, 64), trigger_line=line)
+    camera.frame_ring = ring
+    camera.binning = 2
+    camera.trigger_mode = TriggerMode.EXTERNAL_TRIGGER
+    camera.start_acquisition()
+    now = time.time()
+    line.add(now + np.arange(5) * 0.001)
+    frames = []
+    while len(frames) < 5:
+        frames.extend(camera.get_frames())
+    assert all(frame.shape == (32, 32) for frame in frames)
+    # the frames are acquired in the ring, and timestamped at the pulses:
+    assert all(ring.i_buffer(frame) is not None for frame in frames)
+    assert [number for number, _ in camera.frame_stamps][-1] == 4
+    assert abs(camera.frame_stamps[-1][1] - (now + 0.004) * 1e9) < 1000
+
+
+def test_simulated_camera_free_running():
+    camera = SimulatedCamera(max_sensor_resolution=(32, 32))
+    camera.exposure_time = 1
+    camera.start_acquisition()
+    time.sleep(0.05)
+    frames = camera.get_frames()
+    assert len(frames) >= 40
+    assert camera.frame_stamps[-1][0] == len(frames) - 1
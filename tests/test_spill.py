@@ -0,0 +1,78 @@
+import numpy as np
+import flammkuchen as fl
+from sashimi.processes.streaming_save import ChunkWriterPool
+from sashimi.storage.journal import chunk_entry
+from sashimi.storage.reader import SavedDataset
+from sashimi.storage.spill import RawSpillBackend, transcode_spill
+
+
+def test_transcode_spill(temp_path):
+    spill = RawSpillBackend(temp_path, "h5")
+    spill.prepare((2, 4, 4), np.uint16, n_volumes=10, chunk_size=4)
+    spill.start_journal(dict(voxel_size=[1, 1, 1]))
+    data = np.random.randint(0, 1000, (7, 2, 4, 4)).astype(np.uint16)
+    for i_chunk, i_start in enumerate(range(0, 7, 4)):
+        chunk = data[i_start : i_start + 4]
+        spill.write_chunk(i_chunk, chunk)
+        spill.journal.append(chunk_entry(i_chunk, i_start, chunk))
+    spill.finalize(dict(voxel_size=[1, 1, 1], shape_full=[7, 2, 4, 4]), 7)
+
+    progress = []
+    spill = RawSpillBackend.from_output_dir(temp_path)
+    n_volumes = transcode_spill(
+        spill, lambda n_done, n_total: progress.append((n_done, n_total))
+    )
+
+    assert n_volumes == 7
+    assert progress == [(1, 2), (2, 2)]
+    assert not spill.root.exists()
+    assert spill.target.has_dataset()
+    saved = np.concatenate(
+        [fl.load(temp_path / "original" / f"{i:04d}.h5", "/stack_4D") for i in (0, 1)]
+    )
+    np.testing.assert_array_equal(saved, data)
+
+
+def test_spill_in_place(temp_path):
+    spill = RawSpillBackend(temp_path, "h5")
+    spill.prepare((2, 4, 4), np.uint16, n_volumes=8, chunk_size=4)
+    spill.start_journal(dict(voxel_size=[1, 1, 1]))
+    # the file of the chunk is allocated in full before it is filled:
+    chunk = spill.chunk_array(0)
+    assert spill.chunk_path(0).stat().st_size == chunk.nbytes
+    data = np.random.randint(0, 1000, (3, 2, 4, 4)).astype(np.uint16)
+    chunk[:3] = data
+    del chunk
+
+    pool = ChunkWriterPool(n_writers=1, max_chunks_in_flight=1)
+    pool.submit(spill, None, None, 3, 0)
+    pool.shutdown()
+
+    _, entries = spill.journal.read()
+    assert entries[0] == chunk_entry(0, 0, data)
+    np.testing.assert_array_equal(spill.read_chunk(0, 3), data)
+
+
+def test_transcode_crashed_spill(temp_path):
+    spill = RawSpillBackend(temp_path, "h5")
+    spill.prepare((2, 4, 4), np.uint16, n_volumes=10, chunk_size=4)
+    # the metadata of the journal has the planned number of volumes:
+    spill.start_journal(
+        dict(
+            shape_full=[10, 2, 4, 4],
+            shape_block=[4, 2, 4, 4],
+            voxel_size=[1, 1, 1],
+            volume_shape=[2, 4, 4],
+        )
+    )
+    data = np.random.randint(0, 1000, (4, 2, 4, 4)).astype(np.uint16)
+    spill.write_chunk(0, data)
+    spill.journal.append(chunk_entry(0, 0, data))
+    # the experiment crashes before the spilled dataset is finalized
+
+    n_volumes = transcode_spill(RawSpillBackend.from_output_dir(temp_path))
+
+    assert n_volumes == 4
+    dataset = SavedDataset(temp_path)
+    assert dataset.shape == (4, 2, 4, 4)
+    np.testing.assert_array_equal(dataset[:], data)
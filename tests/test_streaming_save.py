@@ -0,0 +1,105 @@
+from multiprocessing import Queue
+
+import pytest
+import numpy as np
+import flammkuchen as fl
+from sashimi.events import LoggedEvent, SashimiEvents
+from sashimi.processes.logging import ConcurrenceLogger
+from sashimi.processes.streaming_save import (
+    ChunkWriterPool,
+    ChunkBufferRing,
+    SavingParameters,
+    StackSaver,
+    measure_saving_rate,
+    optimal_chunk_size,
+)
+from sashimi.storage import H5Backend
+from sashimi.storage.reader import SavedDataset
+
+
+def test_chunk_writer_pool(temp_path):
+    backend = H5Backend(temp_path)
+    backend.prepare((2, 8, 8), np.uint16, n_volumes=8, chunk_size=2)
+    pool = ChunkWriterPool(n_writers=2, max_chunks_in_flight=2)
+    ring = ChunkBufferRing((3, 2, 8, 8), np.uint16, n_buffers=3)
+    chunks = []
+    for i_chunk in range(6):
+        while not ring.next_is_free():
+            pool.collect(block=True)
+        i_buffer = ring.acquire()
+        chunk = ring.arrays[i_buffer]
+        chunk[:] = np.random.randint(0, 1000, chunk.shape)
+        chunks.append(chunk[:2].copy())
+        pool.submit(backend, ring, i_buffer, 2, i_chunk)
+        assert pool.n_in_flight <= 2
+    pool.shutdown()
+
+    assert pool.n_in_flight == 0
+    assert not any(ring.in_use)
+    assert ring.matches((3, 2, 8, 8), np.uint16, 3)
+    ring.close()
+    for i_chunk, chunk in enumerate(chunks):
+        saved = fl.load(temp_path / "original" / f"{i_chunk:04d}.h5", "/stack_4D")
+        np.testing.assert_array_equal(saved, chunk)
+
+
+@pytest.mark.parametrize("format", ["zarr", "n5"])
+def test_chunked_backends(temp_path, format):
+    zarr = pytest.importorskip("zarr")
+    from sashimi.storage import backend_class_dict
+
+    backend = backend_class_dict[format](temp_path, time_block=2)
+    chunk_size = backend.adjust_chunk_size(5)
+    assert chunk_size == 4
+
+    data = np.random.randint(0, 1000, (10, 3, 8, 6)).astype(np.uint16)
+    backend.prepare(data.shape[1:], data.dtype, n_volumes=12, chunk_size=chunk_size)
+    for i_chunk, i_start in enumerate(range(0, 10, chunk_size)):
+        backend.write_chunk(i_chunk, data[i_start : i_start + chunk_size])
+    backend.finalize(dict(voxel_size=(1, 1, 1)), n_volumes_saved=10)
+
+    assert backend.has_dataset()
+    saved = zarr.open_array(backend.store(), mode="r")
+    assert saved.chunks == (2, 1, 8, 6)
+    assert tuple(saved.attrs["voxel_size"]) == (1, 1, 1)
+    np.testing.assert_array_equal(saved[:], data)
+
+
+@pytest.mark.parametrize("n_writers", [0, 2])
+@pytest.mark.parametrize("spill", [False, True])
+def test_measure_saving_rate(temp_path, n_writers, spill):
+    volumes = np.random.randint(0, 1000, (2, 2, 16, 16)).astype(np.uint16)
+    params = SavingParameters(output_dir=temp_path, n_writers=n_writers, spill=spill)
+    assert measure_saving_rate(volumes, params, n_chunks=2, chunk_size=5) > 0
+    # the test files are removed:
+    assert list(temp_path.iterdir()) == []
+
+
+def test_optimal_chunk_size(temp_path):
+    # volumes of 1/1024 MB, in chunks of about 1 MB:
+    assert optimal_chunk_size(H5Backend(temp_path), (2, 16, 16), np.uint16, 1) == 1024
+    assert optimal_chunk_size(H5Backend(temp_path), (2, 16, 16), np.uint16, 0) == 1
+
+
+def test_stopped_dataset_length(temp_path):
+    logger = ConcurrenceLogger("test")
+    saver = StackSaver(
+        stop_event=LoggedEvent(logger, SashimiEvents.CLOSE_ALL),
+        is_saving_event=LoggedEvent(logger, SashimiEvents.IS_SAVING),
+        duration_queue=Queue(),
+        max_queue_size=1,
+    )
+    saver.save_parameters = SavingParameters(output_dir=temp_path)
+    saver.frame_shape = saver.volume_shape = (2, 4, 5)
+    saver.backend = H5Backend(temp_path)
+    saver.backend.prepare((2, 4, 5), np.uint16, n_volumes=10, chunk_size=2)
+    data = np.ones((2, 2, 4, 5), np.uint16)
+    saver.backend.write_chunk(0, data)
+    # the experiment is stopped after 2 of the 10 planned volumes:
+    saver.n_volumes = 10
+    saver.i_volume = 2
+    saver.finalize_dataset()
+
+    dataset = SavedDataset(temp_path)
+    assert dataset.shape == (2, 2, 4, 5)
+    np.testing.assert_array_equal(dataset[:], data)
@@ -1,5 +1,6 @@
 import numpy as np
-from sashimi.utilities import neg_dif
+import pytest
+from sashimi.utilities import correct_frame, decimate_envelope, neg_dif
 
 
 def test_noise_subtraction():
@@ -9,3 +10,31 @@ def test_noise_subtraction():
     overflows = np.where(t.astype(np.int32) - r.astype(np.int32) < 0)
     zeros = np.zeros_like(output[overflows])
     assert output[overflows].any() == zeros.any()
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_correct_frame(parallel):
+    frame = np.array([[10000, 5, 200], [300, 60000, 0]], dtype=np.uint16)
+    dark = np.array([[265, 20, 200], [100, 100, 100]], dtype=np.uint16)
+    out = np.empty_like(frame)
+    correct_frame(frame, dark, out, parallel=parallel)
+    np.testing.assert_array_equal(out, neg_dif(frame, dark))
+
+    gain = np.array([[1.0, 2.0, 0.5], [0.25, 2.0, 1.0]], dtype=np.float32)
+    correct_frame(frame, dark, frame, gain, parallel=parallel)
+    np.testing.assert_array_equal(frame, [[9735, 0, 0], [50, 65535, 0]])
+
+
+def test_decimate_envelope():
+    values = np.sin(np.arange(1005) / 50)
+    values[333] = 5
+    values[1004] = -5
+    indices, decimated = decimate_envelope(values, 100)
+    assert len(decimated) <= 200
+    assert np.all(np.diff(indices) >= 0)
+    np.testing.assert_array_equal(decimated, values[indices])
+    # the peaks are kept:
+    assert 333 in indices and 1004 in indices
+
+    indices, decimated = decimate_envelope(values[:150], 100)
+    np.testing.assert_array_equal(indices, np.arange(150))
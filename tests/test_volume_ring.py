@@ -0,0 +1,70 @@
+from queue import Empty, Full
+
+import numpy as np
+import pytest
+from sashimi.processes.volume_ring import VolumeRing
+
+
+def test_volume_ring_shares_slots():
+    volume = np.random.randint(0, 1000, (2, 4, 5)).astype(np.uint16)
+    ring = VolumeRing(max_mbytes=3 * volume.nbytes / 1e6)
+
+    i_slot = ring.acquire(volume.shape)
+    ring.slot(i_slot)[:] = volume
+    ring.publish(i_slot, ["viewer", "saver"])
+    viewer_slot, viewer_volume = ring.get("viewer")
+    saver_slot, saver_volume = ring.get("saver")
+    # both consumers read the same memory:
+    assert np.shares_memory(viewer_volume, saver_volume)
+    np.testing.assert_array_equal(saver_volume, volume)
+
+    ring.put(volume, ["saver"])
+    ring.put(volume, [])  # published to nobody, the slot is free again
+    ring.put(volume, ["saver"])
+    with pytest.raises(Full):
+        ring.put(volume)
+    ring.release(saver_slot)
+    with pytest.raises(Full):
+        ring.put(volume)  # still used by the viewer
+    ring.release(viewer_slot)
+    ring.put(volume, ["viewer"])
+
+    # a new volume shape frees all the slots:
+    ring.put(np.zeros((1, 4, 5), np.uint16), ["saver"])
+    _, new_volume = ring.get("saver")
+    assert new_volume.shape == (1, 4, 5)
+    with pytest.raises(Empty):
+        ring.get("saver", timeout=0.01)
+    with pytest.raises(Empty):
+        ring.get("viewer", timeout=0.01)
+
+
+def test_volume_ring_clear():
+    ring = VolumeRing(max_mbytes=0.01, consumers=("saver",), max_slots=2)
+    volume = np.ones((1, 8, 8), np.uint16)
+    ring.put(volume)
+    ring.put(volume)
+    assert ring.qsize("saver") == 2
+    ring.clear("saver")
+    ring.put(volume)
+    ring.put(volume)
+
+
+def test_volume_ring_stale_slots():
+    ring = VolumeRing(max_mbytes=0.01)
+    ring.put(np.ones((2, 4, 5), np.uint16), ["saver", "viewer"])
+    saver_slot, _ = ring.get("saver")
+    assert not ring.is_stale(saver_slot)
+
+    # a new shape, while the saver holds a slot and the viewer has not
+    # received its volume yet:
+    ring.put(np.ones((1, 4, 5), np.uint16), ["saver"])
+    assert ring.is_stale(saver_slot)
+    assert ring.n_stale.value == 1
+    assert ring.release(saver_slot)
+    assert ring.n_stale.value == 0
+
+    new_slot, _ = ring.get("saver")
+    assert not ring.release(new_slot)
+    with pytest.raises(Empty):
+        ring.get("viewer", timeout=0.01)